@@ -0,0 +1,38 @@
+"""Module to inspect the cache of compiled AFK templates.
+
+:codeauthor: Criteo Network team
+:maturity:   new
+:platform:   SONiC, Arista EOS, Juniper JunOS
+"""
+
+
+def cache_stats():
+    """Get the counters of the compiled templates cache.
+
+    The cache lives as long as the minion process: with multiprocessing enabled (default for
+    regular minions), each job runs in its own process, so counters only cover the current job.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt "spine1.dc1" afk_templates.cache_stats
+
+    .. code-block:: python
+
+        {'spine1.dc1': {'hits': 1794, 'misses': 6, 'size': 6}}
+    """
+    return __utils__["jinja_render.cache_stats"]()
+
+
+def clear_cache():
+    """Drop all compiled templates, they will be compiled again on next render.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt "spine1.dc1" afk_templates.clear_cache
+    """
+    __utils__["jinja_render.clear_cache"]()
+    return True
@@ -5,8 +5,58 @@
 :platform:   SONiC, Arista EOS, Juniper JunOS
 """
 
+import hashlib
+import io
 import json
-from ipaddress import ip_address, ip_interface
+from ipaddress import ip_interface
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from salt.exceptions import CommandExecutionError
+
+# default VRF is named "global" in neighbors, as napalm did
+NAPALM_DEFAULT_VRF = "global"
+JUNOS_DEFAULT_INSTANCE = "master"
+EOS_DEFAULT_VRF = "default"
+
+# sent in one eAPI request, with JSON output
+EOS_BGP_SUMMARY_COMMAND = "show ip bgp summary vrf all"
+EOS_BGP_NEIGHBORS_COMMAND = "show ip bgp neighbors vrf all"
+EOS_BGP_NEIGHBOR_COMMAND = "show ip bgp neighbors {} vrf all"
+# FRR neighbor command of SONiC, for filtered requests
+FRR_BGP_NEIGHBOR_COMMAND = "show bgp vrf all neighbors {} json"
+
+# route-maps, with their content
+EOS_ROUTE_MAP_COMMAND = "show route-map"
+FRR_ROUTE_MAP_COMMAND = "show route-map json"
+# counters of the FRR route-maps, ignored in the digests
+FRR_ROUTE_MAP_COUNTERS = ("invoked", "processedChange")
+# committed policy-statements of JunOS (no RPC for "show policy"), with "<name/>" to get the
+# names only
+JUNOS_POLICY_REQUEST = (
+    '<get-configuration database="committed"><configuration><policy-options>'
+    "<policy-statement>{}</policy-statement>"
+    "</policy-options></configuration></get-configuration>"
+)
+
+# fields of the JunOS RPC records used by this module, the others are not kept while parsing
+JUNOS_PEER_FIELDS = (
+    "peer-address",
+    "peer-as",
+    "local-as",
+    "peer-cfg-rti",
+    "peer-state",
+    "peer-group",
+    "group-index",
+    "description",
+    "import-policy",
+    "export-policy",
+)
+JUNOS_GROUP_FIELDS = ("group-index", "name")
+
+# networks up to this size in total (hosts and link subnets) are filtered by the device, with
+# one request per address, larger ones are requested in full and filtered here
+DEVICE_FILTER_MAX_ADDRESSES = 4
 
 
 def _get_os():
@@ -38,39 +88,148 @@ def get_global_as(vrf="default"):
         result = bgp_sum[0]["vrfs"].get(vrf, {}).get("asn", "unknown")
 
     if nos == "sonic":
-        bgp_sum = __salt__["cmd.run"]("vtysh -c 'show bgp json'")
-        result = json.loads(bgp_sum).get("localAS")
+        bgp_sum = __utils__["frr_session.run_json_commands"]("show bgp json")[0]
+        result = bgp_sum.get("localAS")
 
     return result
 
 
-def _junos_peer_group_mapping():
-    # get the group name using the group index get-bgp-group-information detail
-    # this method works for junos >= 14.1
-    rpc_results = __salt__["napalm.junos_rpc"](
-        "get-bgp-group-information",
-        format="xml",
+def _xml_tag(element):
+    # namespaces are not always removed from the reply
+    return element.tag.rsplit("}", 1)[-1]
+
+
+def _junos_iter_reply(request, record_tag, missing_ok=False):
+    """Stream the elements of a JunOS RPC reply with the given tag.
+
+    The raw XML reply is parsed incrementally, and each element is dropped once consumed:
+    the whole reply is never loaded as a tree or a dict (tens of thousands of peers on route
+    reflectors).
+
+    :param request: XML request of the RPC
+    :param record_tag: tag of the elements (example: bgp-peer)
+    :param missing_ok: a failed RPC is a reply without element, instead of an error (lookup of
+        a neighbor address: an unknown neighbor is an RPC error)
+    """
+    reply = __salt__["napalm.call"]("_rpc", get=request)
+    if not reply.get("result"):
+        if missing_ok:
+            return
+        raise CommandExecutionError(
+            "JunOS RPC {} failed: {}".format(request, reply.get("comment", ""))
+        )
+
+    if not reply.get("out"):
+        return
+
+    # napalm returns the serialized reply (bytes), text is also accepted
+    out = reply["out"]
+    if isinstance(out, str):
+        out = out.encode("utf-8")
+
+    for _, element in ElementTree.iterparse(io.BytesIO(out)):
+        if _xml_tag(element) != record_tag:
+            continue
+
+        yield element
+        element.clear()
+
+
+def _junos_iter_rpc(rpc, record_tag, fields, missing_ok=False, **arguments):
+    """Stream the records of a JunOS RPC, with only the given fields.
+
+    :param rpc: name of the RPC (example: get-bgp-neighbor-information)
+    :param record_tag: tag of the records (example: bgp-peer)
+    :param fields: leaf tags to get in each record, nested or not, first occurrence kept
+    :param missing_ok: a failed RPC has no record, instead of an error (see _junos_iter_reply)
+    :param arguments: arguments of the RPC (example: neighbor_address="192.0.2.0")
+    """
+    request = "<{0}>{1}</{0}>".format(
+        rpc,
+        "".join(
+            "<{0}>{1}</{0}>".format(name.replace("_", "-"), escape(str(value)))
+            for name, value in arguments.items()
+        ),
     )
-    group_info = rpc_results["out"]
 
-    if isinstance(group_info["bgp-group-information"]["bgp-group"], list):
-        groups = group_info["bgp-group-information"]["bgp-group"]
-    else:
-        # if only one group, it is not a list
-        groups = [group_info["bgp-group-information"]["bgp-group"]]
+    for element in _junos_iter_reply(request, record_tag, missing_ok):
+        record = {}
+        for leaf in element.iter():
+            field = _xml_tag(leaf)
+            if field in fields and field not in record:
+                record[field] = (leaf.text or "").strip()
+
+        yield record
+
+
+def _junos_get_peer_groups():
+    groups = _junos_iter_rpc("get-bgp-group-information", "bgp-group", JUNOS_GROUP_FIELDS)
 
-    # if multiple groups, it is a list
     return {x["group-index"]: x["name"] for x in groups}
 
 
+def _get_filter_addresses(local_networks):
+    # addresses to request to the device, None if all the neighbors must be requested
+    if not local_networks or (
+        sum(network.num_addresses for network in local_networks) > DEVICE_FILTER_MAX_ADDRESSES
+    ):
+        return None
+
+    return list(dict.fromkeys(str(address) for network in local_networks for address in network))
+
+
+def _junos_bgp_peers(addresses=None):
+    # all the BGP information of the neighbors is in this RPC, no need for bgp.neighbors
+    if addresses is None:
+        requests = [{}]
+    else:
+        requests = [{"neighbor_address": address} for address in addresses]
+
+    for kwargs in requests:
+        # only the lookups of an address can fail for an unknown neighbor
+        yield from _junos_iter_rpc(
+            "get-bgp-neighbor-information",
+            "bgp-peer",
+            JUNOS_PEER_FIELDS,
+            missing_ok=addresses is not None,
+            **kwargs,
+        )
+
+
+class _JunosPeerGroups:  # pylint: disable=R0903
+    """Peer group names of the JunOS peers, for the peers exposing the group index only.
+
+    The mapping (get-bgp-group-information, works for junos >= 14.1) is requested at most once
+    per call, when the first peer without a group name is met: it is up to date for all the
+    peers of the call, and never kept between jobs.
+    """
+
+    def __init__(self):
+        """Start without the mapping, it is only requested if needed."""
+        self.mapping = None
+
+    def get(self, peer):
+        """Get the peer group name of a peer, None if not in a group.
+
+        :param peer: record of get-bgp-neighbor-information
+        """
+        if "peer-group" in peer:
+            return peer["peer-group"]
+
+        if "group-index" not in peer:
+            return None
+
+        if self.mapping is None:
+            self.mapping = _junos_get_peer_groups()
+
+        return self.mapping.get(peer["group-index"])
+
+
 def _junos_extra_info():
     result = {}
-    group_resolution_needed = False
-
-    rpc_results = __salt__["napalm.junos_rpc"]("get-bgp-neighbor-information", format="xml")
-    peers = rpc_results["out"].get("bgp-information", {}).get("bgp-peer", {})
+    peer_groups = _JunosPeerGroups()
 
-    for peer in peers:
+    for peer in _junos_bgp_peers():
         # cleaning remote address exposed in RPC, example: 192.0.2.0+58771 => 192.0.2.0
         remote = peer["peer-address"].split("+")[0]
 
@@ -79,34 +238,29 @@ def _junos_extra_info():
         if "description" in peer:
             result[remote]["description"] = peer["description"]
 
-        if "peer-group" in peer:
-            result[remote]["peer-group"] = peer["peer-group"]
-        elif "group-index" in peer:
-            group_resolution_needed = True
-            result[remote]["group-index"] = peer["group-index"]
+        peer_group = peer_groups.get(peer)
+        if peer_group:
+            result[remote]["peer-group"] = peer_group
 
-    if group_resolution_needed:
-        map_peer_group = _junos_peer_group_mapping()
-        for peer, info in result.items():
-            if not info.get("group-index"):
-                continue
+    return result
 
-            info["peer-group"] = map_peer_group[info["group-index"]]
 
-    return result
+def _eos_peers(bgp_neighbors):
+    # flatten "show ip bgp neighbors vrf all" output: (vrf, peer) of all VRFs
+    for vrf, vrf_info in bgp_neighbors.get("vrfs", {}).items():
+        for peer in vrf_info.get("peerList", []):
+            yield vrf, peer
 
 
 def _eos_extra_info():
     result = {}
-    bgp_config = __salt__["bgp.config"]()["out"]
-
-    for peer_group_name, group_info in bgp_config.items():
-        for remote, peer_info in group_info.get("neighbors", {}).items():
-            peer_group_name = None if peer_group_name == "_" else peer_group_name
-            result[remote] = {
-                "peer-group": peer_group_name,
-                "description": peer_info.get("description"),
-            }
+    bgp_neighbors = __salt__["napalm.pyeapi_run_commands"](EOS_BGP_NEIGHBORS_COMMAND)[0]
+
+    for _, peer in _eos_peers(bgp_neighbors):
+        result[peer["peerAddress"]] = {
+            "peer-group": peer.get("peerGroupName"),
+            "description": peer.get("description"),
+        }
 
     return result
 
@@ -152,9 +306,111 @@ def get_bgp_extra_info():
     raise NotImplementedError("Unsupported network OS.")
 
 
+def _get_digest(content):
+    # digest of structured content, whatever the order of its keys
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _xml_content(element):
+    # structured content of a configuration element: tag, attributes, text and children
+    return [
+        _xml_tag(element),
+        {name: value for name, value in element.attrib.items() if "}" not in name},
+        (element.text or "").strip(),
+        [_xml_content(child) for child in element],
+    ]
+
+
+def _junos_route_policies(names_only):
+    request = JUNOS_POLICY_REQUEST.format("<name/>" if names_only else "")
+
+    for element in _junos_iter_reply(request, "policy-statement"):
+        name = next(
+            ((child.text or "").strip() for child in element if _xml_tag(child) == "name"), None
+        )
+        if name:
+            yield name, None if names_only else _get_digest(_xml_content(element))
+
+
+def _eos_route_policies(names_only):
+    # no lighter command for the names only, only the digests are not computed
+    output = __salt__["napalm.pyeapi_run_commands"](EOS_ROUTE_MAP_COMMAND)[0]
+
+    for name, route_map in output.get("routeMaps", {}).items():
+        yield name, None if names_only else _get_digest(route_map)
+
+
+def _frr_without_counters(content):
+    if isinstance(content, dict):
+        return {
+            key: _frr_without_counters(value)
+            for key, value in content.items()
+            if key not in FRR_ROUTE_MAP_COUNTERS
+        }
+    if isinstance(content, list):
+        return [_frr_without_counters(value) for value in content]
+
+    return content
+
+
+def _sonic_route_policies(names_only):
+    if names_only:
+        for name in __salt__["sonic.get_route_maps"]():
+            yield name, None
+        return
+
+    output = __utils__["frr_session.run_json_commands"](FRR_ROUTE_MAP_COMMAND)[0]
+    # route-maps of bgpd, if vtysh returned them per daemon
+    for name, route_map in output.get("bgpd", output).items():
+        yield name, _get_digest(_frr_without_counters(route_map))
+
+
+def get_route_policy_inventory(names_only=False):
+    """Get the route policies (route-maps) installed on the device, with a digest of each one.
+
+    Policies are read from structured data: committed configuration on JunOS, JSON outputs on
+    EOS and SONiC. The digest (sha256 of the content, counters excluded) only changes with the
+    content of the policy, openconfig_routing_policy compares them to skip unchanged policies.
+
+    :param names_only: get the sorted names only, without the content of the policies
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt "super.spine1.dc1" criteo_bgp.get_route_policy_inventory
+        salt "super.spine1.dc1" criteo_bgp.get_route_policy_inventory names_only=True
+
+    .. code-block:: python
+
+        {
+            "RM-LAN-IN": "5f1c2f7b1b0e4d0c7e3a...",
+            "RM-LAN-OUT": "0a9f3d0e8e5c3b7d2c61...",
+        }
+    """
+    backends = {
+        "junos": _junos_route_policies,
+        "eos": _eos_route_policies,
+        "sonic": _sonic_route_policies,
+    }
+    nos = _get_os()
+    if nos not in backends:
+        raise NotImplementedError("OS '{}' not supported".format(nos))
+
+    policies = backends[nos](names_only)
+    if names_only:
+        return sorted(name for name, _ in policies)
+
+    return dict(sorted(policies))
+
+
 def get_route_map_list():
     """Get list of route-map installed on the device.
 
+    See get_route_policy_inventory, with the names only.
+
     CLI Example:
 
     .. code-block:: bash
@@ -165,88 +421,139 @@ def get_route_map_list():
 
         [
             "PFE-LB",
+            "RM-DENY",
             "RM-LAN-IN",
             "RM-LAN-OUT",
             "RM-LAN_MAINTENANCE-OUT",
             "RM-LAN_MAINTENANCE_DEFAULT-OUT",
-            "RM-DENY",
         ]
     """
-    nos = _get_os()
-    rm_list = None
-    if nos == "junos":
-        # xml rpc of "show policy" is not available
-        output = __salt__["net.cli"]("show policy")
-        raw_res = output.get("out", {}).get("show policy", "")
-
-        separator = "\n" if "\n" in raw_res else ""
-        raw_list = raw_res.replace("Configured policies:", "").split(separator)
-
-        # filter the route-map list
-        rm_list = [rm for rm in raw_list if rm != ""]
-    elif nos == "eos":
-        output = __salt__["napalm.rpc"]("show route-map")
-        rm_list = list(output[0]["routeMaps"].keys())
-    elif nos == "sonic":
-        rm_list = __salt__["sonic.get_route_maps"]()
-    else:
-        raise NotImplementedError("OS '{}' not supported".format(nos))
+    return get_route_policy_inventory(names_only=True)
 
-    return rm_list
 
-
-def _bgp_neighbor_napalm(local_network=None):
-    """Get and parse BGP info from Napalm device."""
+def _bgp_neighbor_eos(local_networks=None, new_neighbor=dict):
+    """Get and parse BGP info from EOS device, with one batched eAPI request."""
     bgp = []
-    bgp_neighbors = __salt__["bgp.neighbors"]()["out"]
-    bgp_extra_info = get_bgp_extra_info()
-    for vrf, autonomous_system in bgp_neighbors.items():
-        for remote_as, neighbors in autonomous_system.items():
-            for session in neighbors:
-                remote_address = ip_address(session["remote_address"])
-                state = "up" if session["up"] else "down"
-
-                if not local_network or remote_address in local_network:
-                    neighbor_extra = bgp_extra_info.get(session["remote_address"], {})
-                    bgp.append(
-                        {
-                            "remote_as": remote_as,
-                            "local_as": session["local_as"],
-                            "remote_address": session["remote_address"],
-                            "vrf": vrf,
-                            "export_policy": session["export_policy"],
-                            "import_policy": session["import_policy"],
-                            "peer_group": neighbor_extra.get("peer-group"),
-                            "description": neighbor_extra.get("description"),
-                            "state": state,
-                        }
-                    )
+    addresses = _get_filter_addresses(local_networks)
+    if addresses is None:
+        neighbors_commands = [EOS_BGP_NEIGHBORS_COMMAND]
+    else:
+        neighbors_commands = [EOS_BGP_NEIGHBOR_COMMAND.format(address) for address in addresses]
+
+    bgp_summary, *outputs = __salt__["napalm.pyeapi_run_commands"](
+        EOS_BGP_SUMMARY_COMMAND, *neighbors_commands
+    )
+    vrfs_summary = bgp_summary.get("vrfs", {})
+
+    for vrf, peer in (vrf_peer for output in outputs for vrf_peer in _eos_peers(output)):
+        bgp.append(
+            new_neighbor(
+                remote_as=int(peer["asn"]),
+                local_as=int(vrfs_summary.get(vrf, {}).get("asn") or peer["localAsn"]),
+                remote_address=peer["peerAddress"],
+                vrf=NAPALM_DEFAULT_VRF if vrf == EOS_DEFAULT_VRF else vrf,
+                export_policy=peer.get("routeMapOutbound", ""),
+                import_policy=peer.get("routeMapInbound", ""),
+                peer_group=peer.get("peerGroupName"),
+                description=peer.get("description"),
+                state="up" if peer.get("state") == "Established" else "down",
+            )
+        )
+
     return bgp
 
 
-def _bgp_neighbor_sonic(local_network=None):
-    """Get and parse BGP info from SONiC device."""
+def _bgp_neighbor_junos(local_networks=None, new_neighbor=dict):
+    """Get and parse BGP info from JunOS device, with one RPC (and group mapping if needed)."""
     bgp = []
-    bgp_neighbors = __salt__["sonic.get_bgp_neighbors"]()
-    for session in bgp_neighbors.values():
-        remote_address = ip_address(session["remote_address"])
-        if not local_network or remote_address in local_network:
-            bgp.append(session)
+    peer_groups = _JunosPeerGroups()
+    for peer in _junos_bgp_peers(_get_filter_addresses(local_networks)):
+        vrf = peer.get("peer-cfg-rti", JUNOS_DEFAULT_INSTANCE)
+        if vrf.startswith("__"):
+            # internal routing instances, ignored by napalm too
+            continue
+
+        # cleaning remote address exposed in RPC, example: 192.0.2.0+58771 => 192.0.2.0
+        remote = peer["peer-address"].split("+")[0]
+        bgp.append(
+            new_neighbor(
+                remote_as=int(peer["peer-as"]),
+                local_as=int(peer["local-as"]),
+                remote_address=remote,
+                vrf=NAPALM_DEFAULT_VRF if vrf == JUNOS_DEFAULT_INSTANCE else vrf,
+                export_policy=peer.get("export-policy", ""),
+                import_policy=peer.get("import-policy", ""),
+                peer_group=peer_groups.get(peer),
+                description=peer.get("description"),
+                state="up" if peer.get("peer-state") == "Established" else "down",
+            )
+        )
 
     return bgp
 
 
-def get_neighbors(local_cidr=None, dict_per_address=False):
+def _frr_neighbor(vrf, address, peer):
+    families = peer.get("addressFamilyInfo", {})
+    afi = __utils__["bgp_neighbors.get_address_afi"](
+        __utils__["bgp_neighbors.get_address_key"](address)
+    )
+    if afi is None:
+        # unnumbered neighbor (interface): family of its sessions
+        afi = 4 if "ipv4Unicast" in families or "ipv6Unicast" not in families else 6
+    policies = families.get("ipv{}Unicast".format(afi), {})
+
+    return {
+        "remote_as": peer["remoteAs"],
+        "local_as": peer["localAs"],
+        "remote_address": address,
+        "vrf": vrf,
+        "export_policy": policies.get("routeMapForOutgoingAdvertisements", ""),
+        "import_policy": policies.get("routeMapForIncomingAdvertisements", ""),
+        "peer_group": peer.get("peerGroup"),
+        "description": peer.get("nbrDesc"),
+        "state": "up" if peer.get("bgpState") == "Established" else "down",
+    }
+
+
+def _bgp_neighbor_sonic(local_networks=None, new_neighbor=dict):
+    """Get and parse BGP info from SONiC device."""
+    addresses = _get_filter_addresses(local_networks)
+    if addresses is None:
+        sessions = __salt__["sonic.get_bgp_neighbors"]().values()
+    else:
+        # filtered by FRR, the commands are pipelined on the FRR session
+        sessions = []
+        outputs = __utils__["frr_session.run_json_commands"](
+            *[FRR_BGP_NEIGHBOR_COMMAND.format(address) for address in addresses]
+        )
+        for output in outputs:
+            for vrf, vrf_info in output.items():
+                for address, peer in vrf_info.items():
+                    # VRF info (vrfId, vrfName) and unknown neighbors (bgpNoSuchNeighbor)
+                    if isinstance(peer, dict) and "remoteAs" in peer:
+                        sessions.append(_frr_neighbor(vrf, address, peer))
+
+    # sessions as returned by sonic (default VRF named "default"), the FRR ones with their peer
+    # group and description too: compact neighbors have the common fields only
+    return [new_neighbor(**session) for session in sessions]
+
+
+def get_neighbors(local_cidr=None, dict_per_address=False, compact=False):
     """Get bgp neighbors from CIDR.
 
-    :param cidr: CIDR, can be whether a real network address, or host (example: 192.168.0.0/30)
+    :param local_cidr: CIDR, can be whether a real network address, or host (example:
+        192.168.0.0/30), or a list of CIDRs: neighbors are then grouped by CIDR containing their
+        address, matched against all the CIDRs at once (see bgp_neighbors.group_by_network)
     :param dict_per_address: return a dict with neighbor address as a key, instead of a list
+    :param compact: return neighbors with the common fields only (bgp_neighbors.NEIGHBOR_FIELDS)
+        and shared strings, to be kept as compact records (see bgp_neighbors.make_record)
 
     CLI Example:
 
     .. code-block:: bash
 
         salt "super.spine1.dc1" criteo_bgp.get_neighbors 10.0.0.129/31
+        salt "super.spine1.dc1" criteo_bgp.get_neighbors '["10.0.0.128/31", "10.0.0.130/31"]'
 
     Output example:
 
@@ -267,20 +574,82 @@ def get_neighbors(local_cidr=None, dict_per_address=False):
                 }
             ]
         }
+
+    Output example, with a list of CIDRs:
+
+    .. code-block:: python
+
+        {
+            "result": {
+                "10.0.0.128/31": [{"remote_address": "10.0.0.128", ...}],
+                "10.0.0.130/31": [],
+            }
+        }
     """
-    local_network = ip_interface(local_cidr).network if local_cidr else None
+    per_cidr = isinstance(local_cidr, (list, tuple))
+    cidrs = list(local_cidr) if per_cidr else [local_cidr] if local_cidr else []
+    local_networks = [ip_interface(cidr).network for cidr in cidrs]
     func = {
         "sonic": _bgp_neighbor_sonic,
-        "eos": _bgp_neighbor_napalm,
-        "junos": _bgp_neighbor_napalm,
+        "eos": _bgp_neighbor_eos,
+        "junos": _bgp_neighbor_junos,
     }
     nos = _get_os()
-    bgp = func[nos](local_network)
+    # small networks are already filtered by the device, larger ones are filtered here
+    new_neighbor = __utils__["bgp_neighbors.make_neighbor"] if compact else dict
+    neighbors = func[nos](local_networks, new_neighbor)
 
-    if dict_per_address:
-        result = {}
-        for neighbor in bgp:
-            result[neighbor["remote_address"]] = neighbor
-        bgp = result
+    if per_cidr:
+        groups = __utils__["bgp_neighbors.group_by_network"](neighbors, local_networks)
+        bgp = {cidr: groups[network] for cidr, network in zip(cidrs, local_networks)}
+    else:
+        bgp = __utils__["bgp_neighbors.filter_in_network"](
+            neighbors, local_networks[0] if local_networks else None
+        )
+
+    if dict_per_address and per_cidr:
+        bgp = {
+            cidr: {neighbor["remote_address"]: neighbor for neighbor in group}
+            for cidr, group in bgp.items()
+        }
+    elif dict_per_address:
+        bgp = {neighbor["remote_address"]: neighbor for neighbor in bgp}
 
     return {"result": bgp}
+
+
+def capture_snapshot(path, fmt=None):
+    """Capture the device data read by openconfig_bgp and openconfig_routing_policy in a file.
+
+    The states replay it with their snapshot option, to render configurations offline (see
+    device_snapshot utils).
+
+    :param path: path of the snapshot file, on the minion
+    :param fmt: json or msgpack, from the extension of the path if not set (.msgpack or .mp)
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt "tor1.dc1" criteo_bgp.capture_snapshot /var/cache/afk/tor1.dc1.msgpack
+
+    .. code-block:: python
+
+        {
+            "path": "/var/cache/afk/tor1.dc1.msgpack",
+            "format": "msgpack",
+            "version": 1,
+            "reads": 3,
+        }
+    """
+    # grains read by the states
+    grains = {
+        name: __salt__["grains.get"](name)
+        for name in ["nos", "os", "version", "sonic_build_version"]
+    }
+    reads = [
+        (function, kwargs, __salt__[function](**kwargs))
+        for function, kwargs in __utils__["device_snapshot.get_reads"](_get_os())
+    ]
+
+    return __utils__["device_snapshot.write"](path, grains, reads, fmt)
@@ -0,0 +1 @@
+"""Runner Module Directory."""
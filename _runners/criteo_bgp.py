@@ -0,0 +1,217 @@
+"""Runner collecting the BGP neighbors of a fleet, and joining both ends of each session.
+
+Neighbor tables are requested to the minions with criteo_bgp.get_neighbors, a bounded number
+of minions at a time, and joined as soon as each minion returns.
+
+Both ends of a session are matched on their VRF and addresses: the local address of a session
+is the other address of its point-to-point link subnet, /31 (RFC 3021) or /127 (RFC 6164), like
+the fabric links. Sessions between other addresses (loopbacks, multihop...) are reported with
+their remote end missing, and ends claimed by several minions (duplicate addresses) are reported
+too, instead of replacing each other.
+
+:codeauthor: Criteo Network team
+:maturity:   new
+:platform:   SONiC, Arista EOS, Juniper JunOS
+"""
+
+import logging
+from ipaddress import ip_address
+
+import salt.client
+
+log = logging.getLogger(__name__)
+
+# number of minions requested at the same time
+DEFAULT_CONCURRENCY = 50
+
+# names of the default VRF: "global" on EOS and JunOS, "default" on SONiC
+DEFAULT_VRF_NAMES = ("global", "default")
+
+# fields of the neighbors reported for each end of the sessions
+END_FIELDS = (
+    "vrf",
+    "local_as",
+    "remote_as",
+    "state",
+    "peer_group",
+    "import_policy",
+    "export_policy",
+    "description",
+)
+
+
+def _get_link_peer_address(address):
+    # the other address of the /31 or /127 link subnet
+    return str(address.__class__(int(address) ^ 1))
+
+
+def _get_session_vrf(vrf):
+    # the default VRF is the same on all the NOS, whatever its name
+    return DEFAULT_VRF_NAMES[0] if vrf in DEFAULT_VRF_NAMES else vrf
+
+
+class SessionJoin:
+    """Ends of the BGP sessions of a fleet, joined as the neighbor tables are received."""
+
+    def __init__(self):
+        """Start without any session."""
+        # ends of the sessions, per VRF and pair of addresses, then per local address
+        self.sessions = {}
+        # ends of the sessions already claimed by another minion, per VRF and pair of addresses
+        self.duplicates = {}
+        self.unreachable = {}
+
+    def add_neighbors(self, minion, neighbors):
+        """Add the neighbors of a minion to the sessions.
+
+        :param minion: ID of the minion
+        :param neighbors: neighbors returned by criteo_bgp.get_neighbors
+        """
+        for neighbor in neighbors:
+            end = {"minion": minion, "remote_address": neighbor["remote_address"]}
+            end.update({field: neighbor.get(field) for field in END_FIELDS})
+            vrf = _get_session_vrf(end["vrf"])
+
+            try:
+                remote_address = ip_address(neighbor["remote_address"])
+            except ValueError:
+                # unnumbered neighbors cannot be joined
+                end["local_address"] = None
+                self.sessions[(vrf, minion, neighbor["remote_address"])] = {None: end}
+                continue
+
+            end["local_address"] = _get_link_peer_address(remote_address)
+            key = (vrf, *sorted((end["local_address"], str(remote_address))))
+            ends = self.sessions.setdefault(key, {})
+            claimed = ends.get(end["local_address"])
+            if claimed and claimed["minion"] != minion:
+                # same address on two minions: the first end is kept, the other is reported
+                self.duplicates.setdefault(key, []).append(end)
+            else:
+                ends[end["local_address"]] = end
+
+    def add_error(self, minion, error):
+        """Report a minion whose neighbors could not be collected.
+
+        :param minion: ID of the minion
+        :param error: return of the minion
+        """
+        self.unreachable[minion] = error
+
+    def get_view(self, only_issues=False):
+        """Get the joined view of the sessions: local and remote ends, and their mismatches.
+
+        :param only_issues: keep only the sessions with a missing end or a mismatch
+        """
+        sessions = []
+        for key, ends in sorted(self.sessions.items(), key=lambda item: str(item[0])):
+            session = _describe_session(key, ends, self.duplicates.get(key, []))
+            if not only_issues or any(session["issues"].values()):
+                sessions.append(session)
+
+        return {
+            "sessions": sessions,
+            "unreachable": self.unreachable,
+            "summary": {
+                "sessions": len(self.sessions),
+                "issues": sum(any(session["issues"].values()) for session in sessions),
+                "unreachable": len(self.unreachable),
+            },
+        }
+
+
+def _describe_session(key, ends, duplicates):
+    local_end, remote_end = (list(ends.values()) + [None])[:2]
+    issues = {"missing_end": remote_end is None, "duplicate_end": bool(duplicates)}
+
+    if remote_end:
+        issues["state_mismatch"] = local_end["state"] != remote_end["state"]
+        issues["as_mismatch"] = str(local_end["remote_as"]) != str(remote_end["local_as"]) or (
+            str(remote_end["remote_as"]) != str(local_end["local_as"])
+        )
+        # policies applied on one end only
+        issues["policy_mismatch"] = any(
+            bool(local_end[policy]) != bool(remote_end[policy])
+            for policy in ["import_policy", "export_policy"]
+        )
+
+    return {
+        "vrf": key[0],
+        "addresses": list(key[1:]),
+        "local": local_end,
+        "remote": remote_end,
+        "duplicates": duplicates,
+        "issues": issues,
+    }
+
+
+def _collect_neighbors(client, tgt, tgt_type, concurrency, timeout):
+    """Yield the neighbors of each minion, as soon as it returns."""
+    kwargs = {"timeout": timeout} if timeout else {}
+    returns = client.cmd_batch(
+        tgt,
+        "criteo_bgp.get_neighbors",
+        kwarg={"compact": True},
+        tgt_type=tgt_type,
+        batch=str(concurrency),
+        **kwargs,
+    )
+
+    for minion_return in returns:
+        for minion, result in minion_return.items():
+            yield minion, result
+
+
+def audit_sessions(
+    tgt, tgt_type="glob", concurrency=DEFAULT_CONCURRENCY, timeout=None, only_issues=False
+):
+    """Collect the BGP neighbors of the targeted minions, and check both ends of each session.
+
+    :param tgt: target of the minions (example: "*.dc1")
+    :param tgt_type: type of target (glob, list, compound...)
+    :param concurrency: maximum number of minions requested at the same time
+    :param timeout: timeout of each minion, salt default if not set
+    :param only_issues: keep only the sessions with a missing end or a mismatch
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt-run criteo_bgp.audit_sessions "*.dc1" concurrency=100 only_issues=True
+
+    Output example:
+
+    .. code-block:: python
+
+        {
+            "sessions": [
+                {
+                    "vrf": "global",
+                    "addresses": ["192.0.2.0", "192.0.2.1"],
+                    "local": {"minion": "spine1.dc1", "local_address": "192.0.2.0", ...},
+                    "remote": {"minion": "tor1.dc1", "local_address": "192.0.2.1", ...},
+                    "duplicates": [],
+                    "issues": {
+                        "missing_end": False,
+                        "duplicate_end": False,
+                        "state_mismatch": False,
+                        "as_mismatch": False,
+                        "policy_mismatch": True,
+                    },
+                },
+            ],
+            "unreachable": {"tor2.dc1": "Minion did not return. [No response]"},
+            "summary": {"sessions": 1, "issues": 1, "unreachable": 1},
+        }
+    """
+    client = salt.client.get_local_client(__opts__["conf_file"])
+    join = SessionJoin()
+
+    for minion, result in _collect_neighbors(client, tgt, tgt_type, concurrency, timeout):
+        if isinstance(result, dict) and isinstance(result.get("result"), list):
+            log.debug("%s: %d neighbors collected", minion, len(result["result"]))
+            join.add_neighbors(minion, result["result"])
+        else:
+            join.add_error(minion, result)
+
+    return join.get_view(only_issues)
@@ -14,9 +14,11 @@ def clear_soft_all(name):
 
     if nos == "sonic":
         time.sleep(5)  # we wait for bgp route-map delay-timer (which is set to 5 seconds)
-        res = __salt__["cmd.run"]("vtysh -c 'clear bgp * soft'")
-        ret["changes"]["executed"] = "vtysh -c 'clear bgp * soft"
-        ret["result"] = __context__["retcode"] == 0
+        # on the FRR session kept open for the minion process, instead of a new vtysh
+        res = __utils__["frr_session.run_commands"]("clear bgp * soft")[0].strip()
+        ret["changes"]["executed"] = "clear bgp * soft"
+        # FRR errors are prefixed by "%" (example: % Unknown command)
+        ret["result"] = not any(line.startswith("%") for line in res.splitlines())
     elif nos == "junos":
         res = __salt__["net.cli"]("clear bgp neighbor soft all")
         ret["changes"]["executed"] = "clear bgp neighbor soft all"
@@ -28,6 +30,8 @@ def clear_soft_all(name):
     else:
         raise NotImplementedError("Network OS not supported")
 
+    # policies were applied again to the sessions: device data must be requested again
+    __utils__["device_cache.invalidate"](__context__)
     ret["comment"] = res
 
     return ret
@@ -27,49 +27,39 @@ def _get_os():
 
 def _apply_template(template_name, context, saltenv):
     """Define a helper to generate config from template file."""
-    template_content = __salt__["cp.get_file_str"](template_name, saltenv=saltenv)
-    context["deep_get"] = __utils__["jinja_filters.deep_get"]
+    # templates are prefetched per directory, fallback on the fileserver if not loaded
+    template_content = __utils__["jinja_render.get_source"](template_name, saltenv)
+    if template_content is None:
+        template_content = __salt__["cp.get_file_str"](template_name, saltenv=saltenv)
 
     if not template_content:
         raise CommandExecutionError("Unable to get {}".format(template_name))
 
-    result = __salt__["file.apply_template_on_contents"](
-        contents=template_content,
-        template="jinja",
-        context=context,
-        defaults=None,
-        saltenv=saltenv,
-    )
-
-    return "\n".join([line for line in result.splitlines() if line.strip() != ""])
+    # compiled templates are cached, only the rendering is done for each call
+    return __utils__["jinja_render.render"](template_name, template_content, context, saltenv)
 
 
 def _generate_snmp_config(ietf, _, saltenv):
     # TODO: handle when no data
+    profile_phase = __utils__["jinja_render.profile_phase"]
     os = _get_os()
-    config = _apply_template(
-        "salt://states/afk/templates/snmp/{}/snmp.j2".format(os),
-        ietf,
-        saltenv,
-    )
+    with profile_phase("templates_fetch"):
+        __utils__["jinja_render.prefetch_directory"](
+            "salt://states/afk/templates/snmp/{}".format(os), saltenv, __salt__, __utils__
+        )
+    with profile_phase("assembly"):
+        config = _apply_template(
+            "salt://states/afk/templates/snmp/{}/snmp.j2".format(os),
+            ietf,
+            saltenv,
+        )
 
     return config
 
 
-def apply(name, ietf_config=None, saltenv="base"):
-    """Apply and maintain Routing Policies configuration from openconfig format (JSON is expected).
-
-    .. warning::
-        Be careful with dry run, in some conditions napalm apply the config instead of
-        discarding it.
-        Did not find the root cause yet.
-
-    :param name: name of the task
-    :param openconfig_routing_policy: Routing Policy configuration in JSON in openconfig
-        (routing-policy)
-    :param openconfig_bgp: BGP configuration in JSON in openconfig (bgp)
-    :param saltenv: salt environment
-    """
+def _apply_config(name, ietf_config, saltenv):
+    """Generate the SNMP configuration and load it on the device (see apply)."""
+    profile_phase = __utils__["jinja_render.profile_phase"]
     ret = {"name": name, "result": False, "changes": {}, "comment": []}
 
     # generate command to apply on the device using the templates
@@ -90,21 +80,26 @@ def apply(name, ietf_config=None, saltenv="base"):
             ret["result"] = None
             return ret
 
-        res = __salt__["net.load_config"](
-            text=config,
-            test=__opts__["test"],
-            debug=True,
-        )
+        with profile_phase("push"):
+            res = __salt__["net.load_config"](
+                text=config,
+                test=__opts__["test"],
+                debug=True,
+            )
         ret["comment"].append("- loaded:\n{}".format(config))
 
     elif nos == "sonic":
-        res = __salt__["sonic.snmp_config"](
-            template_name="salt://states/afk/templates/snmp/{}/snmp.j2".format(nos),
-            saltenv=saltenv,
-            context=ietf_config,
-            test=__opts__["test"],
-        )
+        # rendered and pushed by the SONiC module
+        with profile_phase("push"):
+            res = __salt__["sonic.snmp_config"](
+                template_name="salt://states/afk/templates/snmp/{}/snmp.j2".format(nos),
+                saltenv=saltenv,
+                context=ietf_config,
+                test=__opts__["test"],
+            )
         res["diff"] = res["changes"]
+    if not __opts__["test"]:
+        __utils__["device_cache.invalidate"](__context__)
 
     ret["comment"].append(res["comment"])
     if res["diff"]:
@@ -112,3 +107,29 @@ def apply(name, ietf_config=None, saltenv="base"):
     ret["result"] = res["result"]
 
     return ret
+
+
+def apply(name, ietf_config=None, saltenv="base", profile=False):
+    """Apply and maintain Routing Policies configuration from openconfig format (JSON is expected).
+
+    .. warning::
+        Be careful with dry run, in some conditions napalm apply the config instead of
+        discarding it.
+        Did not find the root cause yet.
+
+    :param name: name of the task
+    :param openconfig_routing_policy: Routing Policy configuration in JSON in openconfig
+        (routing-policy)
+    :param openconfig_bgp: BGP configuration in JSON in openconfig (bgp)
+    :param saltenv: salt environment
+    :param profile: record the renders by template and the duration of each phase, returned
+        in the "profile" key (also enabled for all runs by the afk_profile minion option)
+    """
+    if profile or __opts__.get("afk_profile", False):
+        ret, recorded = __utils__["jinja_render.run_profiled"](
+            _apply_config, name, ietf_config, saltenv
+        )
+        ret["profile"] = recorded
+        return ret
+
+    return _apply_config(name, ietf_config, saltenv)
@@ -5,11 +5,10 @@
 :platform:   SONiC, Arista EOS, Juniper JunOS
 """
 
+import json
 import logging
-import re
-from collections import defaultdict
 from enum import Enum
-from ipaddress import ip_address
+from functools import partial
 
 from salt.exceptions import CommandExecutionError
 
@@ -39,6 +38,10 @@ SAFI_MAPPING_OPENCONFIG = {
 }
 
 
+# rendered instead of the neighbor address, for neighbors of the same shape to share the render
+_ADDRESS_PLACEHOLDER = "\0neighbor-address\0"
+
+
 class SafiAssetType(Enum):
     """Enum to define the type of asset."""
 
@@ -47,7 +50,8 @@ class SafiAssetType(Enum):
 
 
 def __virtual__():
-    return _get_os() in ["eos", "sonic", "junos"]
+    # grains of the snapshot set in pillar, if any (see device_snapshot)
+    return __utils__["device_snapshot.get_loaded_os"](__salt__) in ["eos", "sonic", "junos"]
 
 
 ##
@@ -56,26 +60,104 @@ def __virtual__():
 
 
 def _get_os():
-    return __salt__["grains.get"]("nos", __salt__["grains.get"]("os"))
+    return __utils__["device_snapshot.get_os"](__context__, __salt__)
 
 
-def _apply_template(template_name, context, saltenv):
-    """Define a helper to generate config from template file."""
-    template_content = __salt__["cp.get_file_str"](template_name, saltenv=saltenv)
-    context["deep_get"] = __utils__["jinja_filters.deep_get"]
+def _get_grain(name, default=None):
+    """Get a grain of the device, from the replayed snapshot if any (see device_snapshot)."""
+    return __utils__["device_snapshot.get_grain"](__context__, __salt__, name, default)
+
+
+def _get_eos_version():
+    return __utils__["afk_platform.parse_version"](_get_grain("version"))
+
+
+def _get_platform_profile():
+    """Resolve the platform facts once, they are then passed to all generators."""
+    nos = _get_os()
+
+    return __utils__["afk_platform.build_profile"](
+        nos,
+        version=_get_eos_version() if nos == "eos" else (),
+        sonic_build_version=(_get_grain("sonic_build_version", "") if nos == "sonic" else ""),
+        default_vrf=__salt__["pillar.get"]("vrf", {}).get("default", ""),
+    )
+
+
+def _get_template_content(template_name, saltenv):
+    # templates are prefetched per directory, fallback on the fileserver if not loaded
+    template_content = __utils__["jinja_render.get_source"](template_name, saltenv)
+    if template_content is None:
+        template_content = __salt__["cp.get_file_str"](template_name, saltenv=saltenv)
 
     if not template_content:
         raise CommandExecutionError("Unable to get {}".format(template_name))
 
-    result = __salt__["file.apply_template_on_contents"](
-        contents=template_content,
-        template="jinja",
-        context=context,
-        defaults=None,
-        saltenv=saltenv,
+    return template_content
+
+
+def _apply_template(template_name, context, saltenv):
+    """Define a helper to generate config from template file."""
+    template_content = _get_template_content(template_name, saltenv)
+
+    # compiled templates are cached, only the rendering is done for each call
+    return __utils__["jinja_render.render"](template_name, template_content, context, saltenv)
+
+
+def _iter_template(template_name, context, saltenv, indent=0):
+    """Generate config from template file, as an iterator of lines to write in the BGP layout."""
+    template_content = _get_template_content(template_name, saltenv)
+
+    return __utils__["jinja_render.render_lines"](
+        template_name, template_content, context, saltenv, indent
     )
 
-    return "\n".join([line for line in result.splitlines() if line.strip() != ""])
+
+##
+# Device snapshot
+##
+
+
+class BgpDeviceSnapshot:  # pylint: disable=R0903
+    """BGP state of the device, collected once per state run and shared by all generators.
+
+    Getting neighbors is expensive (on EOS and JunOS, it is a full "bgp.neighbors" call plus the
+    extra info RPCs), so the device is requested once instead of once per generated neighbor.
+    """
+
+    def __init__(self, local_as, neighbors):
+        """Index the neighbors by address, and list the peer-groups and route-maps in use.
+
+        :param local_as: AS of the default VRF, as returned by criteo_bgp.get_global_as
+        :param neighbors: installed neighbors, as returned by criteo_bgp.get_neighbors
+        """
+        self.local_as = local_as
+        self.neighbors = neighbors
+        # looked up with any text form of the address (see bgp_neighbors.NeighborIndex)
+        self.neighbors_by_address = __utils__["bgp_neighbors.build_index"](neighbors)
+        self.peer_groups = set()
+        self.route_maps = set()
+
+        for neighbor in neighbors:
+            if neighbor.get("peer_group"):
+                self.peer_groups.add(neighbor["peer_group"])
+            for policy in ["import_policy", "export_policy"]:
+                if neighbor.get(policy):
+                    self.route_maps.add(neighbor[policy])
+
+    @classmethod
+    def collect(cls):
+        """Collect the BGP state from the device."""
+        get_device_data = __utils__["device_cache.get_device_data"]
+        make_record = __utils__["bgp_neighbors.make_record"]
+        dunders = (__context__, __opts__, __salt__, __utils__)
+        local_as = get_device_data(*dunders, "criteo_bgp.get_global_as", vrf="default")
+        neighbors = get_device_data(*dunders, "criteo_bgp.get_neighbors", compact=True)
+
+        # compact records: the snapshot is kept for the whole run, on large devices too
+        return cls(
+            local_as, [make_record(**neighbor) for neighbor in neighbors.get("result") or []]
+        )
 
 
 ##
@@ -100,25 +182,19 @@ def _global_safi_to_dict(openconfig_global):
     return global_safi_configs
 
 
-def _generate_global_conf_part(config, saltenv):
-    """Generate global configuration part."""
-    if not config:
-        return ""
-
+def _get_global_conf_part(config, profile):
+    """Get template and context of the global configuration part."""
     global_safi_configs = _global_safi_to_dict(config)
 
-    nos = _get_os()
-    default_vrf = __salt__["pillar.get"]("vrf", {}).get("default", "")
-
     context = {
         "config": config,
         "global_safi_configs": global_safi_configs,
-        "vrf": default_vrf,  # TODO: add VRF support
+        "vrf": profile.default_vrf,  # TODO: add VRF support
     }
 
-    template = "salt://states/afk/templates/bgp/{}/global_configuration.j2".format(nos)
+    template = "salt://states/afk/templates/bgp/{}/global_configuration.j2".format(profile.nos)
 
-    return _apply_template(template, context, saltenv)
+    return template, context
 
 
 def _get_administrative_distance(global_conf):
@@ -141,9 +217,12 @@ def _get_administrative_distance(global_conf):
     return bgp_distance
 
 
-def _get_global_as(openconfig, nos):
+def _get_global_as(openconfig, nos, snapshot=None):
     """Get global AS from current or expected config."""
-    current_global_as = __salt__["criteo_bgp.get_global_as"](vrf="default")
+    if snapshot:
+        current_global_as = snapshot.local_as
+    else:
+        current_global_as = __salt__["criteo_bgp.get_global_as"](vrf="default")
     expected_global_as = openconfig.get("global", {}).get("config", {}).get("as", "")
 
     if nos != "junos" and not current_global_as and not expected_global_as:
@@ -162,60 +241,21 @@ def _get_global_as(openconfig, nos):
 ##
 
 
-# TODO: factorize => move as util
-def _get_eos_version():
-    version = __salt__["grains.get"]("version")
-    match = re.match(r"([0-9])+\.([0-9]+).*", version)
-
-    if len(match.groups()) < 2:
-        raise NotImplementedError("OS version not supported")
-
-    return int(match[1]), int(match[2])
-
-
-def _generate_peer_group_part(peer_group, prefix_limit_config, bgp_distance, saltenv):
-    """Generate peer-group configuration part."""
-    nos = _get_os()
-    default_vrf = __salt__["pillar.get"]("vrf", {}).get("default", "")
+def _get_peer_group_part(peer_group, prefix_limit_config, bgp_distance, profile):
+    """Get template and context of the peer-group configuration part."""
     context = {
         "peer_group": peer_group,
-        "vrf": default_vrf,  # TODO: add VRF support
+        "vrf": profile.default_vrf,  # TODO: add VRF support
         "prefix_limit_config": prefix_limit_config,
         "bgp_distance": bgp_distance,
     }
-    nos = _get_os()
 
     # config changes for EOS depending on its version
-    suffix = ""
-    nos = _get_os()
-    if nos == "eos":
-        major, minor = _get_eos_version()
-        if major == 4 and minor < 22:
-            suffix = "_before_4_22"
-
-    template = "salt://states/afk/templates/bgp/{}/peer_group{}.j2".format(nos, suffix)
-
-    return _apply_template(template, context, saltenv)
-
+    suffix = "_before_4_22" if profile.eos_before_4_22 else ""
 
-def _generate_peer_group(peer_group, bgp_distance, saltenv):
-    # extract parameters from openconfig peer group tree
-    safis, prefix_limit_config = _get_safi_params(peer_group)
+    template = "salt://states/afk/templates/bgp/{}/peer_group{}.j2".format(profile.nos, suffix)
 
-    # generate safi config for the peer group
-    safis_config = {}
-    safis_config["IPV4_UNICAST"] = _generate_safi_part(
-        "IPV4_UNICAST", safis.get("IPV4_UNICAST", {}), peer_group, SafiAssetType.PEER_GROUP, saltenv
-    )
-    safis_config["IPV6_UNICAST"] = _generate_safi_part(
-        "IPV6_UNICAST", safis.get("IPV6_UNICAST", {}), peer_group, SafiAssetType.PEER_GROUP, saltenv
-    )
-
-    peer_group_config = _generate_peer_group_part(
-        peer_group, prefix_limit_config, bgp_distance, saltenv
-    )
-
-    return peer_group_config, safis_config
+    return template, context
 
 
 ##
@@ -223,36 +263,25 @@ def _generate_peer_group(peer_group, bgp_distance, saltenv):
 ##
 
 
-def _generate_neighbor_part(
-    neighbor, global_as, prefix_limit_config, bgp_distance, peer_groups, saltenv
+def _get_neighbor_part(
+    neighbor, global_as, prefix_limit_config, bgp_distance, peer_groups, snapshot, profile
 ):
-    """Generate neighbor configuration part."""
-    default_vrf = __salt__["pillar.get"]("vrf", {}).get("default", "")
-    current_bgp_config = __salt__["criteo_bgp.get_neighbors"](dict_per_address=True).get(
-        "result", {}
-    )
-
-    nos = _get_os()
-    timer_delayopen_supported = True
-    if nos == "sonic" and "201911" in __salt__["grains.get"]("sonic_build_version"):
-        # delayopen timer is disabled for 201911 as not supported by FRR version
-        timer_delayopen_supported = False
-
+    """Get template and context of the neighbor configuration part."""
     context = {
-        "timer_delayopen_supported": timer_delayopen_supported,
+        # delayopen timer is disabled for 201911 as not supported by FRR version
+        "timer_delayopen_supported": profile.timer_delayopen_supported,
         "neighbor": neighbor,
         "global_as": global_as,
-        "vrf": default_vrf,  # TODO: add VRF support
+        "vrf": profile.default_vrf,  # TODO: add VRF support
         "prefix_limit_config": prefix_limit_config,
         "bgp_distance": bgp_distance,
-        "current_config": current_bgp_config,
+        "current_config": snapshot.neighbors_by_address,
         "peer_groups": peer_groups,
     }
 
-    nos = _get_os()
-    template = "salt://states/afk/templates/bgp/{}/neighbor.j2".format(nos)
+    template = "salt://states/afk/templates/bgp/{}/neighbor.j2".format(profile.nos)
 
-    return _apply_template(template, context, saltenv)
+    return template, context
 
 
 def _get_global_route_maps(asset):
@@ -276,18 +305,15 @@ def _get_global_route_maps(asset):
     return global_route_map
 
 
-def _generate_safi_part(safi_name, params, asset, asset_type, saltenv):
-    """Generate SAFI configuration part."""
-    nos = _get_os()
-    default_vrf = __salt__["pillar.get"]("vrf", {}).get("default", "")
+def _get_safi_part(safi_name, params, asset, asset_type, profile):
+    """Get template and context of the SAFI configuration part."""
     # TODO: rework context by sending both neighbor and safi information directly
     context = {
         "asset_type": asset_type.value,
-        "vrf": default_vrf,  # TODO: add VRF support
+        "vrf": profile.default_vrf,  # TODO: add VRF support
         "safi": params,
-        "safi_name": SAFIS_ALIAS[nos][safi_name],
+        "safi_name": SAFIS_ALIAS[profile.nos][safi_name],
         "safi_key": SAFI_MAPPING_OPENCONFIG[safi_name],
-        "convert_route_map_name": __utils__["jinja_filters.format_route_policy_name"],
     }
 
     # add parameters when setting neighbor/peer-group
@@ -302,9 +328,9 @@ def _generate_safi_part(safi_name, params, asset, asset_type, saltenv):
     # getting global route-maps (see docstring of _get_global_route_maps)
     context["global_route_map"] = _get_global_route_maps(asset)
 
-    template = "salt://states/afk/templates/bgp/{}/safi.j2".format(nos)
+    template = "salt://states/afk/templates/bgp/{}/safi.j2".format(profile.nos)
 
-    return _apply_template(template, context, saltenv)
+    return template, context
 
 
 def _get_safi_params(asset):
@@ -333,230 +359,319 @@ def _get_safi_params(asset):
     return safis, prefix_limit_config
 
 
-def _generate_neighbor_config(neighbor, global_as, bgp_distance, peer_groups, saltenv):
-    """Generate the entire configuration for a neighbor."""
-    # extract parameters from openconfig neighbor tree
-    safis, prefix_limit_config = _get_safi_params(neighbor)
-
-    # generate neighbor config
-    neighbor_config = _generate_neighbor_part(
-        neighbor, global_as, prefix_limit_config, bgp_distance, peer_groups, saltenv
-    )
-
-    # generate safi config for the neighbor
-    safis_config = {}
-    safis_config["IPV4_UNICAST"] = _generate_safi_part(
-        "IPV4_UNICAST", safis.get("IPV4_UNICAST", {}), neighbor, SafiAssetType.NEIGHBOR, saltenv
-    )
-    safis_config["IPV6_UNICAST"] = _generate_safi_part(
-        "IPV6_UNICAST", safis.get("IPV6_UNICAST", {}), neighbor, SafiAssetType.NEIGHBOR, saltenv
-    )
-
-    return (neighbor_config, safis_config)
-
-
 ##
 # Remove unwanted sessions
 ##
 
 
-def _is_rule_respected(rule, neighbor, all_neighbors, neighbors_to_remove):
-    # if the neighbor is not concerned by the rule, we ignore the rule
-    if rule["contains"] not in neighbor[rule["field"]]:
-        return True
+def _plan_removals(neighbors, rules, snapshot=None):
+    """Plan the removal of the unwanted installed neighbors, as many as the rules allow.
 
-    # we authorize removing down neighbor only
-    if rule.get("remove_down_only") and neighbor["state"] == "up":
-        return False
+    The plan does not depend on the order of the neighbors on the device (see
+    bgp_safeguards.plan_removals).
 
-    afi = ip_address(neighbor["remote_address"]).version
+    :param neighbors: wanted neighbors, from openconfig
+    :param rules: removal safeguards rules (see bgp_safeguards)
+    :param snapshot: BGP state of the device (BgpDeviceSnapshot), collected if not given
+    """
+    # get BGP sessions on the device
+    installed_neighbors = (snapshot or BgpDeviceSnapshot.collect()).neighbors
 
-    nb_matching_neighbors = 0
-    for existing_neighbor in all_neighbors:
-        # check if the existing neighbor is matching the rule
-        if rule["contains"] not in existing_neighbor[rule["field"]]:
-            continue
+    # get unwanted bgp sessions, whatever the text form of their address
+    wanted_neighbors = __utils__["bgp_neighbors.build_index"](neighbors, "neighbor-address")
 
-        # consider only neighbors in the same AFI than the neighbor to remove
-        if ip_address(existing_neighbor["remote_address"]).version != afi:
-            continue
+    return __utils__["bgp_safeguards.plan_removals"](
+        installed_neighbors, wanted_neighbors, rules, __utils__["bgp_neighbors.get_afi"]
+    )
+
+
+def _format_held_back(removal_plan):
+    """Describe the neighbors held back by the safeguards, for the state comment."""
+    return "- removals held back by safeguards:\n{}".format(
+        "\n".join(
+            "{} ({} contains {}: minimum_up {}{})".format(
+                neighbor["remote_address"],
+                rule["field"],
+                rule["contains"],
+                rule["minimum_up"],
+                ", remove_down_only" if rule.get("remove_down_only") else "",
+            )
+            for neighbor, rule in removal_plan.held_back
+        )
+    )
 
-        # consider only up BGP session
-        if existing_neighbor["state"] != "up":
-            continue
 
-        # exclude the session already planned to be removed
-        if existing_neighbor in neighbors_to_remove:
-            continue
+def _get_neighbor_removal_part(neighbors, rules, snapshot, profile, removal_plan=None):
+    """Get template and context to remove BGP neighbors on the device but not in openconfig."""
+    if removal_plan is None:
+        removal_plan = _plan_removals(neighbors, rules, snapshot)
+    context = {"unwanted_neighbors": removal_plan.to_remove}
+    template = "salt://states/afk/templates/bgp/{}/neighbor_removal.j2".format(profile.nos)
 
-        # exclude the neighbor to remove to check if there will be enough resilience afterwards
-        if existing_neighbor == neighbor:
-            continue
+    return template, context
 
-        nb_matching_neighbors += 1
 
-    return nb_matching_neighbors >= rule["minimum_up"]
+##
+# Main code
+##
 
 
-def _is_safe_to_remove(rules, neighbor, all_neighbors, neighbors_to_remove):
-    """Check if neighbor can be removed safely according user defined rules.
+def _iter_neighbor_parts(
+    neighbors, global_as, bgp_distance, peer_groups, saltenv, snapshot, profile
+):
+    """Yield the configuration part of each neighbor, rendered when written."""
+    for neighbor in neighbors:
+        _, prefix_limit_config = _get_safi_params(neighbor)
+        template, context = _get_neighbor_part(
+            neighbor, global_as, prefix_limit_config, bgp_distance, peer_groups, snapshot, profile
+        )
+        yield partial(_iter_template, template, context, saltenv)
 
-    The rules are set in a pillar.
 
-    The element checked can be: description or peer_group
+def _iter_rendered_lines(lines, indent=0):
+    """Write lines already rendered, with the indentation requested by the BGP layout."""
+    prefix = " " * indent
+    for line in lines:
+        yield prefix + line
 
-    It can check a minimum of up neighbor to respect, taking into account neighbors already marked
-    as to remove.
 
-    We can forbid removing up neighbors. It could help force removing BGP on uplink before removing
-    the matching session on the neighbor downlink.
+def _render_when_profiling(parts, workers):
+    """Render the parts now when profiling without workers, for their phase to hold the renders.
 
-    .. note::
-        bgp_removal_safeguards:
-            by_peer_group:
-              - field: "peer_group"
-                contains: "PG-TOR"
-                minimum_up: 2
-                remove_down_only: true
-            by_description:
-              - field: "description"
-                contains: "server"
-                minimum_up: 2
-                remove_down_only: false
-
-    :param neighbor: neighbor detail from criteo_bgp.get_neighbors
+    Parts are rendered while the BGP template writes them otherwise (assembly phase).
     """
-    if not rules:
-        return True
+    if workers > 1 or not __utils__["jinja_render.is_profiling"]():
+        return parts
 
-    for rule in rules:
-        if not _is_rule_respected(rule, neighbor, all_neighbors, neighbors_to_remove):
-            return False
+    return [partial(_iter_rendered_lines, list(part())) for part in parts]
 
-    return True
 
+def _render_part_groups(groups, workers):
+    """Render groups of parts in a pool of worker processes, the order of the parts being kept.
 
-def _get_unwanted_neighbors(neighbors, rules):
-    """Get unwanted installed neighbors."""
-    # get BGP sessions on the device
-    installed_neighbors = __salt__["criteo_bgp.get_neighbors"]().get("result")
+    Parts are rendered without indentation, it is added when the BGP layout writes them.
+    """
+    parts = [part() for group in groups for part in group]
+    rendered = iter(__utils__["jinja_render.render_parallel"](parts, workers))
 
-    # get unwanted bgp sessions
-    wanted_neighbors = [neighbor["neighbor-address"] for neighbor in neighbors]
-    unwanted_neighbors = []
+    return [[partial(_iter_rendered_lines, next(rendered)) for _ in group] for group in groups]
 
-    for neighbor in installed_neighbors:
-        if neighbor["remote_address"] not in wanted_neighbors and _is_safe_to_remove(
-            rules, neighbor, installed_neighbors, unwanted_neighbors
-        ):
-            unwanted_neighbors.append(neighbor)
 
-    return unwanted_neighbors
+def _iter_neighbor_safi_template(shapes, template_name, context, address, saltenv, indent=0):
+    """Generate the SAFI configuration of a neighbor from the lines of its shape.
 
+    Neighbors with the same SAFI parameters, peer-group and policies only differ by their
+    address: the template is rendered once per shape (fingerprint of the context, with a
+    placeholder as address), and the address is joined in the lines split around it.
 
-def _remove_neighbor_config(neighbors, rules, saltenv):
-    """Remove BGP neighbors on the device but not in openconfig."""
-    context = {"unwanted_neighbors": _get_unwanted_neighbors(neighbors, rules)}
-    nos = _get_os()
+    :param shapes: lines of the shapes already rendered, by fingerprint
+    :param context: context of the SAFI template, with the placeholder as neighbor address
+    :param address: address of the neighbor
+    """
+    fingerprint = (json.dumps(context, sort_keys=True, default=str), indent)
+    lines = shapes.get(fingerprint)
 
-    # generate the command to remove them
-    return _apply_template(
-        "salt://states/afk/templates/bgp/{}/neighbor_removal.j2".format(nos), context, saltenv
-    )
+    if lines is None:
+        lines = [
+            line.split(_ADDRESS_PLACEHOLDER)
+            for line in _iter_template(template_name, context, saltenv, indent)
+        ]
+        shapes[fingerprint] = lines
 
+    for segments in lines:
+        yield address.join(segments)
 
-##
-# Main code
-##
 
+def _iter_safi_parts(safi_name, peer_groups, neighbors, saltenv, profile):
+    """Yield the SAFI configuration part of all peer-groups then all neighbors.
 
-def _generate_bgp_config(openconfig, remove_extras, rules, saltenv):  # pylint: disable=R0914
-    """Generate the BGP configuration."""
-    # TODO: in CMDB, when done remove the "# pylint: disable=R0914"
-    nos = _get_os()
+    The SAFI template is rendered once per distinct neighbor shape, not once per neighbor.
+    """
+    shapes = {}
+
+    for asset_type, assets in (
+        (SafiAssetType.PEER_GROUP, peer_groups),
+        (SafiAssetType.NEIGHBOR, neighbors),
+    ):
+        for asset in assets:
+            safis, _ = _get_safi_params(asset)
+            template, context = _get_safi_part(
+                safi_name, safis.get(safi_name, {}), asset, asset_type, profile
+            )
+
+            if asset_type == SafiAssetType.NEIGHBOR:
+                address = context["neighbor"]["address"]
+                context["neighbor"] = dict(context["neighbor"], address=_ADDRESS_PLACEHOLDER)
+                yield partial(
+                    _iter_neighbor_safi_template, shapes, template, context, address, saltenv
+                )
+            else:
+                yield partial(_iter_template, template, context, saltenv)
+
+
+def _generate_bgp_config(
+    openconfig,
+    remove_extras,
+    rules,
+    saltenv,
+    snapshot=None,
+    profile=None,
+    workers=1,
+    removal_plan=None,
+):
+    """Generate the BGP configuration.
 
-    peer_group_configs = []
-    neighbor_configs = []
-    safi_configs = defaultdict(list)
+    The whole configuration is written in a single pass of the BGP template: all parts (global,
+    peer-groups, neighbors, SAFIs...) are given as callables returning the lines of the part,
+    with the indentation requested by the template. Parts are rendered while the template writes
+    them, and their lines are streamed up to the final text, built once.
+
+    :param snapshot: BGP state of the device (BgpDeviceSnapshot), collected if not given
+    :param profile: platform facts of the device (PlatformProfile), resolved if not given
+    :param workers: number of processes rendering the parts before the template writes them
+    :param removal_plan: removals of unwanted neighbors (RemovalPlan), planned if not given
+    """
+    profile_phase = __utils__["jinja_render.profile_phase"]
+    profile = profile or _get_platform_profile()
+    nos = profile.nos
+    with profile_phase("templates_fetch"):
+        __utils__["jinja_render.prefetch_directory"](
+            "salt://states/afk/templates/bgp/{}".format(nos), saltenv, __salt__, __utils__
+        )
+    if snapshot is None:
+        with profile_phase("device_state"):
+            snapshot = BgpDeviceSnapshot.collect()
 
-    # generate global configuration
     # TODO: in python, detect mistmatch between expected router as and current as!
-    global_as = _get_global_as(openconfig, nos)
-    global_conf = _generate_global_conf_part(openconfig.get("global"), saltenv)
+    with profile_phase("global_as"):
+        global_as = _get_global_as(openconfig, nos, snapshot)
     bgp_distance = _get_administrative_distance(openconfig.get("global", {}))
+    neighbors = openconfig["neighbors"]["neighbor"]
 
-    # generate configuration for all peer groups
-    peer_groups = {}
-    for peer_group in openconfig.get("peer-groups", {}).get("peer-group", {}):
-        peer_groups[peer_group["peer-group-name"]] = peer_group
-        peer_group_config, safi_config = _generate_peer_group(peer_group, bgp_distance, saltenv)
-        peer_group_configs.append(peer_group_config)
-
-        # we merge config per safi
-        for _safi, _config in safi_config.items():
-            safi_name = SAFIS_ALIAS[nos][_safi]
-            safi_configs[safi_name].append(_config)
-
-    # generate configuration for all neighbors and safis
-    for neighbor in openconfig["neighbors"]["neighbor"]:
-        neighbor_config, safi_config = _generate_neighbor_config(
-            neighbor, global_as, bgp_distance, peer_groups, saltenv
-        )
-        neighbor_configs.append(neighbor_config)
+    global_part = None
+    if openconfig.get("global"):
+        with profile_phase("global"):
+            template, context = _get_global_conf_part(openconfig["global"], profile)
+            (global_part,) = _render_when_profiling(
+                [partial(_iter_template, template, context, saltenv)], workers
+            )
 
-        # we merge config per safi
-        for _safi, _config in safi_config.items():
-            safi_name = SAFIS_ALIAS[nos][_safi]
-            safi_configs[safi_name].append(_config)
+    peer_group_list = openconfig.get("peer-groups", {}).get("peer-group", [])
+    peer_groups = {}
+    peer_group_parts = []
+    with profile_phase("peer_groups"):
+        for peer_group in peer_group_list:
+            peer_groups[peer_group["peer-group-name"]] = peer_group
+            _, prefix_limit_config = _get_safi_params(peer_group)
+            template, context = _get_peer_group_part(
+                peer_group, prefix_limit_config, bgp_distance, profile
+            )
+            peer_group_parts.append(partial(_iter_template, template, context, saltenv))
+        peer_group_parts = _render_when_profiling(peer_group_parts, workers)
 
     # generate configuration to remove unwanted bgp sessions
-    neighbors_to_remove = []
+    neighbors_to_remove = None
     if remove_extras:
-        neighbors_to_remove = _remove_neighbor_config(
-            openconfig["neighbors"]["neighbor"], rules, saltenv
+        with profile_phase("removals"):
+            template, context = _get_neighbor_removal_part(
+                neighbors, rules, snapshot, profile, removal_plan
+            )
+            (neighbors_to_remove,) = _render_when_profiling(
+                [partial(_iter_template, template, context, saltenv)], workers
+            )
+
+    with profile_phase("neighbors"):
+        neighbor_parts = _render_when_profiling(
+            list(
+                _iter_neighbor_parts(
+                    neighbors, global_as, bgp_distance, peer_groups, saltenv, snapshot, profile
+                )
+            ),
+            workers,
         )
 
+    # a section per SAFI, as soon as a peer-group or a neighbor is configured
+    safis = {}
+    if peer_group_parts or neighbors:
+        with profile_phase("safis"):
+            for safi_name in ["IPV4_UNICAST", "IPV6_UNICAST"]:
+                safis[SAFIS_ALIAS[nos][safi_name]] = _render_when_profiling(
+                    _iter_safi_parts(safi_name, peer_group_list, neighbors, saltenv, profile),
+                    workers,
+                )
+
+    # parts are independent of each other once the device state is known
+    if workers > 1:
+        safi_names = list(safis)
+        with profile_phase("parallel_render"):
+            global_parts, removal_parts, peer_group_parts, neighbor_parts, *safi_parts = (
+                _render_part_groups(
+                    [
+                        [global_part] if global_part else [],
+                        [neighbors_to_remove] if neighbors_to_remove else [],
+                        peer_group_parts,
+                        neighbor_parts,
+                    ]
+                    + [list(safis[safi_name]) for safi_name in safi_names],
+                    workers,
+                )
+            )
+        global_part = global_parts[0] if global_parts else None
+        neighbors_to_remove = removal_parts[0] if removal_parts else None
+        safis = dict(zip(safi_names, safi_parts))
+
     # assemble the BGP configuration
     context = {
         "global_as": global_as,
-        "global_configuration": global_conf,
-        "peer_groups": peer_group_configs,
-        "neighbors": neighbor_configs,
+        "global_configuration": global_part,
+        "peer_groups": peer_group_parts,
+        "neighbors": neighbor_parts,
         "neighbors_to_remove": neighbors_to_remove,
-        "safis": safi_configs,
+        "safis": safis,
     }
 
     template = "salt://states/afk/templates/bgp/{}/bgp.j2".format(nos)
 
-    config = _apply_template(template, context, saltenv)
+    # parts not rendered yet (not profiling) are rendered while the BGP template writes them
+    with profile_phase("assembly"):
+        config = _apply_template(template, context, saltenv)
 
     log.debug("generated config parts: %s", config)
 
     return config
 
 
-def apply(name, openconfig=None, remove_extras=False, rules=None, saltenv="base"):
-    """Apply and maintain BGP configuration from openconfig format (JSON is expected).
-
-    .. warning::
-        Be careful with dry run, in some conditions napalm apply the config instead of
-        discarding it.
-        Did not find the root cause yet.
-
-    .. note::
-        supported: EOS and SONiC
-        JunOS support is coming.
-
-    :param name: name of the task
-    :param openconfig: network BGP configuration in JSON in openconfig structure (openconfig:bgp)
-    :param remove_extras: remove unwanted installed BGP sessions
-    :param saltenv: salt environment
-    """
+def _apply_config(name, openconfig, remove_extras, rules, saltenv, workers):
+    """Generate the BGP configuration and load it on the device (see apply)."""
+    profile_phase = __utils__["jinja_render.profile_phase"]
     ret = {"name": name, "result": False, "changes": {}, "comment": []}
 
     # generate command to apply on the device using the templates
     log.debug("%s starting", name)
-    config = _generate_bgp_config(openconfig, remove_extras, rules, saltenv)
+    # the device and the platform facts are requested once for the whole run
+    with profile_phase("platform"):
+        profile = _get_platform_profile()
+    with profile_phase("device_state"):
+        snapshot = BgpDeviceSnapshot.collect()
+
+    # removals are planned once, for the configuration and to report the ones held back
+    removal_plan = None
+    if remove_extras:
+        with profile_phase("removal_plan"):
+            removal_plan = _plan_removals(openconfig["neighbors"]["neighbor"], rules, snapshot)
+        if removal_plan.held_back:
+            ret["comment"].append(_format_held_back(removal_plan))
+
+    config = _generate_bgp_config(
+        openconfig, remove_extras, rules, saltenv, snapshot, profile, workers, removal_plan
+    )
+
+    # rendered offline from a device snapshot: nothing is loaded on the device
+    replayed = __utils__["device_snapshot.get_replayed"](__context__)
+    if replayed is not None:
+        ret["result"] = None
+        ret["comment"].append("- rendered from {}:\n{}".format(replayed["path"], config))
+        return ret
 
     # only return generated commands/config during tests
     # there is an ongoing bug with napalm making dry-run really applying the config sometimes
@@ -564,21 +679,21 @@ def apply(name, openconfig=None, remove_extras=False, rules=None, saltenv="base"
         ret["result"] = None
         return ret
 
-    nos = _get_os()
-
-    if nos in ["eos", "junos"]:
-        res = __salt__["net.load_config"](
-            text=config,
-            test=__opts__["test"],
-            debug=True,
-        )
-    elif nos == "sonic":
-        res = __salt__["sonic.bgp_config"](
-            template_name="salt://templates/dummy.j2",
-            context={"raw": config},
-            test=__opts__["test"],
-        )
-        res["diff"] = res["changes"]
+    with profile_phase("push"):
+        if profile.nos in ["eos", "junos"]:
+            res = __salt__["net.load_config"](
+                text=config,
+                test=__opts__["test"],
+                debug=True,
+            )
+        elif profile.nos == "sonic":
+            res = __salt__["sonic.bgp_config"](
+                template_name="salt://templates/dummy.j2",
+                context={"raw": config},
+                test=__opts__["test"],
+            )
+            res["diff"] = res["changes"]
+    __utils__["device_cache.invalidate"](__context__)
 
     ret["comment"].append("- loaded:\n{}".format(config))
     ret["comment"].append(res["comment"])
@@ -587,3 +702,48 @@ def apply(name, openconfig=None, remove_extras=False, rules=None, saltenv="base"
     ret["result"] = res["result"]
 
     return ret
+
+
+def apply(
+    name,
+    openconfig=None,
+    remove_extras=False,
+    rules=None,
+    saltenv="base",
+    workers=1,
+    profile=False,
+    snapshot=None,
+):
+    """Apply and maintain BGP configuration from openconfig format (JSON is expected).
+
+    .. warning::
+        Be careful with dry run, in some conditions napalm apply the config instead of
+        discarding it.
+        Did not find the root cause yet.
+
+    .. note::
+        supported: EOS and SONiC
+        JunOS support is coming.
+
+    :param name: name of the task
+    :param openconfig: network BGP configuration in JSON in openconfig structure (openconfig:bgp)
+    :param remove_extras: remove unwanted installed BGP sessions
+    :param rules: removal safeguards (see bgp_safeguards), the unwanted sessions held back
+        are listed in the comment
+    :param saltenv: salt environment
+    :param workers: number of processes rendering the configuration (for very large
+        configurations, 1 to render in the minion process)
+    :param profile: record the renders by template and the duration of each phase, returned
+        in the "profile" key (also enabled for all runs by the afk_profile minion option)
+    :param snapshot: path of a device snapshot (see criteo_bgp.capture_snapshot), replayed
+        instead of requesting the device: the configuration is only rendered, in the comment
+    """
+    with __utils__["device_snapshot.replay"](__context__, snapshot):
+        if profile or __opts__.get("afk_profile", False):
+            ret, recorded = __utils__["jinja_render.run_profiled"](
+                _apply_config, name, openconfig, remove_extras, rules, saltenv, workers
+            )
+            ret["profile"] = recorded
+            return ret
+
+        return _apply_config(name, openconfig, remove_extras, rules, saltenv, workers)
@@ -5,16 +5,23 @@
 :platform:   SONiC, Arista EOS, Juniper JunOS
 """
 
+import hashlib
+import json
 import logging
-import re
+import os
 
 from salt.exceptions import CommandExecutionError
 
 log = logging.getLogger(__name__)
 
+# route policies pushed by the previous runs, in the cache directory of the minion (see
+# AppliedPolicies)
+_APPLIED_POLICIES_FILE = "afk_applied_route_policies.{}.json"
+
 
 def __virtual__():
-    return _get_os() in ["eos", "junos", "sonic"]
+    # grains of the snapshot set in pillar, if any (see device_snapshot)
+    return __utils__["device_snapshot.get_loaded_os"](__salt__) in ["eos", "junos", "sonic"]
 
 
 ##
@@ -23,7 +30,30 @@ def __virtual__():
 
 
 def _get_os():
-    return __salt__["grains.get"]("nos", __salt__["grains.get"]("os"))
+    return __utils__["device_snapshot.get_os"](__context__, __salt__)
+
+
+def _get_grain(name, default=None):
+    """Get a grain of the device, from the replayed snapshot if any (see device_snapshot)."""
+    return __utils__["device_snapshot.get_grain"](__context__, __salt__, name, default)
+
+
+def _get_eos_version():
+    return __utils__["afk_platform.parse_version"](_get_grain("version"))
+
+
+def _get_platform_profile():
+    """Resolve the platform facts used by routing policies once, for the whole state run."""
+    nos = _get_os()
+
+    return __utils__["afk_platform.build_profile"](
+        nos,
+        version=_get_eos_version() if nos == "eos" else (),
+        sonic_build_version=(_get_grain("sonic_build_version", "") if nos == "sonic" else ""),
+        frr822_workaround_flag=(
+            __salt__["pillar.get"]("frr822_workaround_flag", "False") if nos == "sonic" else "False"
+        ),
+    )
 
 
 def _safeget(dct, *keys):
@@ -36,23 +66,42 @@ def _safeget(dct, *keys):
     return dct
 
 
-def _apply_template(template_name, context, saltenv):
-    """Define a helper to generate config from template file."""
-    template_content = __salt__["cp.get_file_str"](template_name, saltenv=saltenv)
-    context["deep_get"] = __utils__["jinja_filters.deep_get"]
+def _get_template_content(template_name, saltenv):
+    # templates are prefetched per directory, fallback on the fileserver if not loaded
+    template_content = __utils__["jinja_render.get_source"](template_name, saltenv)
+    if template_content is None:
+        template_content = __salt__["cp.get_file_str"](template_name, saltenv=saltenv)
 
     if not template_content:
         raise CommandExecutionError("Unable to get {}".format(template_name))
 
-    result = __salt__["file.apply_template_on_contents"](
-        contents=template_content,
-        template="jinja",
-        context=context,
-        defaults=None,
-        saltenv=saltenv,
-    )
+    return template_content
+
 
-    return "\n".join([line for line in result.splitlines() if line.strip() != ""])
+def _apply_template(template_name, context, saltenv):
+    """Define a helper to generate config from template file."""
+    template_content = _get_template_content(template_name, saltenv)
+
+    # compiled templates are cached, only the rendering is done for each call
+    return __utils__["jinja_render.render"](template_name, template_content, context, saltenv)
+
+
+def _iter_template(template_name, context, saltenv):
+    """Generate config from template file, as an iterator of lines rendered when consumed."""
+    template_content = _get_template_content(template_name, saltenv)
+
+    return __utils__["jinja_render.render_lines"](template_name, template_content, context, saltenv)
+
+
+def _render_when_profiling(parts, workers):
+    """Render the parts now when profiling without workers, for their phase to hold the renders.
+
+    Parts are rendered while the routing policy template writes them otherwise (assembly phase).
+    """
+    if workers > 1 or not __utils__["jinja_render.is_profiling"]():
+        return parts
+
+    return [list(part) for part in parts]
 
 
 def _convert_range_cisco_like(mask_length_range, prefix, ipv6=False):
@@ -134,66 +183,56 @@ CONVERT_RANGE_MAPPING = {
 ##
 
 
-# TODO: move as util
-def _get_eos_version():
-    version = __salt__["grains.get"]("version")
-    match = re.match(r"([0-9])+\.([0-9]+).*", version)
-
-    if len(match.groups()) < 2:
-        raise NotImplementedError("OS version not supported")
-
-    return int(match[1]), int(match[2])
-
-
-def _generate_community_set_config(community, saltenv):
+def _generate_community_set_config(community, saltenv, profile=None):
     """Generate community sets configuration."""
+    profile = profile or _get_platform_profile()
     context = {
         "community": community["config"],
     }
 
     # config changes for EOS depending on its version
-    suffix = ""
-    nos = _get_os()
-    if nos == "eos":
-        major, minor = _get_eos_version()
-        if major == 4 and minor < 22:
-            suffix = "_before_4_22"
+    suffix = "_before_4_22" if profile.eos_before_4_22 else ""
 
-    return _apply_template(
-        "salt://states/afk/templates/routing_policy/{}/community_set{}.j2".format(nos, suffix),
+    return _iter_template(
+        "salt://states/afk/templates/routing_policy/{}/community_set{}.j2".format(
+            profile.nos, suffix
+        ),
         context,
         saltenv,
     )
 
 
-def _remove_community_set_config(community_name, saltenv):
+def _remove_community_set_config(community_name, saltenv, profile=None):
     """Remove community sets configuration."""
     context = {
         "community_name": community_name,
     }
 
-    nos = _get_os()
-    return _apply_template(
+    nos = (profile or _get_platform_profile()).nos
+    return _iter_template(
         "salt://states/afk/templates/routing_policy/{}/remove_community_set.j2".format(nos),
         context,
         saltenv,
     )
 
 
-def _generate_communities_config(openconfig, existing_community_lists, saltenv):
+def _generate_communities_config(openconfig, existing_community_lists, saltenv, profile=None):
     """Generate community sets configuration."""
     config = []
+    profile = profile or _get_platform_profile()
 
     for community_set in openconfig["community-set"]:
         # remove the community-set to ensure no extra config nor sequence
         if (
-            _get_os() != "sonic"
+            profile.nos != "sonic"
             or community_set["config"]["community-set-name"] in existing_community_lists
         ):
             config.append(
-                _remove_community_set_config(community_set["config"]["community-set-name"], saltenv)
+                _remove_community_set_config(
+                    community_set["config"]["community-set-name"], saltenv, profile
+                )
             )
-        config.append(_generate_community_set_config(community_set, saltenv))
+        config.append(_generate_community_set_config(community_set, saltenv, profile))
 
     return config
 
@@ -203,42 +242,43 @@ def _generate_communities_config(openconfig, existing_community_lists, saltenv):
 ##
 
 
-def _generate_prefix_set_config(prefix_set, saltenv):
+def _generate_prefix_set_config(prefix_set, saltenv, profile=None):
     """Generate prefix sets configuration."""
+    nos = (profile or _get_platform_profile()).nos
     context = {
         "prefix_set_name": prefix_set["config"]["name"],
         "prefix_set_mode": prefix_set["config"]["mode"],
         "prefixes": prefix_set["prefixes"]["prefix"],
         # TODO: do the for loop in python and not in jinja, and enrich at this moment
         # currently: the easiest and most efficient way
-        "convert_range": CONVERT_RANGE_MAPPING[_get_os()],
+        "convert_range": CONVERT_RANGE_MAPPING[nos],
     }
 
-    nos = _get_os()
-    return _apply_template(
+    return _iter_template(
         "salt://states/afk/templates/routing_policy/{}/prefix_set.j2".format(nos), context, saltenv
     )
 
 
-def _remove_prefix_set_config(prefix_set_name, prefix_set_mode, saltenv):
+def _remove_prefix_set_config(prefix_set_name, prefix_set_mode, saltenv, profile=None):
     """Remove prefix sets configuration."""
     context = {
         "prefix_set_name": prefix_set_name,
         "prefix_set_mode": prefix_set_mode,
     }
 
-    nos = _get_os()
-    return _apply_template(
+    nos = (profile or _get_platform_profile()).nos
+    return _iter_template(
         "salt://states/afk/templates/routing_policy/{}/remove_prefix_set.j2".format(nos),
         context,
         saltenv,
     )
 
 
-def _generate_prefix_sets_config(openconfig, existing_objects, saltenv):
+def _generate_prefix_sets_config(openconfig, existing_objects, saltenv, profile=None):
     """Generate prefix sets configuration."""
     config = []
     prefixes_set_mode = {}
+    profile = profile or _get_platform_profile()
 
     for prefix_set in openconfig["prefix-set"]:
         if prefix_set["config"]["mode"] == "IPV4":
@@ -247,17 +287,17 @@ def _generate_prefix_sets_config(openconfig, existing_objects, saltenv):
             existing_prefix_lists = existing_objects.get("ipv6_prefix_lists", {})
 
         # remove the prefix set to clean all sequence
-        if _get_os() != "sonic" or prefix_set["config"]["name"] in existing_prefix_lists:
+        if profile.nos != "sonic" or prefix_set["config"]["name"] in existing_prefix_lists:
             config.append(
                 _remove_prefix_set_config(
-                    prefix_set["config"]["name"], prefix_set["config"]["mode"], saltenv
+                    prefix_set["config"]["name"], prefix_set["config"]["mode"], saltenv, profile
                 )
             )
 
         # extracting the IP version of each prefix-list for usage in policies
         prefixes_set_mode[prefix_set["config"]["name"]] = prefix_set["config"]["mode"]
 
-        prefix_set_config = _generate_prefix_set_config(prefix_set, saltenv)
+        prefix_set_config = _generate_prefix_set_config(prefix_set, saltenv, profile)
         config.append(prefix_set_config)
 
     return config, prefixes_set_mode
@@ -295,7 +335,9 @@ def _is_community_set_declared(community_set_name, defined_sets):
 ##
 
 
-def _generate_statement_config(route_map_name, afisafis, statement, prefixes_set_mode, saltenv):
+def _generate_statement_config(
+    route_map_name, afisafis, statement, prefixes_set_mode, saltenv, profile=None
+):
     """Generate statement configuration."""
     context = {
         "route_map_name": route_map_name,
@@ -304,45 +346,174 @@ def _generate_statement_config(route_map_name, afisafis, statement, prefixes_set
         "actions": statement["actions"],
         "conditions": statement.get("conditions"),
         "prefixes_set_mode": prefixes_set_mode,
-        "convert_route_map_name": __utils__["jinja_filters.format_route_policy_name"],
     }
 
-    nos = _get_os()
-    return _apply_template(
+    nos = (profile or _get_platform_profile()).nos
+    return _iter_template(
         "salt://states/afk/templates/routing_policy/{}/statement.j2".format(nos), context, saltenv
     )
 
 
-def _remove_route_policy_config(route_map_name, afisafis, saltenv):
+def _remove_route_policy_config(route_map_name, afisafis, saltenv, profile=None):
     """Remove route policy configuration."""
     context = {
         "route_map_name": route_map_name,
         "afisafis": afisafis,
-        "convert_route_map_name": __utils__["jinja_filters.format_route_policy_name"],
     }
 
-    nos = _get_os()
-    return _apply_template(
+    nos = (profile or _get_platform_profile()).nos
+    return _iter_template(
         "salt://states/afk/templates/routing_policy/{}/remove_policy.j2".format(nos),
         context,
         saltenv,
     )
 
 
+class AppliedPolicies:
+    """Route policies pushed by the previous runs, to skip those unchanged since.
+
+    A policy is skipped when it is rendered from the same openconfig, platform facts and
+    templates as when it was pushed, and its content on the device did not change since: same
+    digests in the route policy inventory (see criteo_bgp.get_route_policy_inventory).
+
+    Records are kept in a file of the minion cache directory, per minion ID: each job of a
+    multiprocessing minion runs in a new process, and __context__ does not outlive it. A
+    missing or unreadable file only means all the policies are pushed again.
+    """
+
+    def __init__(self, inventory):
+        """Load the records of the previous runs.
+
+        :param inventory: digest per route policy installed on the device
+        """
+        self.inventory = inventory
+        self.path = os.path.join(
+            __opts__["cachedir"], _APPLIED_POLICIES_FILE.format(__opts__["id"])
+        )
+        self.records = self._load()
+        # policies pushed by this run: digest and names on the device
+        self.pending = {}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as fd:
+                records = json.load(fd)
+        except (OSError, ValueError) as err:
+            log.debug("No route policy pushed by the previous runs: %s", err)
+            return {}
+
+        return records if isinstance(records, dict) else {}
+
+    def _save(self):
+        # written then renamed, not to leave a partial file
+        tmp_path = "{}.tmp".format(self.path)
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fd:
+                json.dump(self.records, fd, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            log.warning("Unable to record the route policies pushed: %s", err)
+
+    @classmethod
+    def collect(cls):
+        """Collect the route policy inventory from the device."""
+        return cls(cls.get_inventory())
+
+    @staticmethod
+    def get_inventory():
+        """Get the route policy inventory of the device, or of the replayed snapshot."""
+        return __utils__["device_cache.get_device_data"](
+            __context__, __opts__, __salt__, __utils__, "criteo_bgp.get_route_policy_inventory"
+        )
+
+    def is_unchanged(self, name, digest):
+        """Check if the policy was pushed with this digest, and did not change on the device.
+
+        :param name: name of the policy, in openconfig
+        :param digest: digest of the policy to push (see _get_policy_digest)
+        """
+        record = self.records.get(name)
+        if record is None or record[0] != digest:
+            return False
+
+        return all(
+            device_name in self.inventory and self.inventory[device_name] == device_digest
+            for device_name, device_digest in record[1].items()
+        )
+
+    def add(self, name, digest, device_names):
+        """Record a policy pushed by this run, once the push succeeded (see commit).
+
+        :param name: name of the policy, in openconfig
+        :param digest: digest of the pushed policy (see _get_policy_digest)
+        :param device_names: names of the route policies generated on the device
+        """
+        self.pending[name] = (digest, device_names)
+
+    def commit(self, inventory):
+        """Record the policies pushed by this run, with their digest on the device.
+
+        :param inventory: route policy inventory, requested after the push
+        """
+        for name, (digest, device_names) in self.pending.items():
+            self.records[name] = [digest, {x: inventory.get(x) for x in device_names}]
+        self.pending.clear()
+        self._save()
+
+    def discard(self):
+        """Forget the policies pushed by this run, after a failed push."""
+        for name in self.pending:
+            self.records.pop(name, None)
+        self.pending.clear()
+        self._save()
+
+
+def _get_policy_digest(policy, afisafis, prefixes_set_mode, saltenv, profile):
+    """Get the digest of all the inputs rendering a policy: openconfig, platform and templates."""
+    templates = [
+        _get_template_content(
+            "salt://states/afk/templates/routing_policy/{}/{}.j2".format(profile.nos, name),
+            saltenv,
+        )
+        for name in ["remove_policy", "statement"]
+    ]
+    content = [policy, sorted(afisafis or []), prefixes_set_mode, profile, templates]
+
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
 def _generate_policies_config(
-    openconfig, rp_afisafis_mapping, prefixes_set_mode, defined_sets, existing_route_maps, saltenv
+    openconfig,
+    rp_afisafis_mapping,
+    prefixes_set_mode,
+    defined_sets,
+    existing_route_maps,
+    saltenv,
+    profile=None,
+    applied=None,
 ):
-    """Generate routing policies configuration."""
+    """Generate routing policies configuration.
+
+    :param applied: policies pushed by the previous runs (see AppliedPolicies), unchanged ones
+        are skipped, all policies are generated if None
+    """
     config = []
+    profile = profile or _get_platform_profile()
 
     for policies in openconfig["policy-definition"]:
         policy_name = policies["config"]["name"]
+        policy_config = []
 
         # remove the route-map to ensure no extra config nor sequence
-        if _get_os() != "sonic" or policies["config"]["name"] in existing_route_maps:
-            config.append(
+        if profile.nos != "sonic" or policies["config"]["name"] in existing_route_maps:
+            policy_config.append(
                 _remove_route_policy_config(
-                    policies["config"]["name"], rp_afisafis_mapping.get(policy_name), saltenv
+                    policies["config"]["name"],
+                    rp_afisafis_mapping.get(policy_name),
+                    saltenv,
+                    profile,
                 )
             )
 
@@ -361,14 +532,35 @@ def _generate_policies_config(
             ):
                 raise ValueError("Declared community does not exist: {}".format(community_set_name))
 
-            policy_config = _generate_statement_config(
+            policy_config.append(
+                _generate_statement_config(
+                    policy_name,
+                    rp_afisafis_mapping.get(policy_name),
+                    statement,
+                    prefixes_set_mode,
+                    saltenv,
+                    profile,
+                )
+            )
+
+        if applied is not None:
+            afisafis = rp_afisafis_mapping.get(policy_name)
+            digest = _get_policy_digest(policies, afisafis, prefixes_set_mode, saltenv, profile)
+            if applied.is_unchanged(policy_name, digest):
+                log.debug("route policy %s unchanged since pushed, skipped", policy_name)
+                continue
+
+            # JunOS: one route policy per AFI/SAFI using it (see format_route_policy_name)
+            applied.add(
                 policy_name,
-                rp_afisafis_mapping.get(policy_name),
-                statement,
-                prefixes_set_mode,
-                saltenv,
+                digest,
+                sorted(
+                    __utils__["jinja_filters.format_route_policy_name"](policy_name, afisafi)
+                    for afisafi in afisafis or [""]
+                ),
             )
-            config.append(policy_config)
+
+        config.extend(policy_config)
 
     return config
 
@@ -407,39 +599,79 @@ def _get_route_policy_afi_safis_usage(route_policies, bgp):
 ##
 
 
-def _generate_routing_policy_config(openconfig_routing_policy, openconfig_bgp, _, saltenv):
+def _generate_routing_policy_config(
+    openconfig_routing_policy, openconfig_bgp, _, saltenv, profile=None, workers=1, applied=None
+):
+    profile_phase = __utils__["jinja_render.profile_phase"]
+    profile = profile or _get_platform_profile()
+    nos = profile.nos
+    with profile_phase("templates_fetch"):
+        __utils__["jinja_render.prefetch_directory"](
+            "salt://states/afk/templates/routing_policy/{}".format(nos),
+            saltenv,
+            __salt__,
+            __utils__,
+        )
+
     #   Removing extras is only supported for SONiC
     #   extract items from the config (prefix list, community list etc...)
     #   it will be used in templates to clean objects needing changes
     existing_assets = {}
-    if _get_os() == "sonic":
-        current_config = __salt__["sonic.get_bgp_config"]()
-        existing_assets = __utils__["frr_detect_diff.get_objects"](current_config)
+    if nos == "sonic":
+        with profile_phase("device_state"):
+            current_config = __utils__["device_cache.get_device_data"](
+                __context__, __opts__, __salt__, __utils__, "sonic.get_bgp_config"
+            )
+            existing_assets = __utils__["frr_detect_diff.get_objects"](current_config)
 
     rp_afisafis_mapping = {}
-    if _get_os() == "junos":
+    if nos == "junos":
         # For JunOS, we need to know where are used the route policies, to auto generate a
         # route policy for each AFI/SAFI the route policy is used
         rp_afisafis_mapping = _get_route_policy_afi_safis_usage(
             openconfig_routing_policy["policy-definitions"], openconfig_bgp
         )
 
-    prefix_set, prefixes_set_mode = _generate_prefix_sets_config(
-        openconfig_routing_policy["defined-sets"]["prefix-sets"], existing_assets, saltenv
-    )
-    community_sets = _generate_communities_config(
-        openconfig_routing_policy["defined-sets"]["bgp-defined-sets"]["community-sets"],
-        existing_assets.get("community_lists", {}),
-        saltenv,
-    )
-    policy_definitions = _generate_policies_config(
-        openconfig_routing_policy["policy-definitions"],
-        rp_afisafis_mapping,
-        prefixes_set_mode,
-        openconfig_routing_policy["defined-sets"],
-        existing_assets.get("route_maps", {}),
-        saltenv,
-    )
+    with profile_phase("prefix_sets"):
+        prefix_set, prefixes_set_mode = _generate_prefix_sets_config(
+            openconfig_routing_policy["defined-sets"]["prefix-sets"],
+            existing_assets,
+            saltenv,
+            profile,
+        )
+        prefix_set = _render_when_profiling(prefix_set, workers)
+    with profile_phase("community_sets"):
+        community_sets = _generate_communities_config(
+            openconfig_routing_policy["defined-sets"]["bgp-defined-sets"]["community-sets"],
+            existing_assets.get("community_lists", {}),
+            saltenv,
+            profile,
+        )
+        community_sets = _render_when_profiling(community_sets, workers)
+    with profile_phase("policies"):
+        policy_definitions = _generate_policies_config(
+            openconfig_routing_policy["policy-definitions"],
+            rp_afisafis_mapping,
+            prefixes_set_mode,
+            openconfig_routing_policy["defined-sets"],
+            existing_assets.get("route_maps", {}),
+            saltenv,
+            profile,
+            applied,
+        )
+        policy_definitions = _render_when_profiling(policy_definitions, workers)
+
+    # sets and statements are independent of each other, they can be rendered in parallel
+    if workers > 1:
+        with profile_phase("parallel_render"):
+            rendered = iter(
+                __utils__["jinja_render.render_parallel"](
+                    prefix_set + community_sets + policy_definitions, workers
+                )
+            )
+        prefix_set = [next(rendered) for _ in prefix_set]
+        community_sets = [next(rendered) for _ in community_sets]
+        policy_definitions = [next(rendered) for _ in policy_definitions]
 
     # assemble the routing_policy configuration
     context = {
@@ -448,52 +680,54 @@ def _generate_routing_policy_config(openconfig_routing_policy, openconfig_bgp, _
         "policy_definitions": policy_definitions,
     }
 
-    suffix = ""
-    nos = _get_os()
-    if nos == "sonic":
-        version = __salt__["grains.get"]("sonic_build_version")
-
-        frr822 = "202205" in version or "202211" in version
-        workaround_flag = __salt__["pillar.get"]("frr822_workaround_flag", "False") == "True"
-        if frr822 and workaround_flag:
-            suffix = "_8_2_2"
+    suffix = "_8_2_2" if profile.frr_8_2_2_workaround else ""
 
-    config = _apply_template(
-        "salt://states/afk/templates/routing_policy/{}/routing_policy{}.j2".format(nos, suffix),
-        context,
-        saltenv,
-    )
+    # sets and statements not rendered yet (not profiling) are rendered while the template
+    # writes them
+    with profile_phase("assembly"):
+        config = _apply_template(
+            "salt://states/afk/templates/routing_policy/{}/routing_policy{}.j2".format(nos, suffix),
+            context,
+            saltenv,
+        )
 
     log.debug("generated config parts: %s", config)
 
     return config
 
 
-def apply(name, openconfig_routing_policy=None, openconfig_bgp=None, saltenv="base"):
-    """Apply and maintain Routing Policies configuration from openconfig format (JSON is expected).
-
-    .. warning::
-        Be careful with dry run, in some conditions napalm apply the config instead of
-        discarding it.
-        Did not find the root cause yet.
-
-    :param name: name of the task
-    :param openconfig_routing_policy: Routing Policy configuration in JSON in openconfig
-        (routing-policy)
-    :param openconfig_bgp: BGP configuration in JSON in openconfig (bgp)
-    :param saltenv: salt environment
-    """
+def _apply_config(name, openconfig_routing_policy, openconfig_bgp, saltenv, workers):
+    """Generate the routing policies configuration and load it on the device (see apply)."""
+    profile_phase = __utils__["jinja_render.profile_phase"]
     ret = {"name": name, "result": False, "changes": {}, "comment": []}
 
     # generate command to apply on the device using the templates
     log.debug("%s starting", name)
 
+    # platform facts are resolved once for the whole run
+    with profile_phase("platform"):
+        profile = _get_platform_profile()
+
+    # policies unchanged since pushed by the previous runs are skipped, all of them are
+    # rendered from a device snapshot
+    replayed = __utils__["device_snapshot.get_replayed"](__context__)
+    applied = None
+    if replayed is None:
+        with profile_phase("device_policies"):
+            applied = AppliedPolicies.collect()
+
     # get candidate config
     config = _generate_routing_policy_config(
-        openconfig_routing_policy, openconfig_bgp, False, saltenv
+        openconfig_routing_policy, openconfig_bgp, False, saltenv, profile, workers, applied
     )
 
-    nos = _get_os()
+    # rendered offline from a device snapshot: nothing is loaded on the device
+    if replayed is not None:
+        ret["result"] = None
+        ret["comment"].append("- rendered from {}:\n{}".format(replayed["path"], config))
+        return ret
+
+    nos = profile.nos
 
     if nos in ["eos", "junos"]:
         # only return generated commands/config during tests
@@ -502,20 +736,28 @@ def apply(name, openconfig_routing_policy=None, openconfig_bgp=None, saltenv="ba
             ret["result"] = None
             return ret
 
-        res = __salt__["net.load_config"](
-            text=config,
-            test=__opts__["test"],
-            debug=True,
-        )
+        with profile_phase("push"):
+            res = __salt__["net.load_config"](
+                text=config,
+                test=__opts__["test"],
+                debug=True,
+            )
     elif nos == "sonic":
         # TODO: modify .managed to support pushing raw config without template
-        res = __salt__["sonic.bgp_config"](
-            template_name="salt://templates/dummy.j2",
-            context={"raw": config},
-            push_only_if_changes=True,
-            test=__opts__["test"],
-        )
+        with profile_phase("push"):
+            res = __salt__["sonic.bgp_config"](
+                template_name="salt://templates/dummy.j2",
+                context={"raw": config},
+                push_only_if_changes=True,
+                test=__opts__["test"],
+            )
         res["diff"] = res["changes"]
+    if not __opts__["test"]:
+        __utils__["device_cache.invalidate"](__context__)
+        if res["result"]:
+            applied.commit(AppliedPolicies.get_inventory())
+        else:
+            applied.discard()
 
     ret["comment"].append("- loaded:\n{}".format(config))
     ret["comment"].append(res["comment"])
@@ -524,3 +766,42 @@ def apply(name, openconfig_routing_policy=None, openconfig_bgp=None, saltenv="ba
     ret["result"] = res["result"]
 
     return ret
+
+
+def apply(
+    name,
+    openconfig_routing_policy=None,
+    openconfig_bgp=None,
+    saltenv="base",
+    workers=1,
+    profile=False,
+    snapshot=None,
+):
+    """Apply and maintain Routing Policies configuration from openconfig format (JSON is expected).
+
+    .. warning::
+        Be careful with dry run, in some conditions napalm apply the config instead of
+        discarding it.
+        Did not find the root cause yet.
+
+    :param name: name of the task
+    :param openconfig_routing_policy: Routing Policy configuration in JSON in openconfig
+        (routing-policy)
+    :param openconfig_bgp: BGP configuration in JSON in openconfig (bgp)
+    :param saltenv: salt environment
+    :param workers: number of processes rendering the configuration (for very large
+        configurations, 1 to render in the minion process)
+    :param profile: record the renders by template and the duration of each phase, returned
+        in the "profile" key (also enabled for all runs by the afk_profile minion option)
+    :param snapshot: path of a device snapshot (see criteo_bgp.capture_snapshot), replayed
+        instead of requesting the device: the configuration is only rendered, in the comment
+    """
+    with __utils__["device_snapshot.replay"](__context__, snapshot):
+        if profile or __opts__.get("afk_profile", False):
+            ret, recorded = __utils__["jinja_render.run_profiled"](
+                _apply_config, name, openconfig_routing_policy, openconfig_bgp, saltenv, workers
+            )
+            ret["profile"] = recorded
+            return ret
+
+        return _apply_config(name, openconfig_routing_policy, openconfig_bgp, saltenv, workers)
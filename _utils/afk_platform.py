@@ -0,0 +1,94 @@
+"""Platform facts of the device (NOS, version, pillar flags), resolved once per state run.
+
+Templates and generators depend on a few facts of the device (EOS version for the syntax
+changes, SONiC build for FRR features...). They are resolved by the states once at the beginning
+of the run, and the feature gates are computed from this profile.
+
+:codeauthor: Criteo Network team
+:maturity:   new
+:platform:   SONiC, Arista EOS, Juniper JunOS
+"""
+
+import re
+from typing import NamedTuple, Tuple
+
+# SONiC releases shipping FRR 8.2.2, which needs some workarounds in routing policies
+FRR_8_2_2_SONIC_FAMILIES = ("202205", "202211")
+
+
+class PlatformProfile(NamedTuple):
+    """Immutable platform facts of the device, and the feature gates depending on them."""
+
+    nos: str
+    version: Tuple[int, ...] = ()
+    sonic_build_family: str = ""
+    default_vrf: str = ""
+    frr822_workaround: bool = False
+
+    @property
+    def eos_before_4_22(self):
+        """EOS syntax changed in 4.22 (peer-group, community-list...)."""
+        return self.nos == "eos" and self.version[:1] == (4,) and self.version[1] < 22
+
+    @property
+    def timer_delayopen_supported(self):
+        """Delayopen timer is not supported by FRR version of SONiC 201911."""
+        return not (self.nos == "sonic" and self.sonic_build_family == "201911")
+
+    @property
+    def frr_8_2_2_workaround(self):
+        """FRR 8.2.2 workaround is applied only if enabled in pillar and on affected builds."""
+        return (
+            self.nos == "sonic"
+            and self.sonic_build_family in FRR_8_2_2_SONIC_FAMILIES
+            and self.frr822_workaround
+        )
+
+
+def parse_version(version):
+    """Parse "major.minor" of an OS version.
+
+    :param version: OS version (example: 4.22.1F)
+    """
+    match = re.match(r"([0-9]+)\.([0-9]+).*", version or "")
+
+    if not match:
+        raise NotImplementedError("OS version not supported")
+
+    return int(match[1]), int(match[2])
+
+
+# SONiC release (YYYYMM), not part of a longer number like the date or time of dirty builds
+_SONIC_BUILD_FAMILY_PATTERN = re.compile(r"(?<![0-9])(20[0-9]{2}(?:0[1-9]|1[0-2]))(?![0-9])")
+
+
+def get_sonic_build_family(sonic_build_version):
+    """Get the SONiC release of a build (example: SONiC.202205.123 => 202205).
+
+    Builds of no release (master...) have no family, even if their build date contains one.
+
+    :param sonic_build_version: value of the sonic_build_version grain
+    """
+    match = _SONIC_BUILD_FAMILY_PATTERN.search(sonic_build_version or "")
+
+    return match[1] if match else ""
+
+
+def build_profile(
+    nos, version=(), sonic_build_version="", default_vrf="", frr822_workaround_flag="False"
+):
+    """Build the platform profile of the device.
+
+    :param nos: network OS (eos, junos or sonic)
+    :param version: OS version, already parsed as a tuple (see parse_version)
+    :param sonic_build_version: value of the sonic_build_version grain
+    :param default_vrf: default VRF from pillar
+    :param frr822_workaround_flag: value of the frr822_workaround_flag pillar ("True" to enable)
+    """
+    return PlatformProfile(
+        nos=nos,
+        version=tuple(version),
+        sonic_build_family=get_sonic_build_family(sonic_build_version),
+        default_vrf=default_vrf,
+        frr822_workaround=frr822_workaround_flag == "True",
+    )
@@ -0,0 +1,318 @@
+"""Index of BGP neighbors by canonical address, shared by criteo_bgp and the states.
+
+Neighbor addresses do not always have the same text form: IPv6 addresses can be compressed or
+not, and JunOS RPCs return the port of the session (example: 192.0.2.0+58771). Addresses are
+then compared with their packed form, so "2001:DB8:0::1" and "2001:db8::1" are the same
+neighbor, and lookups are O(1) instead of scans of the neighbor list.
+
+Neighbors are matched against many networks at once with a prefix trie (see PrefixTrie): one
+walk of the address bits per neighbor, instead of one membership test per network.
+
+Neighbors can also be returned with their fixed fields only, and their repeated strings (VRF,
+policies, state...) shared (see make_neighbor). The states keep them for the whole run as compact
+records (see NeighborRecord): fields in slots, instead of one dict per session.
+
+:codeauthor: Criteo Network team
+:maturity:   new
+:platform:   SONiC, Arista EOS, Juniper JunOS
+"""
+
+import sys
+from collections.abc import MutableMapping
+from ipaddress import ip_address
+
+# fields of the neighbors returned by criteo_bgp.get_neighbors
+NEIGHBOR_FIELDS = (
+    "remote_as",
+    "local_as",
+    "remote_address",
+    "vrf",
+    "export_policy",
+    "import_policy",
+    "peer_group",
+    "description",
+    "state",
+)
+_NEIGHBOR_FIELDS_SET = frozenset(NEIGHBOR_FIELDS)
+
+
+def get_address_key(address):
+    """Get the canonical key of a neighbor address: its packed form.
+
+    Port (JunOS, example: 192.0.2.0+58771) and IPv6 zone are ignored. Neighbors which are not
+    IP addresses (example: FRR unnumbered neighbor on an interface) are kept as is.
+
+    :param address: neighbor address, as returned by the device or set in openconfig
+    """
+    if not isinstance(address, str):
+        return address
+
+    try:
+        return ip_address(address.split("+", 1)[0].split("%", 1)[0]).packed
+    except ValueError:
+        return address
+
+
+def get_address_afi(key):
+    """Get the AFI of a canonical key: 4 or 6, None if the neighbor is not an IP address.
+
+    :param key: canonical key, from get_address_key
+    """
+    return {4: 4, 16: 6}.get(len(key)) if isinstance(key, bytes) else None
+
+
+def get_afi(address):
+    """Get the AFI of a neighbor address: 4 or 6, None if the neighbor is not an IP address.
+
+    :param address: neighbor address, as returned by the device or set in openconfig
+    """
+    return get_address_afi(get_address_key(address))
+
+
+def _intern(value):
+    # repeated strings of the neighbors are shared, other values are kept as is
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class NeighborRecord(MutableMapping):
+    """Compact neighbor, used like the dict returned by criteo_bgp.get_neighbors.
+
+    Fields are stored in slots, and strings are interned: the same VRF, policies or state
+    are shared by all the neighbors. Records are kept by the states and utils: they are not
+    serializable as is, execution modules return dicts (see make_neighbor).
+    """
+
+    __slots__ = NEIGHBOR_FIELDS
+
+    def __init__(self, **fields):
+        """Set the neighbor fields, the unknown ones are ignored and the missing ones are None.
+
+        :param fields: fields of the neighbor (see NEIGHBOR_FIELDS)
+        """
+        for name in NEIGHBOR_FIELDS:
+            self[name] = fields.get(name)
+
+    def __getitem__(self, name):
+        """Get a field of the neighbor."""
+        if name not in _NEIGHBOR_FIELDS_SET:
+            raise KeyError(name)
+
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        """Set a field of the neighbor, strings are interned."""
+        if name not in _NEIGHBOR_FIELDS_SET:
+            raise KeyError(name)
+
+        setattr(self, name, _intern(value))
+
+    def __delitem__(self, name):
+        """Fields of a record are fixed, they cannot be removed."""
+        raise TypeError("field {} of a neighbor record cannot be removed".format(name))
+
+    def __iter__(self):
+        """Iterate on the fields, in the order of the dict neighbors."""
+        return iter(NEIGHBOR_FIELDS)
+
+    def __len__(self):
+        """Get the number of fields."""
+        return len(NEIGHBOR_FIELDS)
+
+    def __repr__(self):
+        """Represent the record like a dict neighbor."""
+        return "NeighborRecord({})".format(dict(self))
+
+
+def make_neighbor(**fields):
+    """Build a neighbor dict, with the fields of a record (see NeighborRecord) and interned strings.
+
+    :param fields: fields of the neighbor (see NEIGHBOR_FIELDS), the unknown ones are ignored
+        and the missing ones are None
+    """
+    return {name: _intern(fields.get(name)) for name in NEIGHBOR_FIELDS}
+
+
+def make_record(**fields):
+    """Build a compact neighbor record (see NeighborRecord).
+
+    :param fields: fields of the neighbor (see NEIGHBOR_FIELDS)
+    """
+    return NeighborRecord(**fields)
+
+
+class NeighborIndex(MutableMapping):
+    """Neighbors indexed by address, looked up with any text form of the address.
+
+    Neighbors are stored by canonical key, so the different text forms of an address are one
+    neighbor for all the mapping operations (lookups, update, pop, len...). It iterates on the
+    addresses as set (as returned by the device), and salt serializes it as a dict keyed by
+    them, so it is used by templates as before. Neighbors are also partitioned per AFI.
+    """
+
+    def __init__(self, neighbors=(), address_field="remote_address"):
+        """Index the neighbors.
+
+        :param neighbors: list of neighbors (from criteo_bgp.get_neighbors or openconfig)
+        :param address_field: field of the neighbor containing its address
+        """
+        # address as set and neighbor, by canonical key
+        self._by_key = {}
+        self.afis = {4: [], 6: [], None: []}
+
+        for neighbor in neighbors:
+            self[neighbor[address_field]] = neighbor
+
+    def __setitem__(self, address, neighbor):
+        """Index the neighbor with its address, as returned by the device."""
+        key = get_address_key(address)
+        afi_neighbors = self.afis[get_address_afi(key)]
+        if key in self._by_key:
+            # same neighbor with another text form, or in another VRF: the last one is kept
+            afi_neighbors.remove(self._by_key[key][1])
+        afi_neighbors.append(neighbor)
+        self._by_key[key] = (address, neighbor)
+
+    def __getitem__(self, address):
+        """Get the neighbor of an address, whatever its text form."""
+        try:
+            return self._by_key[get_address_key(address)][1]
+        except KeyError:
+            raise KeyError(address) from None
+
+    def __delitem__(self, address):
+        """Remove the neighbor of an address, whatever its text form."""
+        key = get_address_key(address)
+        if key not in self._by_key:
+            raise KeyError(address)
+
+        _, neighbor = self._by_key.pop(key)
+        self.afis[get_address_afi(key)].remove(neighbor)
+
+    def __iter__(self):
+        """Iterate on the addresses of the neighbors, as set."""
+        return (address for address, _ in self._by_key.values())
+
+    def __len__(self):
+        """Get the number of neighbors."""
+        return len(self._by_key)
+
+    def __contains__(self, address):
+        """Check if a neighbor has this address, whatever its text form."""
+        return get_address_key(address) in self._by_key
+
+    def __repr__(self):
+        """Represent the index like a dict of neighbors."""
+        return "NeighborIndex({})".format(dict(self))
+
+    def __reduce__(self):
+        """Rebuild the index from its items when pickled (parallel rendering)."""
+        return self.__class__, (), None, None, iter(self.items())
+
+
+def build_index(neighbors, address_field="remote_address"):
+    """Build the index of neighbors by canonical address (see NeighborIndex).
+
+    :param neighbors: list of neighbors (from criteo_bgp.get_neighbors or openconfig)
+    :param address_field: field of the neighbor containing its address
+    """
+    return NeighborIndex(neighbors, address_field)
+
+
+def filter_in_network(neighbors, network, address_field="remote_address"):
+    """Keep the neighbors whose address is in the network.
+
+    Addresses are compared with the bounds of the network on their packed form, instead of
+    testing the membership of each address object in the network.
+
+    :param neighbors: list of neighbors
+    :param network: ipaddress network (example: ip_network("192.0.2.0/31")), all kept if None
+    :param address_field: field of the neighbor containing its address
+    """
+    if network is None:
+        return list(neighbors)
+
+    first = network.network_address.packed
+    last = network.broadcast_address.packed
+    result = []
+    for neighbor in neighbors:
+        key = get_address_key(neighbor[address_field])
+        if isinstance(key, bytes) and len(key) == len(first) and first <= key <= last:
+            result.append(neighbor)
+
+    return result
+
+
+class PrefixTrie:
+    """Binary trie of IPv4 and IPv6 networks, matching an address against all of them at once.
+
+    Each node is a bit of the network addresses, the networks are stored on the node of their
+    last prefix bit: the networks containing an address are on the path of its bits.
+    """
+
+    def __init__(self, networks=()):
+        """Build the trie.
+
+        :param networks: ipaddress networks (example: ip_network("192.0.2.0/31"))
+        """
+        # one root per packed address length (4 or 16), node: [child 0, child 1, networks]
+        self._roots = {}
+
+        for network in networks:
+            self.add(network)
+
+    def add(self, network):
+        """Add a network to the trie.
+
+        :param network: ipaddress network
+        """
+        node = self._roots.setdefault(len(network.network_address.packed), [None, None, []])
+        address = int(network.network_address)
+
+        for index in range(network.prefixlen):
+            bit = (address >> (network.max_prefixlen - 1 - index)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, []]
+            node = node[bit]
+
+        node[2].append(network)
+
+    def match(self, address):
+        """Get the networks containing an address, shortest prefix first.
+
+        :param address: neighbor address, any text form (see get_address_key)
+        """
+        key = get_address_key(address)
+        if not isinstance(key, bytes) or len(key) not in self._roots:
+            return []
+
+        node = self._roots[len(key)]
+        matches = list(node[2])
+        address = int.from_bytes(key, "big")
+        nb_bits = len(key) * 8
+
+        for index in range(nb_bits):
+            node = node[(address >> (nb_bits - 1 - index)) & 1]
+            if node is None:
+                break
+            matches.extend(node[2])
+
+        return matches
+
+
+def group_by_network(neighbors, networks, address_field="remote_address"):
+    """Group the neighbors by network containing their address, in one pass on the neighbors.
+
+    A neighbor is in the group of each network containing its address (overlapping networks).
+
+    :param neighbors: list of neighbors
+    :param networks: ipaddress networks, all of them are keys of the result
+    :param address_field: field of the neighbor containing its address
+    """
+    groups = {network: [] for network in networks}
+    trie = PrefixTrie(groups)
+
+    for neighbor in neighbors:
+        for network in trie.match(neighbor[address_field]):
+            groups[network].append(neighbor)
+
+    return groups
@@ -0,0 +1,178 @@
+"""Safeguards of the removal of BGP sessions, evaluated on the installed neighbors.
+
+Rules are set in the bgp_removal_safeguards pillar: a rule concerns the neighbors whose field
+(description or peer_group) contains a value, and requires a minimum of up neighbors to remain,
+per AFI, taking into account the neighbors already planned to be removed. It can also forbid
+removing up neighbors, to force removing BGP on the uplink before removing the matching session
+on the neighbor downlink. Neighbors which are not IP addresses (unnumbered neighbors on an
+interface) are counted apart, as another AFI.
+
+.. code-block:: yaml
+
+    bgp_removal_safeguards:
+      by_peer_group:
+        - field: "peer_group"
+          contains: "PG-TOR"
+          minimum_up: 2
+          remove_down_only: true
+      by_description:
+        - field: "description"
+          contains: "server"
+          minimum_up: 2
+          remove_down_only: false
+
+:codeauthor: Criteo Network team
+:maturity:   new
+:platform:   SONiC, Arista EOS, Juniper JunOS
+"""
+
+from collections import Counter
+from typing import List, NamedTuple, Tuple
+
+
+class RemovalSafeguards:
+    """Removal safeguards, evaluated incrementally on the installed neighbors.
+
+    Addresses are parsed and rules matched once: the number of up neighbors is counted per rule
+    and per AFI, and decremented as removals are accepted. Each check is then O(R) instead of a
+    scan of all installed neighbors.
+    """
+
+    def __init__(self, rules, installed_neighbors, get_afi):
+        """Index the installed neighbors for the rules.
+
+        :param rules: removal safeguards rules, from the bgp_removal_safeguards pillar
+        :param installed_neighbors: neighbors from criteo_bgp.get_neighbors
+        :param get_afi: AFI of a neighbor address, None if not an IP address
+            (bgp_neighbors.get_afi, given by the state: utils are not given __utils__)
+        """
+        self.rules = rules or []
+        self.installed_neighbors = installed_neighbors
+        self._afis = []
+        self._matching_rules = []
+        # number of up neighbors not removed, per AFI, for each rule
+        self._nb_up = [Counter() for _ in self.rules]
+
+        if not self.rules:
+            return
+
+        for neighbor in installed_neighbors:
+            afi = get_afi(neighbor["remote_address"])
+            matching_rules = [
+                rule_index
+                for rule_index, rule in enumerate(self.rules)
+                if rule["contains"] in (neighbor[rule["field"]] or "")
+            ]
+            self._afis.append(afi)
+            self._matching_rules.append(matching_rules)
+
+            if neighbor["state"] == "up":
+                for rule_index in matching_rules:
+                    self._nb_up[rule_index][afi] += 1
+
+    def get_blocking_rule(self, index):
+        """Get the first rule preventing the removal of the installed neighbor, None if safe.
+
+        Removals already accepted are taken into account.
+
+        :param index: index of the neighbor in the installed neighbors
+        """
+        if not self.rules:
+            return None
+
+        is_up = self.installed_neighbors[index]["state"] == "up"
+        afi = self._afis[index]
+
+        for rule_index in self._matching_rules[index]:
+            rule = self.rules[rule_index]
+            # we authorize removing down neighbor only
+            if rule.get("remove_down_only") and is_up:
+                return rule
+
+            # the neighbor to remove is excluded to check the resilience afterwards
+            if self._nb_up[rule_index][afi] - is_up < rule["minimum_up"]:
+                return rule
+
+        return None
+
+    def is_safe_to_remove(self, index):
+        """Check if the installed neighbor can be removed, with the removals already accepted.
+
+        :param index: index of the neighbor in the installed neighbors
+        """
+        return self.get_blocking_rule(index) is None
+
+    def get_nb_matching_rules(self, index):
+        """Get the number of rules concerning the installed neighbor.
+
+        :param index: index of the neighbor in the installed neighbors
+        """
+        return len(self._matching_rules[index]) if self.rules else 0
+
+    def remove(self, index):
+        """Accept the removal of the installed neighbor, for the next checks.
+
+        :param index: index of the neighbor in the installed neighbors
+        """
+        if not self.rules or self.installed_neighbors[index]["state"] != "up":
+            return
+
+        for rule_index in self._matching_rules[index]:
+            self._nb_up[rule_index][self._afis[index]] -= 1
+
+
+class RemovalPlan(NamedTuple):
+    """Installed neighbors to remove, and the ones held back with the rule preventing it."""
+
+    to_remove: List[dict]
+    held_back: List[Tuple[dict, dict]]
+
+
+def plan_removals(installed_neighbors, wanted_addresses, rules, get_afi):
+    """Plan the removal of the unwanted installed neighbors, as many as the rules allow.
+
+    The plan does not depend on the order of the neighbors on the device:
+
+    * down neighbors are planned first: they do not lower the number of up neighbors, so they
+      only depend on the neighbors already up or not
+    * then up neighbors, the ones concerned by the fewest rules first (they consume the
+      fewest removals allowed by the rules), by address
+
+    Each removal is checked with the removals already planned, so all removals can be done in
+    one run, and a neighbor held back could not be removed in addition to the planned ones.
+
+    :param installed_neighbors: neighbors from criteo_bgp.get_neighbors
+    :param wanted_addresses: addresses of the neighbors to keep (bgp_neighbors.NeighborIndex of
+        the wanted neighbors to match any text form of the addresses)
+    :param rules: removal safeguards rules
+    :param get_afi: AFI of a neighbor address, None if not an IP address (bgp_neighbors.get_afi)
+    """
+    safeguards = RemovalSafeguards(rules, installed_neighbors, get_afi)
+    candidates = [
+        index
+        for index, neighbor in enumerate(installed_neighbors)
+        if neighbor["remote_address"] not in wanted_addresses
+    ]
+    candidates.sort(
+        key=lambda index: (
+            installed_neighbors[index]["state"] == "up",
+            safeguards.get_nb_matching_rules(index),
+            installed_neighbors[index]["remote_address"],
+        )
+    )
+
+    removed = set()
+    held_back = []
+    for index in candidates:
+        blocking_rule = safeguards.get_blocking_rule(index)
+        if blocking_rule is None:
+            safeguards.remove(index)
+            removed.add(index)
+        else:
+            held_back.append((installed_neighbors[index], blocking_rule))
+
+    # removals are generated in the order of the device
+    return RemovalPlan(
+        to_remove=[installed_neighbors[index] for index in sorted(removed)],
+        held_back=held_back,
+    )
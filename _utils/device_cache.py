@@ -0,0 +1,93 @@
+"""Cache of the read-only data requested to the device, shared by the states of a highstate.
+
+The states of a highstate (routing policies, BGP sessions, clear soft...) request the same
+operational data to the device (BGP neighbors, global AS, running config...). Results can be
+kept in __context__, keyed by function and arguments, for a limited time, so each dataset is
+requested once.
+
+The cache is disabled by default (see DEFAULT_TTL): the states cannot know their job, and
+__context__ outlives the jobs on proxy minions, so a dry run followed by a real run within the
+time to live would render the real run from the data of the dry run. It is enabled with
+afk_device_cache_ttl in the minion config, for the runs not changing the device between jobs.
+
+Cached results are shared: they must not be modified by the callers. The cache must be
+invalidated after each change on the device (config push, clear...), see invalidate.
+
+:codeauthor: Criteo Network team
+:maturity:   new
+:platform:   SONiC, Arista EOS, Juniper JunOS
+"""
+
+import json
+import time
+
+# time to live of the cached results, in seconds, disabled unless set (afk_device_cache_ttl in
+# minion config)
+DEFAULT_TTL = 0
+
+_CONTEXT_KEY = "afk_device_cache"
+
+
+def _get_key(name, args, kwargs):
+    return name, json.dumps([args, kwargs], sort_keys=True, default=str)
+
+
+def call(context, name, func, *args, ttl=None, **kwargs):
+    """Get the result of a read-only function, from the cache if requested in the last seconds.
+
+    :param context: __context__ of the caller
+    :param name: name of the function, used in the cache key (example: criteo_bgp.get_neighbors)
+    :param func: function requesting the device, called on cache miss
+    :param args: arguments of the function, used in the cache key
+    :param ttl: time to live of the result, in seconds (DEFAULT_TTL if None, 0 to disable)
+    :param kwargs: keyword arguments of the function, used in the cache key
+    """
+    ttl = DEFAULT_TTL if ttl is None else ttl
+    if ttl <= 0:
+        return func(*args, **kwargs)
+
+    cache = context.setdefault(_CONTEXT_KEY, {})
+    key = _get_key(name, args, kwargs)
+    now = time.monotonic()
+
+    if key in cache and cache[key][0] > now:
+        return cache[key][1]
+
+    result = func(*args, **kwargs)
+    cache[key] = (now + ttl, result)
+
+    return result
+
+
+def get_device_data(context, opts, functions, utils, function, **kwargs):
+    """Request read-only data to the device, from the replayed snapshot if any, or the cache.
+
+    Used by the states, with their loader dunders: utils modules are not given them.
+
+    :param context: __context__ of the state
+    :param opts: __opts__ of the state, for afk_device_cache_ttl
+    :param functions: __salt__ of the state
+    :param utils: __utils__ of the state, for device_snapshot
+    :param function: execution module function (example: criteo_bgp.get_neighbors)
+    :param kwargs: keyword arguments of the function
+    """
+    replayed = utils["device_snapshot.get_replayed"](context)
+    if replayed is not None:
+        return utils["device_snapshot.get_result"](replayed, function, **kwargs)
+
+    return call(
+        context, function, functions[function], ttl=opts.get("afk_device_cache_ttl"), **kwargs
+    )
+
+
+def invalidate(context, name=None):
+    """Drop the cached results, after a change on the device.
+
+    :param context: __context__ of the caller
+    :param name: drop only the results of this function, all of them if not set
+    """
+    cache = context.get(_CONTEXT_KEY, {})
+
+    for key in list(cache):
+        if name is None or key[0] == name:
+            del cache[key]
@@ -0,0 +1,224 @@
+"""Snapshots of the device data read by the states, to render configurations offline.
+
+openconfig_bgp and openconfig_routing_policy read a few datasets from the device (global AS,
+BGP neighbors, running config) and a few grains (NOS, versions). A snapshot holds all of them,
+captured once from the device (see criteo_bgp.capture_snapshot) in a versioned file, JSON or
+msgpack.
+
+The states replay a snapshot instead of requesting the device (apply with snapshot=<path>): the
+configuration is rendered, without reading or changing the device, so candidate configurations
+can be rendered and tested on a build host. The grains of the device are also taken from the
+snapshot, and the states are loaded from the grains of the snapshot set in the afk_snapshot
+pillar, not the ones of the host.
+
+:codeauthor: Criteo Network team
+:maturity:   new
+:platform:   SONiC, Arista EOS, Juniper JunOS
+"""
+
+import contextlib
+import json
+import logging
+from collections.abc import Mapping
+
+import msgpack
+from salt.exceptions import CommandExecutionError
+
+log = logging.getLogger(__name__)
+
+# version of the snapshot files, increased when their content changes
+SNAPSHOT_VERSION = 1
+
+# data read by the states: execution module function and keyword arguments
+_COMMON_READS = [
+    ("criteo_bgp.get_global_as", {"vrf": "default"}),
+    ("criteo_bgp.get_neighbors", {"compact": True}),
+]
+_SNAPSHOT_READS = {
+    "eos": _COMMON_READS,
+    "junos": _COMMON_READS,
+    "sonic": _COMMON_READS + [("sonic.get_bgp_config", {})],
+}
+
+_CONTEXT_KEY = "afk_device_snapshot"
+
+# pillar with the path of the snapshot replayed by the states of the afk sls
+SNAPSHOT_PILLAR = "afk_snapshot"
+
+
+def _get_key(function, kwargs):
+    return function, json.dumps(kwargs, sort_keys=True, default=str)
+
+
+def _get_format(path, fmt):
+    fmt = fmt or ("msgpack" if path.endswith((".msgpack", ".mp")) else "json")
+    if fmt not in ["json", "msgpack"]:
+        raise CommandExecutionError("Unknown snapshot format {}".format(fmt))
+
+    return fmt
+
+
+def _to_serializable(obj):
+    # neighbor records and indexes are mappings, written as plain dicts
+    if isinstance(obj, Mapping):
+        return dict(obj)
+
+    return str(obj)
+
+
+def get_reads(nos):
+    """Get the data read from the device by the states: list of (function, keyword arguments).
+
+    :param nos: network OS of the device (eos, junos, sonic)
+    """
+    if nos not in _SNAPSHOT_READS:
+        raise NotImplementedError("OS '{}' not supported".format(nos))
+
+    return [(function, dict(kwargs)) for function, kwargs in _SNAPSHOT_READS[nos]]
+
+
+def write(path, grains, reads, fmt=None):
+    """Write a snapshot file.
+
+    :param path: path of the snapshot file
+    :param grains: grains of the device read by the states
+    :param reads: results read from the device: list of (function, keyword arguments, result)
+    :param fmt: json or msgpack, from the extension of the path if not set (.msgpack or .mp)
+    """
+    fmt = _get_format(path, fmt)
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "grains": grains,
+        "reads": [
+            {"function": function, "kwargs": kwargs, "result": result}
+            for function, kwargs, result in reads
+        ],
+    }
+
+    if fmt == "json":
+        with open(path, "w", encoding="utf-8") as fd:
+            json.dump(snapshot, fd, default=_to_serializable)
+    else:
+        with open(path, "wb") as fd:
+            fd.write(msgpack.packb(snapshot, default=_to_serializable, use_bin_type=True))
+
+    return {"path": path, "format": fmt, "version": SNAPSHOT_VERSION, "reads": len(reads)}
+
+
+def load(path, fmt=None):
+    """Load a snapshot file, with its results indexed by function and arguments.
+
+    :param path: path of the snapshot file
+    :param fmt: json or msgpack, from the extension of the path if not set (.msgpack or .mp)
+    """
+    fmt = _get_format(path, fmt)
+    try:
+        if fmt == "json":
+            with open(path, encoding="utf-8") as fd:
+                snapshot = json.load(fd)
+        else:
+            with open(path, "rb") as fd:
+                snapshot = msgpack.unpackb(fd.read(), raw=False)
+    except (OSError, ValueError) as err:
+        raise CommandExecutionError("Unable to load snapshot {}: {}".format(path, err)) from err
+
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        raise CommandExecutionError(
+            "Unsupported snapshot {}: version {} expected".format(path, SNAPSHOT_VERSION)
+        )
+
+    return {
+        "path": path,
+        "grains": snapshot.get("grains", {}),
+        "results": {
+            _get_key(read["function"], read["kwargs"]): read["result"]
+            for read in snapshot.get("reads", [])
+        },
+    }
+
+
+def get_result(snapshot, function, **kwargs):
+    """Get the result of a device read from a snapshot.
+
+    :param snapshot: loaded snapshot (see load)
+    :param function: execution module function (example: criteo_bgp.get_neighbors)
+    :param kwargs: keyword arguments of the function
+    """
+    key = _get_key(function, kwargs)
+    if key not in snapshot["results"]:
+        raise CommandExecutionError(
+            "{} with {} is not in snapshot {}".format(function, kwargs, snapshot["path"])
+        )
+
+    return snapshot["results"][key]
+
+
+@contextlib.contextmanager
+def replay(context, path):
+    """Replay a snapshot for the states run in this block, instead of requesting the device.
+
+    :param context: __context__ of the state
+    :param path: path of the snapshot file, the device is requested if None
+    """
+    if not path:
+        yield None
+        return
+
+    context[_CONTEXT_KEY] = load(path)
+    try:
+        yield context[_CONTEXT_KEY]
+    finally:
+        del context[_CONTEXT_KEY]
+
+
+def get_replayed(context):
+    """Get the snapshot replayed by the state, None if the device is requested.
+
+    :param context: __context__ of the state
+    """
+    return context.get(_CONTEXT_KEY)
+
+
+def get_grain(context, functions, name, default=None):
+    """Get a grain of the device, from the replayed snapshot if any.
+
+    :param context: __context__ of the state
+    :param functions: __salt__ of the state, for grains.get
+    :param name: name of the grain
+    :param default: value if the grain is not set
+    """
+    replayed = get_replayed(context)
+    if replayed is not None:
+        return replayed["grains"].get(name, default)
+
+    return functions["grains.get"](name, default)
+
+
+def get_os(context, functions):
+    """Get the network OS of the device (nos grain, or os), from the replayed snapshot if any.
+
+    :param context: __context__ of the state
+    :param functions: __salt__ of the state, for grains.get
+    """
+    return get_grain(context, functions, "nos", get_grain(context, functions, "os"))
+
+
+def get_loaded_os(functions):
+    """Get the network OS of the device when the states are loaded (__virtual__).
+
+    The snapshot set in the afk_snapshot pillar is not replayed yet: the OS is read from its
+    grains, so the states are loaded on a host which is not the device.
+
+    :param functions: __salt__ of the state, for pillar.get and grains.get
+    """
+    path = functions["pillar.get"](SNAPSHOT_PILLAR)
+    if not path:
+        return functions["grains.get"]("nos", functions["grains.get"]("os"))
+
+    try:
+        grains = load(path)["grains"]
+    except CommandExecutionError as err:
+        log.error("states not loaded: %s", err)
+        return None
+
+    return grains.get("nos", grains.get("os"))
@@ -0,0 +1,227 @@
+"""Persistent session to FRR on SONiC, kept open for the whole minion process.
+
+Each "vtysh -c" forks a shell and a new vtysh, which connects to all the FRR daemons before
+running a single command. One vtysh is started instead, reading the commands on its standard
+input, and reused by the modules and states as long as the minion process lives.
+
+Commands are pipelined: they are all written at once, each one followed by the "echo" of a
+unique marker, then the outputs are read in order, each one up to its marker.
+
+The session is started again if vtysh exited (FRR restarted for instance). Outputs are read
+with a deadline: a vtysh not answering in time (bgpd stuck for instance) is killed, and a new
+one is started by the next commands. Commands of concurrent threads are run one batch at a time.
+
+:codeauthor: Criteo Network team
+:maturity:   new
+:platform:   SONiC
+"""
+
+import atexit
+import itertools
+import json
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+import types
+import uuid
+
+from salt.exceptions import CommandExecutionError
+
+# the salt loader executes this module again for every new loader (so for every state run):
+# the sessions must be kept outside of the module to be shared
+_PROCESS_STORE_NAME = "afk_frr_session_store"
+
+VTYSH_COMMAND = ("vtysh",)
+
+# seconds to get the outputs of a batch of commands, before vtysh is killed
+DEFAULT_TIMEOUT = 60
+
+# seconds given to vtysh to exit when the session is closed, before it is killed
+_CLOSE_TIMEOUT = 5
+
+
+class FrrSession:
+    """Long-lived vtysh process, running pipelined commands."""
+
+    def __init__(self, command=VTYSH_COMMAND):
+        """Prepare the session, vtysh is started with the first commands.
+
+        :param command: command starting vtysh, reading commands on its standard input
+        """
+        self.command = tuple(command)
+        self.nb_starts = 0
+        self._process = None
+        # bytes read from vtysh, not split in lines yet
+        self._buffer = b""
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex
+        self._counter = itertools.count()
+
+    def _get_process(self):
+        if self._process is None or self._process.poll() is not None:
+            self.close()
+            self._process = subprocess.Popen(  # pylint: disable=R1732
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+            self.nb_starts += 1
+
+        return self._process
+
+    def _read_line(self, deadline):
+        # the pipe is read without buffering, for select to tell if vtysh answered
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self._process.stdout], [], [], remaining)[0]:
+                raise TimeoutError("no output from vtysh")
+
+            chunk = os.read(self._process.stdout.fileno(), 65536)
+            if not chunk:
+                raise EOFError("vtysh exited before the end of the output")
+            self._buffer += chunk
+
+        line, self._buffer = self._buffer.split(b"\n", 1)
+
+        return line.decode("utf-8", errors="replace")
+
+    def _read_output(self, marker, deadline):
+        lines = []
+        while True:
+            line = self._read_line(deadline)
+            if line == marker:
+                return "".join(lines)
+            # the echo command itself, if vtysh echoes the commands with the prompt
+            if not line.endswith("echo " + marker):
+                lines.append(line + "\n")
+
+    def _run_pipelined(self, commands, timeout):
+        process = self._get_process()
+        markers = ["afk-end-{}-{}".format(self._token, next(self._counter)) for _ in commands]
+
+        process.stdin.write(
+            "".join(
+                "{}\necho {}\n".format(command, marker)
+                for command, marker in zip(commands, markers)
+            ).encode("utf-8")
+        )
+        process.stdin.flush()
+
+        deadline = time.monotonic() + timeout
+        return [self._read_output(marker, deadline) for marker in markers]
+
+    def run_commands(self, *commands, timeout=DEFAULT_TIMEOUT):
+        """Run the commands in one batch, and get their text output in the same order.
+
+        :param commands: vtysh commands (example: show bgp summary json)
+        :param timeout: seconds to get all the outputs, vtysh is killed after
+        """
+        with self._lock:
+            try:
+                return self._run_pipelined(commands, timeout)
+            except TimeoutError as err:
+                # not tried again: vtysh is killed, and started again by the next commands
+                self.close()
+                raise CommandExecutionError(
+                    "FRR session timed out after {}s: {}".format(timeout, err)
+                ) from err
+            except (OSError, EOFError):
+                # vtysh exited since the previous commands: one more try with a new session
+                self.close()
+
+            try:
+                return self._run_pipelined(commands, timeout)
+            except (OSError, EOFError) as err:
+                self.close()
+                raise CommandExecutionError("FRR session failed: {}".format(err)) from err
+
+    def close(self):
+        """Stop vtysh, if started."""
+        if self._process is None:
+            return
+
+        process, self._process = self._process, None
+        self._buffer = b""
+        for stream in (process.stdin, process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(_CLOSE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        process.wait()
+
+
+def _get_process_store():
+    """Get the interpreter-wide store holding the sessions."""
+    store = sys.modules.get(_PROCESS_STORE_NAME)
+
+    if store is None:
+        store = types.ModuleType(_PROCESS_STORE_NAME)
+        store.sessions = {}
+        sys.modules[_PROCESS_STORE_NAME] = store
+        atexit.register(close_sessions)
+
+    return store
+
+
+def get_session(command=VTYSH_COMMAND):
+    """Get the FRR session of the minion process, created if needed.
+
+    :param command: command starting vtysh
+    """
+    sessions = _get_process_store().sessions
+    if tuple(command) not in sessions:
+        sessions[tuple(command)] = FrrSession(command)
+
+    return sessions[tuple(command)]
+
+
+def close_sessions():
+    """Stop all the FRR sessions of the minion process."""
+    for session in _get_process_store().sessions.values():
+        session.close()
+
+
+def parse_json_output(output):
+    """Parse the JSON document of a command output, ignoring the prompt and echo around.
+
+    :param output: text output of a "show ... json" command
+    """
+    start = min((index for index in (output.find("{"), output.find("[")) if index >= 0), default=-1)
+    stop = max(output.rfind("}"), output.rfind("]")) + 1
+    if start < 0 or stop <= start:
+        raise CommandExecutionError("No JSON in FRR output: {}".format(output.strip()))
+
+    return json.loads(output[start:stop])
+
+
+def run_commands(*commands, command=VTYSH_COMMAND, timeout=DEFAULT_TIMEOUT):
+    """Run commands on the persistent FRR session, and get their text output.
+
+    :param commands: vtysh commands, pipelined in one batch
+    :param command: command starting vtysh
+    :param timeout: seconds to get all the outputs, vtysh is killed after
+    """
+    return get_session(command).run_commands(*commands, timeout=timeout)
+
+
+def run_json_commands(*commands, command=VTYSH_COMMAND, timeout=DEFAULT_TIMEOUT):
+    """Run "show ... json" commands on the persistent FRR session, and get parsed results.
+
+    :param commands: vtysh commands with JSON output, pipelined in one batch
+    :param command: command starting vtysh
+    :param timeout: seconds to get all the outputs, vtysh is killed after
+    """
+    return [
+        parse_json_output(output)
+        for output in run_commands(*commands, command=command, timeout=timeout)
+    ]
@@ -4,6 +4,8 @@
 :maturity:   new
 """
 
+from collections.abc import Mapping
+
 
 def format_route_policy_name(route_policy_name, afisafi):
     """Format route policy name.
@@ -19,10 +21,10 @@ def format_route_policy_name(route_policy_name, afisafi):
 def deep_get(obj, *args):
     """Get a deep leaf from nested dict without raising if key does not exist.
 
-    It is like my_dict.get() but for nested dict.
+    It is like my_dict.get() but for nested dict (or mappings, like neighbor records).
     """
     for key in args:
-        if isinstance(obj, dict) and key in obj:
+        if isinstance(obj, Mapping) and key in obj:
             obj = obj[key]
         else:
             return None
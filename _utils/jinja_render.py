@@ -0,0 +1,631 @@
+"""Render AFK templates from compiled Jinja templates, cached for the whole minion process.
+
+The same few templates are rendered hundreds of times per state run (once or twice per
+neighbor), so they are compiled once and reused as long as their source does not change.
+
+Sources are loaded in memory by directory, once per state run, from the minion file cache
+(see cp.cache_dir), instead of being requested to the master for each render.
+
+Templates are rendered by a dedicated Jinja environment (one per salt environment), with the
+AFK helpers registered by the states as globals (see register_helpers), instead of going through
+the salt renderer which builds a full salt context (grains, pillar, opts...) for each fragment.
+Templates only use the context given by the states.
+
+Configurations are assembled as streams of lines: parts are rendered while the assembling
+template writes them, and the whole text is built once, at the end.
+
+Templates can be compiled ahead of time into Python modules (like the Jinja ModuleLoader), stored
+next to the sources in a "compiled" directory and cached on the minion with them, so a restarted
+minion does not parse the templates again. A bundle is used only if it was built from the exact
+same source and with the same Jinja version, the source template is compiled otherwise::
+
+    python -m _utils.jinja_render /srv/salt/base/openconfig
+
+Independent parts of large configurations can be rendered in a pool of worker processes (see
+render_parallel), forked from the minion process so they inherit the parts to render.
+
+Renders can be profiled (see run_profiled): number of renders, time and output size per
+template, and duration of the phases of the state run. The profile belongs to the run which
+started it: jobs run at the same time by a threaded minion record their own profile.
+
+:codeauthor: Criteo Network team
+:maturity:   new
+"""
+
+import contextlib
+import contextvars
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+import jinja2
+from jinja2 import BaseLoader, Environment, StrictUndefined, TemplateNotFound
+
+log = logging.getLogger(__name__)
+
+# The salt loader executes this module again for every new loader (so for every state run):
+# anything meant to live as long as the minion process must be kept outside of the module.
+_PROCESS_STORE_NAME = "afk_jinja_render_store"
+
+# directories of the templates to compile ahead of time, relative to the file root
+BUNDLED_TEMPLATE_DIRS = (
+    "states/afk/templates/bgp",
+    "states/afk/templates/routing_policy",
+    "states/afk/templates/snmp",
+)
+# compiled templates are stored in this sub-directory of each template directory
+BUNDLE_DIR = "compiled"
+_BUNDLE_METADATA_RE = re.compile(r"^(source_hash|jinja_version) = '([^']*)'$", re.MULTILINE)
+
+
+def _get_process_store():
+    """Get the interpreter-wide store holding the compiled templates and the counters."""
+    store = sys.modules.get(_PROCESS_STORE_NAME)
+
+    if store is None:
+        store = types.ModuleType(_PROCESS_STORE_NAME)
+        store.environments = {}
+        store.helpers = {}
+        store.sources = {}
+        store.bundles = {}
+        store.templates = {}
+        store.stats = {"hits": 0, "misses": 0}
+        # parts to render, set in the worker processes of render_parallel only
+        store.pool_parts = None
+        # profile of the current run (thread), see start_profile
+        store.profile = contextvars.ContextVar("afk_jinja_render_profile", default=None)
+        sys.modules[_PROCESS_STORE_NAME] = store
+
+    return store
+
+
+def _hash_source(source):
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+class _SourcesLoader(BaseLoader):
+    """Jinja loader serving the sources loaded in memory, for include/import in templates."""
+
+    def __init__(self, saltenv):
+        self.saltenv = saltenv
+
+    def get_source(self, environment, template):
+        sources = _get_process_store().sources
+        loaded = sources.get((self.saltenv, template))
+        if loaded is None:
+            raise TemplateNotFound(template)
+
+        source_hash, source = loaded
+
+        def uptodate():
+            return sources.get((self.saltenv, template), (None,))[0] == source_hash
+
+        return source, template, uptodate
+
+    def load(self, environment, name, globals=None):  # pylint: disable=W0622
+        """Load an included template from its bundle if up to date, from its source otherwise."""
+        source, filename, uptodate = self.get_source(environment, name)
+        template = _load_bundled_template(
+            environment, (self.saltenv, name), _get_process_store().sources[(self.saltenv, name)][0]
+        )
+        if template is None:
+            code = environment.compile(source, name, filename)
+            template = environment.template_class.from_code(
+                environment, code, environment.make_globals(globals), uptodate
+            )
+        else:
+            template._uptodate = uptodate  # pylint: disable=W0212
+
+        return template
+
+
+def _create_environment(loader=None):
+    # same options than the salt renderer, to get the exact same output
+    return Environment(
+        loader=loader,
+        undefined=StrictUndefined,
+        extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols"],
+        keep_trailing_newline=True,
+    )
+
+
+def _get_environment(saltenv):
+    """Get the Jinja environment of the salt environment, created once per process."""
+    store = _get_process_store()
+    environment = store.environments.get(saltenv)
+
+    if environment is None:
+        environment = _create_environment(_SourcesLoader(saltenv))
+        environment.globals.update(store.helpers)
+        store.environments[saltenv] = environment
+
+    return environment
+
+
+def register_helpers(helpers):
+    """Register the helpers of the templates, as globals of all the Jinja environments.
+
+    Utils modules are not given __utils__ by the salt loader, so the states register the
+    helpers (jinja_filters functions) before rendering.
+
+    :param helpers: helper functions, per name in the templates (example: deep_get)
+    """
+    store = _get_process_store()
+    store.helpers.update(helpers)
+    for environment in store.environments.values():
+        environment.globals.update(helpers)
+
+
+def get_bundle_filename(template_name):
+    """Get the file name of the compiled template, as named by the Jinja ModuleLoader.
+
+    :param template_name: path of the template (example: salt://states/afk/templates/...)
+    """
+    return "tmpl_{}.py".format(hashlib.sha1(template_name.encode("utf-8")).hexdigest())
+
+
+def _load_bundled_template(environment, key, source_hash):
+    """Load the compiled template of the bundle, None if no bundle up to date."""
+    bundle = _get_process_store().bundles.get(key)
+    if bundle is None or bundle[0] != source_hash:
+        return None
+
+    # the bundle is built with defer_init: the environment is given by from_module_dict
+    namespace = {"__file__": key[1]}
+    exec(compile(bundle[1], key[1], "exec"), namespace)  # pylint: disable=W0122
+
+    return environment.template_class.from_module_dict(
+        environment, namespace, environment.make_globals(None)
+    )
+
+
+def _load_bundles(template_dir, bundle_files, saltenv):
+    """Keep the compiled templates built from the sources loaded, with the same Jinja version."""
+    store = _get_process_store()
+
+    for (key_saltenv, template_name), (source_hash, _) in store.sources.items():
+        if key_saltenv != saltenv or not template_name.startswith(template_dir + "/"):
+            continue
+
+        bundle_file = bundle_files.get(get_bundle_filename(template_name))
+        if bundle_file is None:
+            continue
+
+        with open(bundle_file, encoding="utf-8") as fd:
+            bundle_source = fd.read()
+        metadata = dict(_BUNDLE_METADATA_RE.findall(bundle_source))
+
+        if metadata.get("source_hash") != source_hash:
+            log.debug("Compiled %s is stale, using the source template", template_name)
+        elif metadata.get("jinja_version") != jinja2.__version__:
+            log.debug("Compiled %s built with another Jinja version", template_name)
+        else:
+            store.bundles[(saltenv, template_name)] = (source_hash, bundle_source)
+
+
+def load_directory(template_dir, cached_files, saltenv="base"):
+    """Load in memory the sources of a template directory cached on the minion.
+
+    Sources previously loaded for this directory are replaced, so a template removed from the
+    fileserver is not served anymore. Compiled templates of the directory (see build_bundles)
+    are loaded along with the sources, when up to date.
+
+    :param template_dir: salt path of the directory (example: salt://states/afk/templates/snmp/eos)
+    :param cached_files: local paths of the directory files, as returned by cp.cache_dir
+    :param saltenv: salt environment
+    """
+    store = _get_process_store()
+    template_dir = template_dir.rstrip("/")
+    relative_dir = template_dir.split("://", 1)[-1] + "/"
+
+    for cache in (store.sources, store.bundles):
+        for key in [key for key in cache if key[0] == saltenv]:
+            if key[1].startswith(template_dir + "/"):
+                del cache[key]
+
+    nb_loaded = 0
+    bundle_files = {}
+
+    for cached_file in cached_files:
+        local_path = cached_file.replace(os.sep, "/")
+        # local path is <cachedir>/files/<saltenv>/<relative_dir>/<file>
+        position = local_path.rfind(relative_dir)
+        if position == -1:
+            continue
+
+        file_name = local_path[position:].replace(relative_dir, "", 1)
+        bundle_dir, _, bundle_file = file_name.partition("/")
+        if bundle_dir == BUNDLE_DIR:
+            bundle_files[bundle_file] = cached_file
+            continue
+
+        template_name = "{}/{}".format(template_dir, file_name)
+        with open(cached_file, encoding="utf-8") as fd:
+            source = fd.read()
+
+        store.sources[(saltenv, template_name)] = (_hash_source(source), source)
+        nb_loaded += 1
+
+    if bundle_files:
+        _load_bundles(template_dir, bundle_files, saltenv)
+
+    return nb_loaded
+
+
+def prefetch_directory(template_dir, saltenv, functions, utils):
+    """Fetch all templates of the directory at once, renders are then served from memory.
+
+    The files are cached on the minion by cp.cache_dir, which only downloads those whose hash
+    differs from the master copy. Templates compiled ahead of time are fetched along. The
+    helpers of the templates are registered too (see register_helpers).
+
+    Used by the states, with their loader dunders: utils modules are not given them.
+
+    :param template_dir: directory of the templates (example: salt://states/afk/templates/bgp/eos)
+    :param saltenv: salt environment
+    :param functions: __salt__ of the state, for cp.cache_dir
+    :param utils: __utils__ of the state, for jinja_filters
+    """
+    cached_files = functions["cp.cache_dir"](
+        template_dir, saltenv=saltenv, include_pat=r"E@(\.j2|/compiled/tmpl_\w+\.py)$"
+    )
+    nb_loaded = load_directory(template_dir, cached_files, saltenv)
+    register_helpers(
+        {
+            "deep_get": utils["jinja_filters.deep_get"],
+            "convert_route_map_name": utils["jinja_filters.format_route_policy_name"],
+        }
+    )
+    log.debug("%d templates loaded from %s", nb_loaded, template_dir)
+
+    return nb_loaded
+
+
+def get_source(template_name, saltenv="base"):
+    """Get the source of a template loaded in memory, None if not loaded.
+
+    :param template_name: path of the template (example: salt://states/afk/templates/...)
+    :param saltenv: salt environment
+    """
+    loaded = _get_process_store().sources.get((saltenv, template_name))
+    return loaded[1] if loaded else None
+
+
+def get_template(template_name, source, saltenv="base"):
+    """Get the compiled template, compiling it only if unknown or if its source changed.
+
+    Templates are indexed by salt environment and path, and are invalidated as soon as the
+    hash of the source fetched from the fileserver differs from the compiled one. When compiled,
+    the template is loaded from its bundle if up to date, instead of being parsed.
+
+    :param template_name: path of the template (example: salt://states/afk/templates/...)
+    :param source: content of the template
+    :param saltenv: salt environment
+    """
+    store = _get_process_store()
+    key = (saltenv, template_name)
+
+    # the hash is already known when the source comes from the loaded directories
+    loaded = store.sources.get(key)
+    source_hash = loaded[0] if loaded and loaded[1] is source else _hash_source(source)
+
+    cached = store.templates.get(key)
+    if cached and cached[0] == source_hash:
+        store.stats["hits"] += 1
+        return cached[1]
+
+    store.stats["misses"] += 1
+    environment = _get_environment(saltenv)
+    template = _load_bundled_template(environment, key, source_hash)
+    if template is None:
+        # compiled with its name, for errors to point to the right template
+        template = environment.template_class.from_code(
+            environment,
+            environment.compile(source, name=template_name, filename=template_name),
+            environment.make_globals(None),
+        )
+    store.templates[key] = (source_hash, template)
+
+    return template
+
+
+def iter_lines(chunks, indent=0):
+    """Split a stream of text chunks into lines, without blank lines.
+
+    Chunks are split only when needed: a chunk being a whole line (like a line of an
+    underlying part written by the layout) is yielded as is, without being copied.
+
+    :param chunks: iterable of text chunks (example: output of Template.generate)
+    :param indent: number of spaces to prefix each line with
+    """
+    prefix = " " * indent
+    pending = []
+
+    for chunk in chunks:
+        if "\n" not in chunk:
+            if chunk:
+                pending.append(chunk)
+            continue
+
+        lines = chunk.split("\n")
+        if pending:
+            if lines[0]:
+                pending.append(lines[0])
+            lines[0] = pending[0] if len(pending) == 1 else "".join(pending)
+            pending = []
+
+        last = lines.pop()
+        if last:
+            pending.append(last)
+
+        for line in lines:
+            if line.strip() != "":
+                yield prefix + line if prefix else line
+
+    line = "".join(pending)
+    if line.strip() != "":
+        yield prefix + line if prefix else line
+
+
+def render_lines(template_name, source, context, saltenv="base", indent=0):
+    """Render a template with the given context, as an iterator of lines without blank lines.
+
+    Rendering is streamed: the template is rendered while lines are consumed, so a part can be
+    written line per line by the assembling template without being built as a whole text.
+
+    :param template_name: path of the template (example: salt://states/afk/templates/...)
+    :param source: content of the template
+    :param context: variables available in the template
+    :param saltenv: salt environment
+    :param indent: number of spaces to prefix each line with
+    """
+    recorded = _get_process_store().profile.get()
+    start = time.perf_counter()
+    template = get_template(template_name, source, saltenv)
+    lines = iter_lines(template.generate(context), indent)
+
+    if recorded is not None:
+        return _iter_profiled(recorded, template_name, lines, time.perf_counter() - start)
+
+    return lines
+
+
+def render(template_name, source, context, saltenv="base", indent=0):
+    """Render a template with the given context, without blank lines.
+
+    This is the single place where the text of a configuration is built: lines of all parts
+    are streamed up to here and joined once.
+
+    :param template_name: path of the template (example: salt://states/afk/templates/...)
+    :param source: content of the template
+    :param context: variables available in the template
+    :param saltenv: salt environment
+    :param indent: number of spaces to prefix each line with
+    """
+    return "\n".join(render_lines(template_name, source, context, saltenv, indent))
+
+
+def _iter_profiled(recorded, template_name, lines, elapsed):
+    """Yield the lines of a render, recording its time and output size for the template.
+
+    Only the time spent in the template itself is recorded: parts written by a template are
+    rendered while it is consumed, their time is recorded for their own template.
+    """
+    stats = recorded["templates"].setdefault(
+        template_name, {"renders": 0, "total_time": 0.0, "max_time": 0.0, "bytes": 0}
+    )
+    # time spent in the nested renders, for each render in progress
+    nested = recorded["nested"]
+    size = 0
+
+    try:
+        while True:
+            nested.append(0.0)
+            start = time.perf_counter()
+            try:
+                line = next(lines, None)
+            finally:
+                duration = time.perf_counter() - start
+                elapsed += duration - nested.pop()
+                nested[-1] += duration
+
+            if line is None:
+                break
+            size += len(line.encode("utf-8")) + 1
+            yield line
+    finally:
+        stats["renders"] += 1
+        stats["total_time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+        stats["bytes"] += size
+
+
+def start_profile():
+    """Start recording the renders and the phases of the current run, until stop_profile.
+
+    The profile is recorded for the current thread only, so the jobs of a threaded minion do not
+    record each other's renders. Renders done by worker processes (see render_parallel) are not
+    recorded.
+
+    :return: token of the profile, to stop it
+    """
+    return _get_process_store().profile.set({"templates": {}, "phases": {}, "nested": [0.0]})
+
+
+def stop_profile(token):
+    """Stop recording, and get the renders by template and the duration of the phases.
+
+    Times are in seconds, sizes in bytes (lines are counted with their line feed). The profile
+    recorded before start_profile, if any, is recorded again.
+
+    :param token: token of the profile, as returned by start_profile
+    """
+    profile = _get_process_store().profile
+    recorded = profile.get()
+    profile.reset(token)
+
+    return {"templates": recorded["templates"], "phases": recorded["phases"]}
+
+
+def is_profiling():
+    """Check if the renders and the phases of the current run are recorded (see start_profile)."""
+    return _get_process_store().profile.get() is not None
+
+
+@contextlib.contextmanager
+def profile_phase(name):
+    """Record the duration of a phase of the state run, if profiling.
+
+    :param name: name of the phase (example: global_as), durations of a phase are summed
+    """
+    recorded = _get_process_store().profile.get()
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        if recorded is not None:
+            recorded["phases"][name] = (
+                recorded["phases"].get(name, 0.0) + time.perf_counter() - start
+            )
+
+
+def run_profiled(func, *args, **kwargs):
+    """Run a function while recording the renders and the phases.
+
+    :param func: function to run, with the given arguments
+    :return: result of the function, and the profile (see stop_profile)
+    """
+    token = start_profile()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        recorded = stop_profile(token)
+
+    return result, recorded
+
+
+def _init_worker(parts):
+    """Keep the parts given to render_parallel, in a worker process forked for this call."""
+    _get_process_store().pool_parts = parts
+
+
+def _consume_parts(bounds):
+    """Consume a range of the parts given to render_parallel, in a worker process."""
+    start, end = bounds
+    return [list(part) for part in _get_process_store().pool_parts[start:end]]
+
+
+def render_parallel(parts, workers=1):
+    """Render parts in a pool of worker processes, the lines being returned in the parts order.
+
+    Workers are forked from the current process for this call: they inherit the parts (not
+    started iterators of lines, as returned by render_lines) and the compiled templates, only the
+    lines are sent back. Parts are given to the workers of the call only, so concurrent calls of
+    a threaded minion do not render each other's parts.
+    Parts are rendered in the current process if only one worker is requested, or if processes
+    cannot be forked on this platform.
+
+    :param parts: iterables of lines, independent of each other
+    :param workers: number of worker processes
+    """
+    parts = list(parts)
+    if workers <= 1 or len(parts) < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        return [list(part) for part in parts]
+
+    # several ranges per worker, for the load to be balanced when parts have different sizes
+    range_size = max(1, -(-len(parts) // (workers * 4)))
+    ranges = [(start, start + range_size) for start in range(0, len(parts), range_size)]
+
+    # forked: the parts are inherited by the workers, not pickled
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(parts,),
+    ) as executor:
+        rendered = list(executor.map(_consume_parts, ranges))
+
+    return [lines for lines_range in rendered for lines in lines_range]
+
+
+def cache_stats():
+    """Get hits/misses counters and the number of compiled templates in cache."""
+    store = _get_process_store()
+    return dict(store.stats, size=len(store.templates))
+
+
+def clear_cache():
+    """Drop all loaded sources, compiled templates and environments, and reset the counters."""
+    store = _get_process_store()
+    store.environments.clear()
+    store.sources.clear()
+    store.bundles.clear()
+    store.templates.clear()
+    store.stats.update({"hits": 0, "misses": 0})
+
+
+def build_bundles(file_root, template_dirs=BUNDLED_TEMPLATE_DIRS):
+    """Compile ahead of time all templates of the directories, as Python modules.
+
+    Each template is compiled in the "compiled" sub-directory of its directory, named as by the
+    Jinja ModuleLoader, with the hash of its source and the Jinja version. Compiled templates
+    whose source does not exist anymore are removed.
+
+    :param file_root: local path of the salt file root holding the templates
+    :param template_dirs: directories to compile, relative to the file root
+    """
+    environment = _create_environment()
+    nb_compiled = 0
+
+    for template_dir in template_dirs:
+        for dir_path, dir_names, file_names in os.walk(os.path.join(file_root, template_dir)):
+            if BUNDLE_DIR in dir_names:
+                dir_names.remove(BUNDLE_DIR)
+
+            templates = sorted(file_name for file_name in file_names if file_name.endswith(".j2"))
+            if not templates:
+                continue
+
+            bundle_path = os.path.join(dir_path, BUNDLE_DIR)
+            os.makedirs(bundle_path, exist_ok=True)
+            bundle_files = set()
+
+            for file_name in templates:
+                template_path = os.path.join(dir_path, file_name)
+                template_name = "salt://{}".format(
+                    os.path.relpath(template_path, file_root).replace(os.sep, "/")
+                )
+                with open(template_path, encoding="utf-8") as fd:
+                    source = fd.read()
+
+                # same options than the Jinja ModuleLoader (raw code, deferred init)
+                code = environment.compile(
+                    source, name=template_name, filename=template_name, raw=True, defer_init=True
+                )
+                bundle_file = get_bundle_filename(template_name)
+                with open(os.path.join(bundle_path, bundle_file), "w", encoding="utf-8") as fd:
+                    fd.write(code)
+                    fd.write(
+                        "\nsource_hash = {!r}\njinja_version = {!r}\n".format(
+                            _hash_source(source), jinja2.__version__
+                        )
+                    )
+                bundle_files.add(bundle_file)
+                nb_compiled += 1
+
+            for file_name in os.listdir(bundle_path):
+                if file_name.startswith("tmpl_") and file_name not in bundle_files:
+                    os.remove(os.path.join(bundle_path, file_name))
+
+    return nb_compiled
+
+
+if __name__ == "__main__":
+    print("{} templates compiled".format(build_bundles(sys.argv[1] if len(sys.argv) > 1 else ".")))
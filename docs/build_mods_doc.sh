@@ -1,6 +1,6 @@
 #!/bin/sh
 
-MOD_DIRS='_states _modules _utils'
+MOD_DIRS='_states _modules _utils _runners'
 
 build_stubs() {
     path="../$1"
@@ -19,6 +19,7 @@ sys.path.insert(0, os.path.abspath("../"))
 import sphinx_rtd_theme
 
 import _modules
+import _runners
 import _states
 import _utils
 
@@ -1,29 +1,6 @@
-from jinja2 import BaseLoader, Environment
-from salt.utils import templates as saltTemplates
-
-
-def mock_apply_template_on_contents(contents, template, context, defaults, saltenv):
-    """Remove salt:// prefix in path file."""
-    context_dict = defaults if defaults else {}
-    if context:
-        context_dict.update(context)
-    # Apply templating
-    res = saltTemplates.TEMPLATE_REGISTRY[template](
-        contents,
-        from_str=True,
-        to_str=True,
-        context=context_dict,
-        saltenv=None,
-        grains={},
-        pillar={},
-        salt={},
-        opts={},
-    )["data"]
-    if isinstance(res, bytes):
-        # bytes -> str
-        res = res.decode("utf-8")
-
-    return res
+import fnmatch
+import os
+import re
 
 
 def mock_get_file_str(template_name, *_, **__):
@@ -32,3 +9,19 @@ def mock_get_file_str(template_name, *_, **__):
     with open(template_name, encoding="utf-8") as fd:
         content = fd.read()
         return content
+
+
+def mock_cache_dir(path, *_, include_pat=None, **__):
+    """Remove salt:// prefix in path dir, and list files as if cached from the master."""
+    directory = path[7:]
+    cached_files = []
+    for dir_path, dir_names, file_names in os.walk(directory):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            cached_files.append(os.path.join(dir_path, file_name))
+
+    if not include_pat:
+        return cached_files
+    if include_pat.startswith("E@"):
+        return [path for path in cached_files if re.search(include_pat[2:], path)]
+    return [path for path in cached_files if fnmatch.fnmatch(path, include_pat)]
@@ -0,0 +1,17 @@
+"""Common fixtures."""
+
+import pytest
+
+import _utils.jinja_filters as JINJA_FILTERS
+import _utils.jinja_render as JINJA_RENDER
+
+
+@pytest.fixture(autouse=True)
+def _register_helpers():
+    """Register the helpers of the templates, as done by the states before rendering."""
+    JINJA_RENDER.register_helpers(
+        {
+            "deep_get": JINJA_FILTERS.deep_get,
+            "convert_route_map_name": JINJA_FILTERS.format_route_policy_name,
+        }
+    )
@@ -0,0 +1,439 @@
+"""Unit tests of criteo_bgp execution module, with canned device outputs."""
+
+import json
+import re
+from xml.etree import ElementTree
+
+import pytest
+from salt.exceptions import CommandExecutionError
+
+import _modules.criteo_bgp as MODULE
+import _utils.bgp_neighbors as NEIGHBORS_UTIL
+
+DATA_PATH = "tests/modules/data"
+
+# neighbors of the canned outputs, as returned by get_neighbors before the device paths were
+# rewritten (napalm bgp.neighbors and get_bgp_extra_info)
+JUNOS_NEIGHBORS = [
+    {
+        "remote_as": 65001,
+        "local_as": 65000,
+        "remote_address": "192.0.2.1",
+        "vrf": "global",
+        "export_policy": "RM-TOR-OUT",
+        "import_policy": "RM-TOR-IN",
+        "peer_group": "PG-TOR",
+        "description": "VAL:PG-TOR:tor1.dc1",
+        "state": "up",
+    },
+    {
+        "remote_as": 65002,
+        "local_as": 65000,
+        "remote_address": "2001:db8::1",
+        "vrf": "prod",
+        "export_policy": "",
+        "import_policy": "",
+        "peer_group": "PG-PROD",
+        "description": None,
+        "state": "down",
+    },
+]
+
+
+def _read_data(file_name):
+    with open("{}/{}".format(DATA_PATH, file_name), encoding="utf-8") as fd:
+        return fd.read()
+
+
+def _mock_junos_rpc(get):
+    """Mock napalm.call("_rpc"), the reply is serialized by napalm (bytes)."""
+    if get.startswith("<get-bgp-group-information>"):
+        return {"result": True, "out": _read_data("junos_bgp_groups.xml").encode("utf-8")}
+
+    reply = ElementTree.fromstring(_read_data("junos_bgp_neighbors.xml"))
+    address = re.search(r"<neighbor-address>(.*)</neighbor-address>", get)
+    if address:
+        for information in reply:
+            for peer in list(information):
+                if peer.findtext("{*}peer-address").split("+")[0] != address.group(1):
+                    information.remove(peer)
+
+    return {"result": True, "out": ElementTree.tostring(reply)}
+
+
+def _mock_module(mocker, nos, salt_functions):
+    MODULE.__salt__ = dict(
+        salt_functions, **{"grains.get": mocker.Mock(side_effect=lambda name, *_: nos)}
+    )
+    MODULE.__utils__ = {
+        "bgp_neighbors.get_address_afi": NEIGHBORS_UTIL.get_address_afi,
+        "bgp_neighbors.get_address_key": NEIGHBORS_UTIL.get_address_key,
+        "bgp_neighbors.filter_in_network": NEIGHBORS_UTIL.filter_in_network,
+        "bgp_neighbors.group_by_network": NEIGHBORS_UTIL.group_by_network,
+        "bgp_neighbors.make_neighbor": NEIGHBORS_UTIL.make_neighbor,
+    }
+
+
+def _clean_module():
+    del MODULE.__salt__
+    del MODULE.__utils__
+
+
+@pytest.fixture(name="junos")
+def fixture_junos(mocker):
+    """JunOS device, replying to the RPCs with the canned XML."""
+    rpc = mocker.Mock(side_effect=lambda _, get: _mock_junos_rpc(get))
+    _mock_module(mocker, "junos", {"napalm.call": rpc})
+    yield rpc
+    _clean_module()
+
+
+def test_get_neighbors__junos(junos):
+    """Test the neighbors parsed from the RPC replies, with the peer group of the index."""
+    assert MODULE.get_neighbors() == {"result": JUNOS_NEIGHBORS}
+    assert [call.kwargs["get"] for call in junos.call_args_list] == [
+        "<get-bgp-neighbor-information></get-bgp-neighbor-information>",
+        "<get-bgp-group-information></get-bgp-group-information>",
+    ]
+
+
+def test_get_neighbors__junos_text_reply(junos):
+    """Test replies as text are parsed too."""
+    junos.side_effect = lambda _, get: dict(
+        _mock_junos_rpc(get), out=_mock_junos_rpc(get)["out"].decode("utf-8")
+    )
+
+    assert MODULE.get_neighbors(compact=True) == {"result": JUNOS_NEIGHBORS}
+
+
+def test_get_neighbors__junos_filtered(junos):
+    """Test small networks are filtered by the device, larger ones here, like the baseline."""
+    assert MODULE.get_neighbors("192.0.2.0/31") == {"result": JUNOS_NEIGHBORS[:1]}
+    assert [call.kwargs["get"] for call in junos.call_args_list] == [
+        "<get-bgp-neighbor-information><neighbor-address>{}</neighbor-address>"
+        "</get-bgp-neighbor-information>".format(address)
+        for address in ["192.0.2.0", "192.0.2.1"]
+    ]
+
+    junos.reset_mock()
+    assert MODULE.get_neighbors("2001:db8::/64") == {"result": JUNOS_NEIGHBORS[1:]}
+    assert junos.call_args_list[0].kwargs["get"] == (
+        "<get-bgp-neighbor-information></get-bgp-neighbor-information>"
+    )
+
+    result = MODULE.get_neighbors("192.0.2.1/32", dict_per_address=True)["result"]
+    assert result == {"192.0.2.1": JUNOS_NEIGHBORS[0]}
+
+
+def test_get_neighbors__junos_unknown_neighbor(junos):
+    """Test the lookup of an unknown neighbor address, an RPC error, returns no neighbor."""
+    junos.side_effect = lambda _, get: (
+        {"result": False, "comment": "RPC error", "out": None}
+        if "<neighbor-address>192.0.2.0</neighbor-address>" in get
+        else _mock_junos_rpc(get)
+    )
+
+    assert MODULE.get_neighbors("192.0.2.0/31") == {"result": JUNOS_NEIGHBORS[:1]}
+
+
+def test_get_neighbors__junos_failed_rpc(junos):
+    """Test a failed RPC is an error, not a device without neighbors or policies."""
+    junos.side_effect = lambda *_, **__: {"result": False, "comment": "RPC timeout", "out": None}
+
+    with pytest.raises(CommandExecutionError, match="RPC timeout"):
+        MODULE.get_neighbors()
+    with pytest.raises(CommandExecutionError, match="RPC timeout"):
+        MODULE.get_route_policy_inventory()
+    with pytest.raises(CommandExecutionError, match="RPC timeout"):
+        MODULE.get_bgp_extra_info()
+
+
+def test_get_neighbors__junos_group_mapping(junos):
+    """Test the group mapping is requested once per call, and not kept for the next ones."""
+    junos.side_effect = lambda _, get: dict(
+        _mock_junos_rpc(get),
+        out=_mock_junos_rpc(get)["out"].replace(
+            b"<peer-group>PG-TOR</peer-group>", b"<group-index>0</group-index>"
+        ),
+    )
+
+    assert MODULE.get_neighbors() == {"result": JUNOS_NEIGHBORS}
+    assert junos.call_count == 2
+    assert MODULE.get_neighbors() == {"result": JUNOS_NEIGHBORS}
+    assert junos.call_count == 4
+
+
+EOS_NEIGHBORS = [
+    {
+        "remote_as": 65001,
+        "local_as": 65000,
+        "remote_address": "192.0.2.3",
+        "vrf": "global",
+        "export_policy": "RM-TOR-OUT",
+        "import_policy": "RM-TOR-IN",
+        "peer_group": "PG-TOR",
+        "description": "VAL:PG-TOR:tor2.dc1",
+        "state": "up",
+    },
+    {
+        "remote_as": 65002,
+        "local_as": 65010,
+        "remote_address": "2001:db8::3",
+        "vrf": "prod",
+        "export_policy": "",
+        "import_policy": "",
+        "peer_group": None,
+        "description": None,
+        "state": "down",
+    },
+]
+
+
+def _mock_eos_commands(*commands):
+    """Mock napalm.pyeapi_run_commands, with one JSON output per command."""
+    outputs = []
+    for command in commands:
+        if command == MODULE.EOS_BGP_SUMMARY_COMMAND:
+            outputs.append({"vrfs": {"default": {"asn": "65000"}}})
+            continue
+
+        neighbors = json.loads(_read_data("eos_bgp_neighbors.json"))
+        address = re.match(r"show ip bgp neighbors (\S+) vrf all", command)
+        if address:
+            for vrf_info in neighbors["vrfs"].values():
+                vrf_info["peerList"] = [
+                    peer for peer in vrf_info["peerList"] if peer["peerAddress"] == address.group(1)
+                ]
+        outputs.append(neighbors)
+
+    return outputs
+
+
+@pytest.fixture(name="eos")
+def fixture_eos(mocker):
+    """EOS device, replying to the eAPI commands with the canned JSON."""
+    run_commands = mocker.Mock(side_effect=_mock_eos_commands)
+    _mock_module(mocker, "eos", {"napalm.pyeapi_run_commands": run_commands})
+    yield run_commands
+    _clean_module()
+
+
+def test_get_neighbors__eos(eos):
+    """Test the neighbors parsed from one batched eAPI request, like the baseline."""
+    assert MODULE.get_neighbors() == {"result": EOS_NEIGHBORS}
+    eos.assert_called_once_with(MODULE.EOS_BGP_SUMMARY_COMMAND, MODULE.EOS_BGP_NEIGHBORS_COMMAND)
+
+    assert MODULE.get_neighbors(compact=True) == {"result": EOS_NEIGHBORS}
+
+
+def test_get_neighbors__eos_filtered(eos):
+    """Test small networks are filtered by the device, in the same batch as the summary."""
+    assert MODULE.get_neighbors("192.0.2.2/31") == {"result": EOS_NEIGHBORS[:1]}
+    eos.assert_called_once_with(
+        MODULE.EOS_BGP_SUMMARY_COMMAND,
+        "show ip bgp neighbors 192.0.2.2 vrf all",
+        "show ip bgp neighbors 192.0.2.3 vrf all",
+    )
+
+    assert MODULE.get_neighbors("2001:db8::/64") == {"result": EOS_NEIGHBORS[1:]}
+
+
+@pytest.mark.parametrize("nos", ["junos", "eos"])
+@pytest.mark.parametrize(
+    "cidrs",
+    [
+        ["192.0.2.0/31", "192.0.2.2/31", "198.51.100.0/31"],
+        ["192.0.2.0/24", "192.0.2.2/31", "2001:db8::/32", "10.0.0.0/8"],
+    ],
+    ids=["filtered", "unfiltered"],
+)
+def test_get_neighbors__per_cidr(request, nos, cidrs):
+    """Test neighbors grouped by CIDR are the neighbors of each CIDR, with overlapping CIDRs."""
+    request.getfixturevalue(nos)
+    expected = {cidr: MODULE.get_neighbors(cidr)["result"] for cidr in cidrs}
+    assert any(expected.values())
+
+    assert MODULE.get_neighbors(cidrs) == {"result": expected}
+    assert MODULE.get_neighbors(tuple(cidrs), compact=True) == {"result": expected}
+
+    indexes = MODULE.get_neighbors(cidrs, dict_per_address=True)["result"]
+    assert list(indexes) == cidrs
+    for cidr, neighbors in expected.items():
+        assert indexes[cidr] == {neighbor["remote_address"]: neighbor for neighbor in neighbors}
+
+
+@pytest.mark.parametrize("nos", ["junos", "eos", "sonic"])
+@pytest.mark.parametrize(
+    "local_cidr", [None, "192.0.2.0/24", ["192.0.2.0/31", "2001:db8::/32"]], ids=str
+)
+@pytest.mark.parametrize("dict_per_address", [False, True])
+@pytest.mark.parametrize("compact", [False, True])
+def test_get_neighbors__serializable(request, nos, local_cidr, dict_per_address, compact):
+    """Test the neighbors are plain data, serialized as is by the outputters and returners."""
+    request.getfixturevalue(nos)
+    result = MODULE.get_neighbors(local_cidr, dict_per_address=dict_per_address, compact=compact)
+
+    assert json.loads(json.dumps(result)) == result
+
+
+def test_get_neighbors__per_cidr_one_request(eos):
+    """Test the addresses of all the small CIDRs are requested in the same batch."""
+    result = MODULE.get_neighbors(["192.0.2.2/31", "2001:db8::2/127"])["result"]
+
+    assert result == {"192.0.2.2/31": EOS_NEIGHBORS[:1], "2001:db8::2/127": EOS_NEIGHBORS[1:]}
+    eos.assert_called_once_with(
+        MODULE.EOS_BGP_SUMMARY_COMMAND,
+        "show ip bgp neighbors 192.0.2.2 vrf all",
+        "show ip bgp neighbors 192.0.2.3 vrf all",
+        "show ip bgp neighbors 2001:db8::2 vrf all",
+        "show ip bgp neighbors 2001:db8::3 vrf all",
+    )
+
+
+# sessions returned by the sonic module, as is
+SONIC_NEIGHBORS = list(json.loads(_read_data("sonic_bgp_neighbors.json")).values())
+
+
+def _mock_frr_commands(*commands):
+    """Mock frr_session.run_json_commands, with the canned neighbor of each command."""
+    outputs = []
+    for command in commands:
+        address = re.match(r"show bgp vrf all neighbors (\S+) json", command).group(1)
+        output = json.loads(_read_data("sonic_frr_neighbors.json"))
+        for vrf_info in output.values():
+            for key in [key for key in vrf_info if key not in ["vrfId", "vrfName", address]]:
+                del vrf_info[key]
+            vrf_info.setdefault(address, {"bgpNoSuchNeighbor": True})
+        outputs.append(output)
+
+    return outputs
+
+
+@pytest.fixture(name="sonic")
+def fixture_sonic(mocker):
+    """SONiC device, with the canned neighbors of the sonic module and of FRR."""
+    _mock_module(
+        mocker,
+        "sonic",
+        {
+            "sonic.get_bgp_neighbors": mocker.Mock(
+                side_effect=lambda: json.loads(_read_data("sonic_bgp_neighbors.json"))
+            )
+        },
+    )
+    MODULE.__utils__["frr_session.run_json_commands"] = mocker.Mock(side_effect=_mock_frr_commands)
+    yield MODULE.__salt__["sonic.get_bgp_neighbors"]
+    _clean_module()
+
+
+def test_get_neighbors__sonic(sonic):
+    """Test the neighbors of the sonic module are returned as is, with their VRF names."""
+    assert MODULE.get_neighbors() == {"result": SONIC_NEIGHBORS}
+    assert MODULE.get_neighbors("192.0.2.0/24") == {"result": SONIC_NEIGHBORS[:1]}
+    assert MODULE.get_neighbors(compact=True) == {
+        "result": [NEIGHBORS_UTIL.make_neighbor(**neighbor) for neighbor in SONIC_NEIGHBORS]
+    }
+    sonic.assert_called()
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize(
+    "small_cidr,large_cidr,frr_fields",
+    [
+        (
+            "192.0.2.4/31",
+            "192.0.2.0/24",
+            {"peer_group": "PG-TOR", "description": "VAL:PG-TOR:tor5.dc1"},
+        ),
+        ("2001:db8::4/127", "2001:db8::/64", {"peer_group": None, "description": None}),
+    ],
+)
+def test_get_neighbors__sonic_filtered(sonic, compact, small_cidr, large_cidr, frr_fields):
+    """Test the neighbors filtered by FRR are the unfiltered ones, with their peer group too."""
+    filtered = MODULE.get_neighbors(small_cidr, compact=compact)["result"]
+    sonic.assert_not_called()
+    unfiltered = MODULE.get_neighbors(large_cidr, compact=compact)["result"]
+    sonic.assert_called_once()
+
+    assert len(unfiltered) == 1
+    assert filtered == [{**unfiltered[0], **frr_fields}]
+
+
+JUNOS_POLICIES = """<rpc-reply><configuration><policy-options>
+<policy-statement><name>PS-TOR-IN</name>
+<term><name>10</name><then><accept/></then></term></policy-statement>
+<policy-statement><name>PS-TOR-OUT</name>
+<term><name>10</name><then><reject/></then></term></policy-statement>
+</policy-options></configuration></rpc-reply>"""
+
+
+def test_get_route_policy_inventory__junos(junos):
+    """Test a digest per committed policy-statement, changed with its content only."""
+    junos.side_effect = lambda _, get: {"result": True, "out": JUNOS_POLICIES.encode("utf-8")}
+
+    inventory = MODULE.get_route_policy_inventory()
+    assert sorted(inventory) == ["PS-TOR-IN", "PS-TOR-OUT"]
+    assert inventory["PS-TOR-IN"] != inventory["PS-TOR-OUT"]
+    assert '<get-configuration database="committed">' in junos.call_args.kwargs["get"]
+
+    # same content, other layout
+    junos.side_effect = lambda _, get: {
+        "result": True,
+        "out": JUNOS_POLICIES.replace("\n", "\n  ").encode("utf-8"),
+    }
+    assert MODULE.get_route_policy_inventory() == inventory
+    junos.side_effect = lambda _, get: {
+        "result": True,
+        "out": JUNOS_POLICIES.replace("<reject/>", "<accept/>").encode("utf-8"),
+    }
+    assert MODULE.get_route_policy_inventory()["PS-TOR-IN"] == inventory["PS-TOR-IN"]
+    assert MODULE.get_route_policy_inventory()["PS-TOR-OUT"] != inventory["PS-TOR-OUT"]
+
+    assert MODULE.get_route_map_list() == ["PS-TOR-IN", "PS-TOR-OUT"]
+    assert "<policy-statement><name/></policy-statement>" in junos.call_args.kwargs["get"]
+
+
+def test_get_route_policy_inventory__eos(eos):
+    """Test a digest per route-map, whatever the order of the JSON keys."""
+    route_maps = {
+        "RM-TOR-OUT": {"entries": {"10": {"filterType": "deny", "matchRules": {}}}},
+        "RM-TOR-IN": {"entries": {"10": {"filterType": "permit", "matchRules": {}}}},
+    }
+    eos.side_effect = lambda *_: [{"routeMaps": route_maps}]
+
+    inventory = MODULE.get_route_policy_inventory()
+    assert list(inventory) == ["RM-TOR-IN", "RM-TOR-OUT"]
+    eos.assert_called_with(MODULE.EOS_ROUTE_MAP_COMMAND)
+
+    route_maps["RM-TOR-IN"] = {"entries": {"10": {"matchRules": {}, "filterType": "permit"}}}
+    assert MODULE.get_route_policy_inventory() == inventory
+    route_maps["RM-TOR-OUT"]["entries"]["10"]["filterType"] = "permit"
+    assert MODULE.get_route_policy_inventory()["RM-TOR-OUT"] != inventory["RM-TOR-OUT"]
+
+    assert MODULE.get_route_map_list() == ["RM-TOR-IN", "RM-TOR-OUT"]
+
+
+def test_get_route_policy_inventory__sonic(sonic, mocker):  # pylint: disable=W0613
+    """Test a digest per FRR route-map, without its counters."""
+    route_maps = {
+        "RM-TOR-IN": {
+            "invoked": 12,
+            "rules": [{"sequenceNumber": 10, "type": "permit", "invoked": 12}],
+        },
+        "RM-TOR-OUT": {"invoked": 0, "rules": [{"sequenceNumber": 10, "type": "deny"}]},
+    }
+    MODULE.__utils__["frr_session.run_json_commands"].side_effect = lambda *_: [
+        {"bgpd": route_maps}
+    ]
+    MODULE.__salt__["sonic.get_route_maps"] = mocker.Mock(return_value=["RM-TOR-OUT", "RM-TOR-IN"])
+
+    inventory = MODULE.get_route_policy_inventory()
+    assert list(inventory) == ["RM-TOR-IN", "RM-TOR-OUT"]
+
+    route_maps["RM-TOR-IN"]["invoked"] = 15
+    route_maps["RM-TOR-IN"]["rules"][0]["invoked"] = 15
+    assert MODULE.get_route_policy_inventory() == inventory
+    route_maps["RM-TOR-IN"]["rules"][0]["type"] = "deny"
+    assert MODULE.get_route_policy_inventory()["RM-TOR-IN"] != inventory["RM-TOR-IN"]
+
+    assert MODULE.get_route_map_list() == ["RM-TOR-IN", "RM-TOR-OUT"]
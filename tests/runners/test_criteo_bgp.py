@@ -0,0 +1,191 @@
+"""Unit tests of criteo_bgp runner."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pytest
+
+import _runners.criteo_bgp as RUNNER_MOD
+import _utils.bgp_neighbors as NEIGHBORS_UTIL
+
+
+def _neighbor(remote_address, local_as, remote_as, **fields):
+    return NEIGHBORS_UTIL.make_neighbor(
+        remote_address=remote_address,
+        local_as=local_as,
+        remote_as=remote_as,
+        vrf=fields.get("vrf", "global"),
+        import_policy=fields.get("import_policy", "RM-IN"),
+        export_policy=fields.get("export_policy", "RM-OUT"),
+        peer_group="FABRIC",
+        description="",
+        state=fields.get("state", "up"),
+    )
+
+
+# canned get_neighbors of the stand-in minions
+_MINIONS_NEIGHBORS = {
+    "spine1": [
+        _neighbor("192.0.2.1", 65000, 65001),
+        _neighbor("192.0.2.3", 65000, 65002, state="down"),
+        _neighbor("2001:db8::1", 65000, 65001),
+        _neighbor("198.51.100.1", 65000, 65100),
+    ],
+    "tor1": [
+        _neighbor("192.0.2.0", 65001, 65000),
+        _neighbor("2001:DB8:0::", 65001, 65000, export_policy=None),
+    ],
+    "tor2": [_neighbor("192.0.2.2", 65002, 65099)],
+}
+
+
+class _FakeLocalClient:
+    """Run the stand-in minions in threads, as many at a time as the batch size."""
+
+    def __init__(self, minions, delay=0.01):
+        self.minions = minions
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _run_minion(self, minion):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+
+        if isinstance(self.minions[minion], Exception):
+            return {minion: str(self.minions[minion])}
+        return {minion: {"out": "nested", "result": self.minions[minion]}}
+
+    def cmd_batch(self, tgt, fun, kwarg=None, tgt_type="glob", batch="10%", **kwargs):
+        self.calls.append((tgt, fun, kwarg, tgt_type, batch, kwargs))
+        with ThreadPoolExecutor(max_workers=int(batch)) as executor:
+            futures = [executor.submit(self._run_minion, minion) for minion in self.minions]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+@pytest.fixture(name="client")
+def fixture_client(mocker):
+    client = _FakeLocalClient(_MINIONS_NEIGHBORS)
+    mocker.patch("_runners.criteo_bgp.salt.client.get_local_client", return_value=client)
+    RUNNER_MOD.__opts__ = {"conf_file": "/etc/salt/master"}
+    yield client
+    del RUNNER_MOD.__opts__
+
+
+def _get_session(result, address):
+    return next(session for session in result["sessions"] if address in session["addresses"])
+
+
+def test_audit_sessions(client):
+    """Test both ends of the sessions are joined, and their mismatches reported."""
+    result = RUNNER_MOD.audit_sessions("*", concurrency=2)
+
+    assert client.calls == [
+        ("*", "criteo_bgp.get_neighbors", {"compact": True}, "glob", "2", {}),
+    ]
+    assert result["summary"] == {"sessions": 4, "issues": 3, "unreachable": 0}
+
+    session = _get_session(result, "192.0.2.1")
+    assert session["addresses"] == ["192.0.2.0", "192.0.2.1"]
+    assert {session["local"]["minion"], session["remote"]["minion"]} == {"spine1", "tor1"}
+    assert not any(session["issues"].values())
+
+    session = _get_session(result, "192.0.2.3")
+    assert session["issues"] == {
+        "missing_end": False,
+        "duplicate_end": False,
+        "state_mismatch": True,
+        "as_mismatch": True,
+        "policy_mismatch": False,
+    }
+
+    # same session, whatever the text form of the address
+    session = _get_session(result, "2001:db8::1")
+    assert session["addresses"] == ["2001:db8::", "2001:db8::1"]
+    assert session["issues"]["policy_mismatch"]
+    assert not session["issues"]["as_mismatch"]
+
+    session = _get_session(result, "198.51.100.1")
+    assert session["issues"] == {"missing_end": True, "duplicate_end": False}
+    assert session["remote"] is None
+    assert session["local"]["local_address"] == "198.51.100.0"
+
+
+def test_audit_sessions__concurrency(client):
+    """Test no more minions than the concurrency are requested at the same time."""
+    client.minions = {"tor{}".format(index): [] for index in range(20)}
+
+    result = RUNNER_MOD.audit_sessions("tor*", concurrency=4, timeout=30)
+
+    assert client.calls[0][4:] == ("4", {"timeout": 30})
+    assert 1 < client.max_running <= 4
+    assert result["summary"] == {"sessions": 0, "issues": 0, "unreachable": 0}
+
+
+def test_audit_sessions__unreachable(client):
+    """Test minions without neighbors are reported, and only issues can be kept."""
+    client.minions = dict(_MINIONS_NEIGHBORS, tor2=Exception("Minion did not return."))
+
+    result = RUNNER_MOD.audit_sessions("*", only_issues=True)
+
+    assert result["unreachable"] == {"tor2": "Minion did not return."}
+    assert [session["addresses"] for session in result["sessions"]] == [
+        ["192.0.2.2", "192.0.2.3"],
+        ["198.51.100.0", "198.51.100.1"],
+        ["2001:db8::", "2001:db8::1"],
+    ]
+    assert result["summary"] == {"sessions": 4, "issues": 3, "unreachable": 1}
+
+
+def test_session_join__unnumbered():
+    """Test neighbors which are not IP addresses are reported alone."""
+    join = RUNNER_MOD.SessionJoin()
+    join.add_neighbors("leaf1", [{"remote_address": "Ethernet0", "state": "up"}])
+
+    (session,) = join.get_view()["sessions"]
+    assert session["addresses"] == ["leaf1", "Ethernet0"]
+    assert session["local"]["local_address"] is None
+    assert session["issues"] == {"missing_end": True, "duplicate_end": False}
+
+
+def test_session_join__vrf():
+    """Test the sessions of the same addresses in different VRFs are not joined."""
+    join = RUNNER_MOD.SessionJoin()
+    join.add_neighbors("spine1", [_neighbor("192.0.2.1", 65000, 65001, vrf="prod")])
+    join.add_neighbors("tor1", [_neighbor("192.0.2.0", 65001, 65000, vrf="dev")])
+    # the default VRF is named "default" on SONiC
+    join.add_neighbors("spine2", [_neighbor("192.0.2.5", 65000, 65003)])
+    join.add_neighbors("tor3", [_neighbor("192.0.2.4", 65003, 65000, vrf="default")])
+
+    sessions = join.get_view()["sessions"]
+
+    assert [(session["vrf"], session["addresses"]) for session in sessions] == [
+        ("dev", ["192.0.2.0", "192.0.2.1"]),
+        ("global", ["192.0.2.4", "192.0.2.5"]),
+        ("prod", ["192.0.2.0", "192.0.2.1"]),
+    ]
+    assert [session["issues"]["missing_end"] for session in sessions] == [True, False, True]
+
+
+def test_session_join__duplicate_end():
+    """Test an end claimed by two minions is reported, instead of replacing the first one."""
+    join = RUNNER_MOD.SessionJoin()
+    join.add_neighbors("spine1", [_neighbor("192.0.2.1", 65000, 65001)])
+    join.add_neighbors("tor1", [_neighbor("192.0.2.0", 65001, 65000)])
+    join.add_neighbors("tor9", [_neighbor("192.0.2.0", 65009, 65000)])
+
+    (session,) = join.get_view(only_issues=True)["sessions"]
+
+    assert session["local"]["minion"] == "spine1"
+    assert session["remote"]["minion"] == "tor1"
+    assert [end["minion"] for end in session["duplicates"]] == ["tor9"]
+    assert session["issues"]["duplicate_end"]
+    assert not session["issues"]["as_mismatch"]
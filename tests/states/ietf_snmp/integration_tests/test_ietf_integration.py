@@ -5,8 +5,8 @@ import json
 import pytest
 
 import _states.ietf_snmp as STATE_MOD
-from _utils import frr_detect_diff, jinja_filters
-from jinja2 import BaseLoader, Environment
+from _utils import device_cache, frr_detect_diff, jinja_filters, jinja_render
+from tests.common import mock_cache_dir
 
 ##
 # Tests setup
@@ -30,13 +30,6 @@ def _get_data_and_expected_result(os_name):
     return fake_data, expected_result
 
 
-def _mock_apply_template_on_contents(contents, template, context, *_, **__):
-    assert template == "jinja"
-    loader = Environment(loader=BaseLoader)
-    template = loader.from_string(contents)
-    return template.render(**context)
-
-
 def _mock_get_file_str(template_name, *_, **__):
     # removing salt:// prefix in path file
     template_name = template_name[7:]
@@ -47,15 +40,25 @@ def _mock_get_file_str(template_name, *_, **__):
 
 def _apply_common_mock():
     STATE_MOD.__salt__ = {
-        "file.apply_template_on_contents": _mock_apply_template_on_contents,
         "cp.get_file_str": _mock_get_file_str,
+        "cp.cache_dir": mock_cache_dir,
         "eos.get_bgp_config": lambda *_: (""),
     }
     STATE_MOD.__utils__ = {
+        "device_cache.invalidate": device_cache.invalidate,
         "frr_detect_diff.get_objects": frr_detect_diff.get_objects,
         "jinja_filters.format_route_policy_name": jinja_filters.format_route_policy_name,
         "jinja_filters.deep_get": jinja_filters.deep_get,
+        "jinja_render.render": jinja_render.render,
+        "jinja_render.is_profiling": jinja_render.is_profiling,
+        "jinja_render.profile_phase": jinja_render.profile_phase,
+        "jinja_render.run_profiled": jinja_render.run_profiled,
+        "jinja_render.get_source": jinja_render.get_source,
+        "jinja_render.load_directory": jinja_render.load_directory,
+        "jinja_render.prefetch_directory": jinja_render.prefetch_directory,
+        "jinja_render.register_helpers": jinja_render.register_helpers,
     }
+    STATE_MOD.__context__ = {}
 
 
 def _mock_then_clean(func):
@@ -68,6 +71,7 @@ def _mock_then_clean(func):
         finally:
             # some cleaning
             del STATE_MOD.__salt__
+            del STATE_MOD.__context__
 
     return wrapper
 
@@ -85,3 +89,28 @@ def test_apply__generate_routing_policy_config__full_config(mocker, os):  # pyli
     mocker.patch("_states.ietf_snmp._get_os", return_value=os)
     fake_data, expected_result = _get_data_and_expected_result(os)
     assert STATE_MOD._generate_snmp_config(fake_data, None, saltenv="base") == expected_result
+
+
+@_mock_then_clean
+def test_apply__profile(mocker):
+    """Test renders and phases are returned in the state return when profiling."""
+    mocker.patch("_states.ietf_snmp._get_os", return_value="eos")
+    fake_data, expected_result = _get_data_and_expected_result("eos")
+    load_config = mocker.Mock(return_value={"result": True, "comment": "", "diff": ""})
+    STATE_MOD.__salt__["net.load_config"] = load_config
+    STATE_MOD.__opts__ = {"test": False}
+
+    try:
+        ret = STATE_MOD.apply("snmp", ietf_config=fake_data, profile=True)
+    finally:
+        del STATE_MOD.__opts__
+
+    load_config.assert_called_once_with(text=expected_result, test=False, debug=True)
+    assert ret["result"] is True
+    assert set(ret["profile"]["phases"]) == {"templates_fetch", "assembly", "push"}
+    assert ret["profile"]["templates"]["salt://states/afk/templates/snmp/eos/snmp.j2"] == {
+        "renders": 1,
+        "total_time": mocker.ANY,
+        "max_time": mocker.ANY,
+        "bytes": len(expected_result.encode("utf-8")) + 1,
+    }
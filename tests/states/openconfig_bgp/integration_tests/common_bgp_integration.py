@@ -1,5 +1,7 @@
 import json
 
+import _utils.bgp_neighbors as NEIGHBORS_UTIL
+
 
 def assert_expected_integration_result(scenario, os_name):
     """Get data and compare to expected results."""
@@ -19,7 +21,7 @@ def assert_expected_integration_result(scenario, os_name):
     return fake_data, expected_result
 
 
-def mock_get_neighbors(dict_per_address=False):
+def mock_get_neighbors(dict_per_address=False, compact=False):
     """Mock criteo_bgp.get_neighbors."""
     file_path = "tests/states/openconfig_bgp/data"
     if dict_per_address:
@@ -28,4 +30,11 @@ def mock_get_neighbors(dict_per_address=False):
         file_path += "/installed_bgp_neighbors.json"
 
     with open(file_path, encoding="utf-8") as fd:
-        return json.load(fd)
+        neighbors = json.load(fd)
+
+    if compact and not dict_per_address:
+        neighbors["result"] = [
+            NEIGHBORS_UTIL.make_neighbor(**neighbor) for neighbor in neighbors["result"]
+        ]
+
+    return neighbors
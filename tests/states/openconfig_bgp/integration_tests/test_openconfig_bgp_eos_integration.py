@@ -1,4 +1,7 @@
 """integration test of openconfig_bgp for EOS."""
+
+import copy
+
 import pytest
 
 import _states.openconfig_bgp as STATE_MOD
@@ -62,3 +65,158 @@ def test__apply__generate_bgp_config__with_extras_eos(mocker):  # pylint: disabl
         )
         == expected_result
     )
+
+
+@salt_bgp_mock("eos")
+def test_apply__generate_bgp_config__templates_prefetched_eos(mocker):  # pylint: disable=W0613
+    """Test all templates are served from the prefetched directory, not from the fileserver."""
+    fake_data, expected_result = assert_expected_integration_result("full_config", "eos")
+    mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
+    get_file_str = mocker.Mock()
+    STATE_MOD.__salt__["cp.get_file_str"] = get_file_str
+
+    assert (
+        STATE_MOD._generate_bgp_config(
+            fake_data["bgp"], remove_extras=False, rules=None, saltenv="base"
+        )
+        == expected_result
+    )
+    get_file_str.assert_not_called()
+
+
+@salt_bgp_mock("eos")
+def test_apply__generate_bgp_config__single_pass_eos(mocker):  # pylint: disable=W0613
+    """Test each configuration part is streamed once, already indented, in one BGP template pass."""
+    fake_data, expected_result = assert_expected_integration_result("with_extras", "eos")
+    mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
+    render = mocker.Mock(wraps=STATE_MOD.__utils__["jinja_render.render"])
+    render_lines = mocker.Mock(wraps=STATE_MOD.__utils__["jinja_render.render_lines"])
+    STATE_MOD.__utils__["jinja_render.render"] = render
+    STATE_MOD.__utils__["jinja_render.render_lines"] = render_lines
+
+    assert (
+        STATE_MOD._generate_bgp_config(
+            fake_data["bgp"], remove_extras=True, rules=None, saltenv="base"
+        )
+        == expected_result
+    )
+
+    # the text is built once, by the BGP template writing the lines of all parts
+    render.assert_called_once()
+    assert render.call_args.args[0].endswith("/bgp.j2")
+
+    rendered = [call.args[0].rsplit("/", 1)[-1] for call in render_lines.call_args_list]
+    nb_assets = len(fake_data["bgp"]["neighbors"]["neighbor"]) + len(
+        fake_data["bgp"].get("peer-groups", {}).get("peer-group", [])
+    )
+    assert rendered.count("neighbor_removal.j2") == 1
+    # at most once per asset and SAFI, neighbors of the same shape sharing the render
+    assert 0 < rendered.count("safi.j2") <= 2 * nb_assets
+    assert {call.args[4] for call in render_lines.call_args_list} == {4, 8}
+
+
+@salt_bgp_mock("eos")
+def test_apply__generate_bgp_config__workers_eos(mocker):  # pylint: disable=W0613
+    """Test the config rendered by worker processes is the same than rendered sequentially."""
+    fake_data, expected_result = assert_expected_integration_result("with_extras", "eos")
+    mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
+    assert (
+        STATE_MOD._generate_bgp_config(
+            fake_data["bgp"], remove_extras=True, rules=None, saltenv="base", workers=3
+        )
+        == expected_result
+    )
+
+
+@salt_bgp_mock("eos")
+def test_apply__generate_bgp_config__platform_resolved_once_eos(mocker):  # pylint: disable=W0613
+    """Test the platform facts are resolved once for the whole config generation."""
+    fake_data, expected_result = assert_expected_integration_result("full_config", "eos")
+    get_os = mocker.patch("_states.openconfig_bgp._get_os", return_value="eos")
+    get_eos_version = mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
+
+    assert (
+        STATE_MOD._generate_bgp_config(
+            fake_data["bgp"], remove_extras=False, rules=None, saltenv="base"
+        )
+        == expected_result
+    )
+    get_os.assert_called_once_with()
+    get_eos_version.assert_called_once_with()
+
+
+@salt_bgp_mock("eos")
+def test_apply__generate_bgp_config__safi_rendered_per_shape_eos(mocker):
+    """Test the SAFI template is rendered once per neighbor shape, not once per neighbor."""
+    fake_data, _ = assert_expected_integration_result("full_config", "eos")
+    mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
+    render_lines = mocker.Mock(wraps=STATE_MOD.__utils__["jinja_render.render_lines"])
+    STATE_MOD.__utils__["jinja_render.render_lines"] = render_lines
+
+    def count_safi_renders(openconfig):
+        render_lines.reset_mock()
+        config = STATE_MOD._generate_bgp_config(
+            openconfig, remove_extras=False, rules=None, saltenv="base"
+        )
+        rendered = [call.args[0] for call in render_lines.call_args_list]
+        return config, sum(1 for name in rendered if name.endswith("/safi.j2"))
+
+    config, nb_renders = count_safi_renders(fake_data["bgp"])
+
+    # same neighbor, with another address and description
+    neighbor = fake_data["bgp"]["neighbors"]["neighbor"][0]
+    clones = []
+    for index in range(1, 51):
+        clone = copy.deepcopy(neighbor)
+        clone["neighbor-address"] = clone["config"]["neighbor-address"] = "198.51.100.{}".format(
+            index
+        )
+        clone["config"]["description"] = "clone {}".format(index)
+        clones.append(clone)
+    fake_data["bgp"]["neighbors"]["neighbor"].extend(clones)
+
+    config_with_clones, nb_renders_with_clones = count_safi_renders(fake_data["bgp"])
+    assert nb_renders_with_clones == nb_renders
+
+    # SAFI lines of the clones are the ones of the original neighbor
+    address = neighbor["neighbor-address"]
+    safi_lines = [line for line in config.splitlines() if "neighbor {} ".format(address) in line]
+    for clone in clones:
+        clone_address = clone["neighbor-address"]
+        for line in safi_lines:
+            if "description" not in line:
+                assert line.replace(address, clone_address) in config_with_clones
+
+
+@salt_bgp_mock("eos")
+def test_apply__generate_bgp_config__profile_eos(mocker):  # pylint: disable=W0613
+    """Test each phase is timed and each template render recorded when profiling."""
+    fake_data, expected_result = assert_expected_integration_result("with_extras", "eos")
+    mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
+
+    config, recorded = STATE_MOD.__utils__["jinja_render.run_profiled"](
+        STATE_MOD._generate_bgp_config,
+        fake_data["bgp"],
+        remove_extras=True,
+        rules=None,
+        saltenv="base",
+    )
+
+    assert config == expected_result
+    assert list(recorded["phases"]) == [
+        "templates_fetch",
+        "device_state",
+        "global_as",
+        "peer_groups",
+        "removals",
+        "neighbors",
+        "safis",
+        "assembly",
+    ]
+    templates = {name.rsplit("/", 1)[-1]: stats for name, stats in recorded["templates"].items()}
+    assert templates["bgp.j2"]["renders"] == 1
+    assert templates["bgp.j2"]["bytes"] == len(expected_result) + 1
+    assert templates["neighbor.j2"]["renders"] == len(fake_data["bgp"]["neighbors"]["neighbor"])
+    # parts are rendered in their own phase when profiling, not while assembled
+    assert templates["neighbor.j2"]["total_time"] <= recorded["phases"]["neighbors"]
+    assert templates["bgp.j2"]["total_time"] <= recorded["phases"]["assembly"]
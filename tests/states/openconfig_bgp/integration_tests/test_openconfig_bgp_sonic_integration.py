@@ -1,12 +1,32 @@
 """integration test of openconfig_bgp for SONiC."""
+
+import os
+import tempfile
+
 import pytest
 
 import _states.openconfig_bgp as STATE_MOD
+import _utils.device_snapshot as SNAPSHOT_UTIL
 from tests.states.openconfig_bgp.integration_tests.common_bgp_integration import (
     assert_expected_integration_result,
+    mock_get_neighbors,
 )
 from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
 
+# not mocked, for the OS to be read from the grains
+_GET_OS = STATE_MOD._get_os
+
+
+def _write_snapshot(path):
+    SNAPSHOT_UTIL.write(
+        path,
+        {"nos": "sonic", "sonic_build_version": "202205"},
+        [
+            ("criteo_bgp.get_global_as", {"vrf": "default"}, 65000),
+            ("criteo_bgp.get_neighbors", {"compact": True}, mock_get_neighbors(compact=True)),
+        ],
+    )
+
 
 @salt_bgp_mock("sonic")
 def test_apply__generate_bgp_config__empty_config_sonic(mocker):  # pylint: disable=W0613
@@ -61,3 +81,49 @@ def test__apply__generate_bgp_config__with_extras_sonic(mocker):  # pylint: disa
         )
         == expected_result
     )
+
+
+@salt_bgp_mock("sonic")
+def test_apply__replay_snapshot_sonic(mocker):
+    """Test the config rendered from a device snapshot is the one rendered from the device."""
+    fake_data, expected_result = assert_expected_integration_result("full_config", "sonic")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "tor1.msgpack")
+        _write_snapshot(path)
+
+        # the device must not be requested
+        for function in ["criteo_bgp.get_global_as", "criteo_bgp.get_neighbors", "grains.get"]:
+            STATE_MOD.__salt__[function] = mocker.Mock(side_effect=AssertionError)
+        STATE_MOD.__salt__["sonic.bgp_config"] = mocker.Mock(side_effect=AssertionError)
+
+        ret = STATE_MOD.apply("bgp", openconfig=fake_data["bgp"], snapshot=path)
+
+    assert ret["result"] is None
+    assert ret["comment"] == ["- rendered from {}:\n{}".format(path, expected_result)]
+    assert SNAPSHOT_UTIL.get_replayed(STATE_MOD.__context__) is None
+
+
+@salt_bgp_mock("sonic")
+def test_apply__replay_snapshot_build_host(mocker):
+    """Test the state is loaded and rendered from the grains of the snapshot on a build host."""
+    mocker.patch("_states.openconfig_bgp._get_os", _GET_OS)
+    fake_data, expected_result = assert_expected_integration_result("full_config", "sonic")
+    get_pillar = STATE_MOD.__salt__["pillar.get"]
+    # grains of the build host
+    STATE_MOD.__salt__["grains.get"] = lambda name, default=None: {"os": "Ubuntu"}.get(
+        name, default
+    )
+    assert not STATE_MOD.__virtual__()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "tor1.json")
+        _write_snapshot(path)
+        STATE_MOD.__salt__["pillar.get"] = lambda name, *args: (
+            path if name == "afk_snapshot" else get_pillar(name, *args)
+        )
+
+        assert STATE_MOD.__virtual__()
+        ret = STATE_MOD.apply("bgp", openconfig=fake_data["bgp"], snapshot=path)
+
+    assert ret["comment"] == ["- rendered from {}:\n{}".format(path, expected_result)]
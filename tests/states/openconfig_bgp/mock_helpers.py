@@ -1,8 +1,14 @@
 import functools
 
 import _states.openconfig_bgp as STATE_MOD
+import _utils.afk_platform as PLATFORM_UTIL
+import _utils.bgp_neighbors as NEIGHBORS_UTIL
+import _utils.bgp_safeguards as SAFEGUARDS_UTIL
+import _utils.device_cache as CACHE_UTIL
+import _utils.device_snapshot as SNAPSHOT_UTIL
 import _utils.jinja_filters as STATE_UTIL
-from tests.common import mock_apply_template_on_contents, mock_get_file_str
+import _utils.jinja_render as RENDER_UTIL
+from tests.common import mock_cache_dir, mock_get_file_str
 from tests.states.openconfig_bgp.integration_tests.common_bgp_integration import mock_get_neighbors
 
 
@@ -42,18 +48,105 @@ def _apply_common_mock(mocker, network_os):
 
     STATE_MOD.__salt__ = {
         "criteo_bgp.get_global_as": asn,
-        "file.apply_template_on_contents": mock_apply_template_on_contents,
         "cp.get_file_str": mock_get_file_str,
+        "cp.cache_dir": mock_cache_dir,
         "pillar.get": _PILLAR_MOCKER[network_os],
         "criteo_bgp.get_neighbors": mock_get_neighbors,
     }
     STATE_MOD.__utils__ = {
+        "afk_platform.build_profile": PLATFORM_UTIL.build_profile,
+        "afk_platform.parse_version": PLATFORM_UTIL.parse_version,
+        "bgp_neighbors.build_index": NEIGHBORS_UTIL.build_index,
+        "bgp_neighbors.get_afi": NEIGHBORS_UTIL.get_afi,
+        "bgp_neighbors.make_record": NEIGHBORS_UTIL.make_record,
+        "bgp_safeguards.plan_removals": SAFEGUARDS_UTIL.plan_removals,
+        "device_cache.call": CACHE_UTIL.call,
+        "device_cache.get_device_data": CACHE_UTIL.get_device_data,
+        "device_cache.invalidate": CACHE_UTIL.invalidate,
+        "device_snapshot.get_grain": SNAPSHOT_UTIL.get_grain,
+        "device_snapshot.get_loaded_os": SNAPSHOT_UTIL.get_loaded_os,
+        "device_snapshot.get_os": SNAPSHOT_UTIL.get_os,
+        "device_snapshot.get_replayed": SNAPSHOT_UTIL.get_replayed,
+        "device_snapshot.get_result": SNAPSHOT_UTIL.get_result,
+        "device_snapshot.replay": SNAPSHOT_UTIL.replay,
         "jinja_filters.format_route_policy_name": STATE_UTIL.format_route_policy_name,
         "jinja_filters.deep_get": STATE_UTIL.deep_get,
+        "jinja_render.render": RENDER_UTIL.render,
+        "jinja_render.render_lines": RENDER_UTIL.render_lines,
+        "jinja_render.render_parallel": RENDER_UTIL.render_parallel,
+        "jinja_render.is_profiling": RENDER_UTIL.is_profiling,
+        "jinja_render.profile_phase": RENDER_UTIL.profile_phase,
+        "jinja_render.run_profiled": RENDER_UTIL.run_profiled,
+        "jinja_render.get_source": RENDER_UTIL.get_source,
+        "jinja_render.load_directory": RENDER_UTIL.load_directory,
+        "jinja_render.prefetch_directory": RENDER_UTIL.prefetch_directory,
+        "jinja_render.register_helpers": RENDER_UTIL.register_helpers,
     }
+    STATE_MOD.__context__ = {}
+    STATE_MOD.__opts__ = {"test": False}
 
     if network_os == "sonic":
-        STATE_MOD.__salt__["grains.get"] = lambda name, *_: "202205" if name == "sonic_build_version" else None
+        STATE_MOD.__salt__["grains.get"] = lambda name, *_: (
+            "202205" if name == "sonic_build_version" else None
+        )
+    elif network_os == "eos":
+        STATE_MOD.__salt__["grains.get"] = lambda name, *_: "4.22.1F" if name == "version" else None
+
+
+def _render_parts(parts):
+    # parts are rendered as _generate_bgp_config renders them, without indentation
+    return ["\n".join(part()) for part in parts]
+
+
+def _render_safis(peer_groups, neighbors, profile):
+    return {
+        safi_name: "\n".join(
+            _render_parts(
+                STATE_MOD._iter_safi_parts(safi_name, peer_groups, neighbors, "base", profile)
+            )
+        )
+        for safi_name in ["IPV4_UNICAST", "IPV6_UNICAST"]
+    }
+
+
+def render_global(config):
+    """Render the global configuration part, with the generators of the state."""
+    profile = STATE_MOD._get_platform_profile()
+    template, context = STATE_MOD._get_global_conf_part(config, profile)
+
+    return "\n".join(STATE_MOD._iter_template(template, context, "base"))
+
+
+def render_peer_group(peer_group, bgp_distance):
+    """Render a peer-group and its SAFI configuration parts, with the generators of the state."""
+    profile = STATE_MOD._get_platform_profile()
+    _, prefix_limit_config = STATE_MOD._get_safi_params(peer_group)
+    template, context = STATE_MOD._get_peer_group_part(
+        peer_group, prefix_limit_config, bgp_distance, profile
+    )
+
+    return (
+        "\n".join(STATE_MOD._iter_template(template, context, "base")),
+        _render_safis([peer_group], [], profile),
+    )
+
+
+def render_neighbor(neighbor, global_as, bgp_distance, peer_groups):
+    """Render a neighbor and its SAFI configuration parts, with the generators of the state."""
+    profile = STATE_MOD._get_platform_profile()
+    (neighbor_config,) = _render_parts(
+        STATE_MOD._iter_neighbor_parts(
+            [neighbor],
+            global_as,
+            bgp_distance,
+            peer_groups,
+            "base",
+            STATE_MOD.BgpDeviceSnapshot.collect(),
+            profile,
+        )
+    )
+
+    return neighbor_config, _render_safis([], [neighbor], profile)
 
 
 def salt_bgp_mock(network_os):
@@ -68,6 +161,8 @@ def salt_bgp_mock(network_os):
                 # some cleaning
                 del STATE_MOD.__salt__
                 del STATE_MOD.__utils__
+                del STATE_MOD.__context__
+                del STATE_MOD.__opts__
 
         return wrapper
 
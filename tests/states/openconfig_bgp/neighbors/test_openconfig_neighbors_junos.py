@@ -1,7 +1,6 @@
 """Unit test openconfig_bgp peer-group."""
 
-import _states.openconfig_bgp as STATE_MOD
-from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
+from tests.states.openconfig_bgp.mock_helpers import render_neighbor, salt_bgp_mock
 
 
 @salt_bgp_mock("junos")
@@ -34,7 +33,7 @@ def test__generate_neighbor_part__minimal_ipv4_up(mocker):
         },
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(config, 65000, {}, {}, None)
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, {})
     assert neighbor_config == (
         "set routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 peer-as 65001\n"
         "delete routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 local-as\n"
@@ -89,7 +88,7 @@ def test__generate_neighbor_part__minimal_ipv4_shutdown_different_local_as(mocke
         },
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(config, 65000, {}, {}, None)
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, {})
     assert neighbor_config == (
         "set routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 peer-as 65001\n"
         "set routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 local-as 65002\n"
@@ -141,7 +140,7 @@ def test__generate_neighbor_part__minimal_ipv4_with_route_maps(mocker):
         },
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(config, 65000, {}, {}, None)
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, {})
     assert neighbor_config == (
         "set routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 peer-as 65001\n"
         "delete routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 local-as\n"
@@ -194,7 +193,7 @@ def test__generate_neighbor_part__minimal_ipv6(mocker):
         },
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(config, 65000, {}, {}, None)
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, {})
     assert neighbor_config == (
         "set routing-instances prod protocols bgp group PG-TOR neighbor 2001:db8::1 peer-as 65001\n"
         "delete routing-instances prod protocols bgp group PG-TOR neighbor 2001:db8::1 local-as\n"
@@ -252,7 +251,7 @@ def test__generate_neighbor_part__full(mocker):
             ]
         },
     }
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(config, 65000, {}, {}, None)
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, {})
     assert neighbor_config == (
         "set routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 peer-as 65001\n"
         "set routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 local-as 65002\n"
@@ -310,7 +309,7 @@ def test__generate_neighbor_part__exists_in_another_pg(mocker):
         },
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(config, 65000, {}, {}, None)
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, {})
     assert neighbor_config == (
         "set routing-instances prod protocols bgp group NEW-PG neighbor 192.0.2.2 peer-as 65001\n"
         "delete routing-instances prod protocols bgp group NEW-PG neighbor 192.0.2.2 local-as\n"
@@ -1,7 +1,6 @@
 """Unit test openconfig_bgp peer-group."""
 
-import _states.openconfig_bgp as STATE_MOD
-from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
+from tests.states.openconfig_bgp.mock_helpers import render_neighbor, salt_bgp_mock
 
 
 @salt_bgp_mock("sonic")
@@ -42,9 +41,7 @@ def test__generate_neighbor_part__minimal_ipv4_up(mocker):
         }
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(
-        config, 65000, {}, peer_groups, None
-    )
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, peer_groups)
     assert neighbor_config == (
         "neighbor 192.0.2.1 peer-group PG-DEFAULT\n"
         "no neighbor 192.0.2.1 local-as\n"
@@ -114,9 +111,7 @@ def test__generate_neighbor_part__minimal_ipv4_shutdown_different_local_as(mocke
         }
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(
-        config, 65000, {}, peer_groups, None
-    )
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, peer_groups)
     assert neighbor_config == (
         "neighbor 192.0.2.1 peer-group PG-DEFAULT\n"
         "neighbor 192.0.2.1 local-as 65002\n"
@@ -183,9 +178,7 @@ def test__generate_neighbor_part__minimal_ipv6(mocker):
         }
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(
-        config, 65000, {}, peer_groups, None
-    )
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, peer_groups)
     assert neighbor_config == (
         "neighbor 2001:db8::1 peer-group PG-TOR\n"
         "no neighbor 2001:db8::1 local-as\n"
@@ -260,9 +253,7 @@ def test__generate_neighbor_part__full(mocker):
         }
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(
-        config, 65000, {}, peer_groups, None
-    )
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, peer_groups)
     assert neighbor_config == (
         "neighbor 192.0.2.1 peer-group PG-DEFAULT\n"
         "neighbor 192.0.2.1 local-as 65002\n"
@@ -339,9 +330,7 @@ def test__generate_neighbor_part__delay_open_timer(mocker):
         }
     }
 
-    neighbor_config, safi_config = STATE_MOD._generate_neighbor_config(
-        config, 65000, {}, peer_groups, None
-    )
+    neighbor_config, safi_config = render_neighbor(config, 65000, {}, peer_groups)
     assert neighbor_config == (
         "neighbor 192.0.2.1 peer-group PG-DEFAULT\n"
         "neighbor 192.0.2.1 local-as 65002\n"
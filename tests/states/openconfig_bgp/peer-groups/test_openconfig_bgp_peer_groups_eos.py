@@ -1,7 +1,6 @@
 """Unit test openconfig_bgp peer-group."""
 
-import _states.openconfig_bgp as STATE_MOD
-from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
+from tests.states.openconfig_bgp.mock_helpers import render_peer_group, salt_bgp_mock
 
 
 @salt_bgp_mock("eos")
@@ -19,7 +18,7 @@ def test__generate_peer_group_part__minimal_before_4_22(mocker):
     }
 
     mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 17))
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "neighbor RA02.01:PG-TOR peer-group\n"
         "default neighbor RA02.01:PG-TOR local-as\n"
@@ -57,7 +56,7 @@ def test__generate_peer_group_part__minimal(mocker):
     }
 
     mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "neighbor RA02.01:PG-TOR peer group\n"
         "default neighbor RA02.01:PG-TOR local-as\n"
@@ -94,7 +93,7 @@ def test__generate_peer_group_part__simple(mocker):
     }
 
     mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "neighbor RA02.01:PG-TOR peer group\n"
         "neighbor RA02.01:PG-TOR local-as 60000\n"
@@ -139,7 +138,7 @@ def test__generate_peer_group_part_with_safi(mocker):
     }
 
     mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "neighbor RA02.01:PG-TOR peer group\n"
         "neighbor RA02.01:PG-TOR local-as 60000\n"
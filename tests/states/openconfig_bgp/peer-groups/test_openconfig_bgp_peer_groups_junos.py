@@ -1,6 +1,5 @@
 """Unit test openconfig_bgp peer-group."""
-import _states.openconfig_bgp as STATE_MOD
-from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
+from tests.states.openconfig_bgp.mock_helpers import render_peer_group, salt_bgp_mock
 
 
 @salt_bgp_mock("junos")
@@ -16,7 +15,7 @@ def test__generate_peer_group_part__minimal(mocker):
         "apply-policy": {},
         "afi-safis": {},
     }
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "delete routing-instances prod protocols bgp group RA02.01:PG-TOR local-as\n"
         "set routing-instances prod protocols bgp group RA02.01:PG-TOR peer-as 65000\n"
@@ -44,7 +43,7 @@ def test__generate_peer_group_part__simple(mocker):
         "afi-safis": {},
     }
 
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "set routing-instances prod protocols bgp group RA02.01:PG-TOR local-as 60000\n"
         "set routing-instances prod protocols bgp group RA02.01:PG-TOR peer-as 60001\n"
@@ -83,7 +82,7 @@ def test__generate_peer_group_part_with_safi(mocker):
         },
     }
 
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "set routing-instances prod protocols bgp group RA02.01:PG-TOR local-as 60000\n"
         "set routing-instances prod protocols bgp group RA02.01:PG-TOR peer-as 65001\n"
@@ -1,6 +1,5 @@
 """Unit test openconfig_bgp peer-group."""
-import _states.openconfig_bgp as STATE_MOD
-from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
+from tests.states.openconfig_bgp.mock_helpers import render_peer_group, salt_bgp_mock
 
 
 @salt_bgp_mock("sonic")
@@ -16,7 +15,7 @@ def test__generate_peer_group_part__minimal(mocker):
         "apply-policy": {},
         "afis-safis": {},
     }
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "neighbor RA02.01:PG-TOR peer-group\n"
         "no neighbor RA02.01:PG-TOR local-as\n"
@@ -53,7 +52,7 @@ def test__generate_peer_group_part__simple(mocker):
         "afis-safis": {},
     }
 
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "neighbor RA02.01:PG-TOR peer-group\n"
         "neighbor RA02.01:PG-TOR local-as 60000\n"
@@ -98,7 +97,7 @@ def test__generate_peer_group_part_with_safi(mocker):
         },
     }
 
-    pg_config, safi_config = STATE_MOD._generate_peer_group(config, {}, None)
+    pg_config, safi_config = render_peer_group(config, {})
     assert pg_config == (
         "neighbor RA02.01:PG-TOR peer-group\n"
         "neighbor RA02.01:PG-TOR local-as 60000\n"
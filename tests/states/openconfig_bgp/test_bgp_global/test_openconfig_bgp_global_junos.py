@@ -1,7 +1,11 @@
 """Unit test openconfig_bgp global configuration."""
 
-import _states.openconfig_bgp as STATE_MOD
-from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
+from tests.states.openconfig_bgp.mock_helpers import (
+    render_global,
+    render_neighbor,
+    render_peer_group,
+    salt_bgp_mock,
+)
 
 
 @salt_bgp_mock("junos")
@@ -10,7 +14,7 @@ def test__generate_global_configuration_minimal(mocker):
         "config": {"as": 65000},
     }
     assert (
-        STATE_MOD._generate_global_conf_part(config, None)
+        render_global(config)
         == "set routing-instances prod protocols bgp multipath multiple-as"
     )
 
@@ -24,7 +28,7 @@ def test__generate_global_configuration_minimal2(mocker):
             "config": {"enabled": True},
         },
     }
-    assert STATE_MOD._generate_global_conf_part(config, None) == (
+    assert render_global(config) == (
         "set routing-instances prod protocols bgp multipath multiple-as\n"
         "set routing-instances prod protocols bgp graceful-restart\n"
         "delete routing-instances prod protocols bgp graceful-restart restart-time"
@@ -45,7 +49,7 @@ def test__generate_global_configuration_full(mocker):
             "ibgp": {"config": {"maximum-paths": 128}},
         },
     }
-    assert STATE_MOD._generate_global_conf_part(config, None) == (
+    assert render_global(config) == (
         "set routing-instances prod protocols bgp multipath multiple-as\n"
         "set routing-instances prod protocols bgp graceful-restart\n"
         "set routing-instances prod protocols bgp graceful-restart restart-time 240"
@@ -100,7 +104,7 @@ def test__generate_global_configuration_ecmp_neighbors_ebgp(mocker):
         "internal": 150,
     }
 
-    neighbor_config, _ = STATE_MOD._generate_neighbor_config(config, 65000, bgp_distance, peer_groups, None)
+    neighbor_config, _ = render_neighbor(config, 65000, bgp_distance, peer_groups)
     assert neighbor_config == (
         "set routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 peer-as 65001\n"
         "delete routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 local-as\n"
@@ -156,7 +160,7 @@ def test__generate_global_configuration_ecmp_neighbors_ibgp(mocker):
         "internal": 150,
     }
 
-    neighbor_config, _ = STATE_MOD._generate_neighbor_config(config, 65000, bgp_distance, peer_groups, None)
+    neighbor_config, _ = render_neighbor(config, 65000, bgp_distance, peer_groups)
     assert neighbor_config == (
         "set routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 peer-as 65000\n"
         "delete routing-instances prod protocols bgp group PG-DEFAULT neighbor 192.0.2.1 local-as\n"
@@ -195,7 +199,7 @@ def test__generate_global_configuration_ecmp_peer_groups_ebgp(mocker):
         "internal": 150,
     }
 
-    pg_config, _ = STATE_MOD._generate_peer_group(config, bgp_distance, None)
+    pg_config, _ = render_peer_group(config, bgp_distance)
     assert pg_config == (
         "set routing-instances prod protocols bgp group RA02.01:PG-TOR local-as 60000\n"
         "set routing-instances prod protocols bgp group RA02.01:PG-TOR peer-as 65001\n"
@@ -233,7 +237,7 @@ def test__generate_global_configuration_ecmp_peer_groups_ibgp(mocker):
         "internal": 150,
     }
 
-    pg_config, _ = STATE_MOD._generate_peer_group(config, bgp_distance, None)
+    pg_config, _ = render_peer_group(config, bgp_distance)
     assert pg_config == (
         "set routing-instances prod protocols bgp group RA02.01:PG-TOR local-as 65000\n"
         "set routing-instances prod protocols bgp group RA02.01:PG-TOR peer-as 65000\n"
@@ -1,7 +1,6 @@
 """Unit test openconfig_bgp global configuration."""
 
-import _states.openconfig_bgp as STATE_MOD
-from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
+from tests.states.openconfig_bgp.mock_helpers import render_global, salt_bgp_mock
 
 
 @salt_bgp_mock("sonic")
@@ -9,7 +8,7 @@ def test__generate_global_configuration_minimal(mocker):
     config = {
         "config": {"as": 65000},
     }
-    assert STATE_MOD._generate_global_conf_part(config, None) == (
+    assert render_global(config) == (
         "bgp log-neighbor-changes\n"
         "bgp bestpath as-path multipath-relax\n"
         "no bgp router-id\n"
@@ -36,7 +35,7 @@ def test__generate_global_configuration_minimal2(mocker):
             "config": {"enabled": True},
         },
     }
-    assert STATE_MOD._generate_global_conf_part(config, None) == (
+    assert render_global(config) == (
         "bgp log-neighbor-changes\n"
         "bgp bestpath as-path multipath-relax\n"
         "no bgp router-id\n"
@@ -68,7 +67,7 @@ def test__generate_global_configuration_full(mocker):
             "ibgp": {"config": {"maximum-paths": 128}},
         },
     }
-    assert STATE_MOD._generate_global_conf_part(config, None) == (
+    assert render_global(config) == (
         "bgp log-neighbor-changes\n"
         "bgp bestpath as-path multipath-relax\n"
         "bgp router-id 127.0.0.1\n"
@@ -113,7 +112,7 @@ def test__generate_global_configuration_aggregates_and_networks(mocker):
         },
     }
 
-    assert STATE_MOD._generate_global_conf_part(config, None) == (
+    assert render_global(config) == (
         "bgp log-neighbor-changes\n"
         "bgp bestpath as-path multipath-relax\n"
         "bgp router-id 127.0.0.1\n"
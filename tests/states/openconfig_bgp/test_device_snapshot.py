@@ -0,0 +1,95 @@
+"""Unit test of the BGP device snapshot in openconfig_bgp."""
+
+import _states.openconfig_bgp as STATE_MOD
+import _utils.bgp_neighbors as NEIGHBORS_UTIL
+from tests.states.openconfig_bgp.integration_tests.common_bgp_integration import (
+    assert_expected_integration_result,
+    mock_get_neighbors,
+)
+from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
+
+NEIGHBORS = [
+    {
+        "remote_address": "192.0.2.1",
+        "peer_group": "PG-TOR",
+        "import_policy": "RM-LAN-IN",
+        "export_policy": "RM-LAN-OUT",
+        "state": "up",
+    },
+    {
+        "remote_address": "2001:db8::1",
+        "peer_group": None,
+        "import_policy": "RM-LAN-IN",
+        "export_policy": "",
+        "state": "down",
+    },
+]
+
+
+@salt_bgp_mock("eos")
+def test_bgp_device_snapshot__indexes(mocker):  # pylint: disable=W0613
+    """Test neighbors are indexed by address, with peer-groups and route-maps in use."""
+    snapshot = STATE_MOD.BgpDeviceSnapshot(65000, NEIGHBORS)
+
+    assert snapshot.local_as == 65000
+    assert snapshot.neighbors == NEIGHBORS
+    assert snapshot.neighbors_by_address == {
+        "192.0.2.1": NEIGHBORS[0],
+        "2001:db8::1": NEIGHBORS[1],
+    }
+    assert snapshot.neighbors_by_address["2001:DB8:0::1"] is NEIGHBORS[1]
+    assert snapshot.peer_groups == {"PG-TOR"}
+    assert snapshot.route_maps == {"RM-LAN-IN", "RM-LAN-OUT"}
+
+
+@salt_bgp_mock("eos")
+def test_generate_bgp_config__device_requested_once(mocker):
+    """Test the device is requested once for the whole config generation."""
+    fake_data, expected_result = assert_expected_integration_result("with_extras", "eos")
+    mocker.patch("_states.openconfig_bgp._get_eos_version", return_value=(4, 22))
+    get_neighbors = mocker.Mock(side_effect=mock_get_neighbors)
+    STATE_MOD.__salt__["criteo_bgp.get_neighbors"] = get_neighbors
+
+    assert (
+        STATE_MOD._generate_bgp_config(
+            fake_data["bgp"], remove_extras=True, rules=None, saltenv="base"
+        )
+        == expected_result
+    )
+    get_neighbors.assert_called_once_with(compact=True)
+    STATE_MOD.__salt__["criteo_bgp.get_global_as"].assert_called_once_with(vrf="default")
+
+
+@salt_bgp_mock("eos")
+def test_plan_removals__canonical_addresses(mocker):  # pylint: disable=W0613
+    """Test wanted neighbors are matched whatever the text form of their address."""
+    snapshot = STATE_MOD.BgpDeviceSnapshot(65000, NEIGHBORS)
+    wanted = [{"neighbor-address": "2001:DB8:0:0::1"}]
+
+    assert STATE_MOD._plan_removals(wanted, None, snapshot).to_remove == [NEIGHBORS[0]]
+
+
+@salt_bgp_mock("eos")
+def test_bgp_device_snapshot__shared_by_states(mocker):
+    """Test the device is requested once for the run, and again after a change, if enabled."""
+    get_neighbors = mocker.Mock(side_effect=mock_get_neighbors)
+    STATE_MOD.__salt__["criteo_bgp.get_neighbors"] = get_neighbors
+    STATE_MOD.__opts__["afk_device_cache_ttl"] = 300
+
+    neighbors = STATE_MOD.BgpDeviceSnapshot.collect().neighbors
+    assert neighbors == mock_get_neighbors(compact=True)["result"]
+    # the dicts returned by the module are kept as compact records
+    assert all(isinstance(neighbor, NEIGHBORS_UTIL.NeighborRecord) for neighbor in neighbors)
+    STATE_MOD.BgpDeviceSnapshot.collect()
+    get_neighbors.assert_called_once_with(compact=True)
+    STATE_MOD.__salt__["criteo_bgp.get_global_as"].assert_called_once_with(vrf="default")
+
+    STATE_MOD.__utils__["device_cache.invalidate"](STATE_MOD.__context__)
+    STATE_MOD.BgpDeviceSnapshot.collect()
+    assert get_neighbors.call_count == 2
+
+    # disabled by default, the states are not given their job
+    del STATE_MOD.__opts__["afk_device_cache_ttl"]
+    STATE_MOD.BgpDeviceSnapshot.collect()
+    STATE_MOD.BgpDeviceSnapshot.collect()
+    assert get_neighbors.call_count == 4
@@ -1,6 +1,7 @@
 """Unit test for bgp removal safeguards in openconfig_bgp."""
 
 import _states.openconfig_bgp as STATE_MOD
+from tests.states.openconfig_bgp.mock_helpers import salt_bgp_mock
 
 RULES = [
     {
@@ -18,287 +19,29 @@ RULES = [
 ]
 
 ##
-# Test _is_rule_respected()
+# Test _plan_removals()
 ##
 
 
-def test__is_rule_respected__not_concerned():
-    """test is_rule_respected when neighbor not matching the rule."""
-    rule = {
-        "field": "peer_group",
-        "contains": "PG-TOR",
-        "minimum_up": 2,
-        "remove_down_only": False,
-    }
-
-    neighbor = {
-        "state": "up",
-        "peer_group": "PG-SPINE",
-        "remote_address": "192.0.2.1",
-    }
-
-    assert STATE_MOD._is_rule_respected(rule, neighbor, {}, []) is True
-
-
-def test__is_rule_respected__down_remove_down_only():
-    """test is_rule_respected when removing down session only and session is down."""
-    rule = {
-        "field": "peer_group",
-        "contains": "PG-TOR",
-        "minimum_up": 0,
-        "remove_down_only": True,
-    }
-
-    neighbor = {
-        "state": "down",
-        "peer_group": "PG-TOR",
-        "remote_address": "192.0.2.1",
-    }
-
-    assert STATE_MOD._is_rule_respected(rule, neighbor, {}, []) is True
-
-
-def test__is_rule_respected__up_remove_down_only():
-    """test is_rule_respected when removing down session only and session is up."""
-    rule = {
-        "field": "peer_group",
-        "contains": "PG-TOR",
-        "minimum_up": 0,
-        "remove_down_only": True,
-    }
-
-    neighbor = {
-        "state": "up",
-        "peer_group": "PG-TOR",
-        "remote_address": "192.0.2.1",
-    }
-
-    assert STATE_MOD._is_rule_respected(rule, neighbor, {}, []) is False
-
-
-def test__is_rule_respected__peer_group__below_minimum():
-    """Test is_rule_respected with peer_group filter, below minimum."""
-    rule = {
-        "field": "peer_group",
-        "contains": "PG-TOR",
-        "minimum_up": 2,
-        "remove_down_only": True,
-    }
-
-    neighbor = {
-        "state": "down",
-        "peer_group": "PG-TOR",
-        "remote_address": "192.0.2.1",
-    }
-
-    all_neighbors = [
-        neighbor,
-        {
-            "state": "up",
-            "peer_group": "PG-TOR",
-            "remote_address": "192.0.2.5",
-        },
-        {
-            "state": "up",
-            "peer_group": "PG-SPINE",
-            "remote_address": "192.0.2.7",
-        },
-    ]
-
-    assert STATE_MOD._is_rule_respected(rule, neighbor, all_neighbors, []) is False
-
-
-def test__is_rule_respected__peer_group__below_minimum_one_already_removed():
-    """Test is_rule_respected with peer_group filter, below minimum.
-
-    Because one already being removed.
-    """
-    rule = {
-        "field": "peer_group",
-        "contains": "PG-TOR",
-        "minimum_up": 1,
-        "remove_down_only": False,
-    }
-
-    neighbor = {
-        "state": "up",
-        "peer_group": "PG-TOR",
-        "remote_address": "192.0.2.1",
-    }
-
-    all_neighbors = [
-        neighbor,
-        {
-            "state": "up",
-            "peer_group": "PG-TOR",
-            "remote_address": "192.0.2.5",
-        },
-        {
-            "state": "up",
-            "peer_group": "PG-SPINE",
-            "remote_address": "192.0.2.7",
-        },
-    ]
-
-    to_remove = [
-        {
-            "state": "up",
-            "peer_group": "PG-TOR",
-            "remote_address": "192.0.2.5",
-        },
-    ]
-
-    assert STATE_MOD._is_rule_respected(rule, neighbor, all_neighbors, to_remove) is False
-
-
-def test__is_rule_respected__peer_group__equal_to_minimum():
-    """Test is_rule_respected with peer_group filter, equal to minimum."""
-    rule = {
-        "field": "peer_group",
-        "contains": "PG-TOR",
-        "minimum_up": 1,
-        "remove_down_only": True,
-    }
-
-    neighbor = {
-        "state": "down",
-        "peer_group": "PG-TOR",
-        "remote_address": "192.0.2.1",
-    }
-
-    all_neighbors = [
-        neighbor,
-        {
-            "state": "up",
-            "peer_group": "PG-TOR",
-            "remote_address": "192.0.2.5",
-        },
-        {
-            "state": "up",
-            "peer_group": "PG-SPINE",
-            "remote_address": "192.0.2.7",
-        },
-    ]
-
-    assert STATE_MOD._is_rule_respected(rule, neighbor, all_neighbors, []) is True
-
-
-def test__is_rule_respected__peer_group__above_minimum():
-    """Test is_rule_respected with peer_group filter, above minimum."""
-    rule = {
-        "field": "peer_group",
-        "contains": "PG-TOR",
-        "minimum_up": 0,
-        "remove_down_only": True,
-    }
-
-    neighbor = {
-        "state": "down",
-        "peer_group": "PG-TOR",
-        "remote_address": "192.0.2.1",
-    }
-
-    all_neighbors = [
-        neighbor,
-        {
-            "state": "up",
-            "peer_group": "PG-TOR",
-            "remote_address": "192.0.2.5",
-        },
-        {
-            "state": "up",
-            "peer_group": "PG-SPINE",
-            "remote_address": "192.0.2.7",
-        },
-    ]
-
-    assert STATE_MOD._is_rule_respected(rule, neighbor, all_neighbors, []) is True
-
-
-def test__is_rule_respected__description__below_minimum():
-    """Test is_rule_respected with description filter, below minimum."""
-    rule = {
-        "field": "description",
-        "contains": "server",
-        "minimum_up": 2,
-        "remove_down_only": True,
-    }
-
-    neighbor = {
-        "state": "down",
-        "remote_address": "192.0.2.1",
-        "description": "to:server1",
-    }
-
-    all_neighbors = [
-        neighbor,
-        {
-            "state": "up",
-            "remote_address": "192.0.2.5",
-            "description": "to:server1",
-        },
-        {
-            "state": "up",
-            "remote_address": "192.0.2.7",
-            "description": "to:management",
-        },
+@salt_bgp_mock("eos")
+def test__plan_removals(mocker):  # pylint: disable=W0613
+    """Test unwanted neighbors are the ones planned to be removed, held back ones excluded."""
+    installed = [
+        {"remote_address": "192.0.2.1", "state": "up", "peer_group": "PG-TOR", "description": ""},
+        {"remote_address": "192.0.2.2", "state": "down", "peer_group": "PG-TOR", "description": ""},
+        {"remote_address": "192.0.2.3", "state": "up", "peer_group": "PG-TOR", "description": ""},
+        {"remote_address": "192.0.2.4", "state": "up", "peer_group": "PG-TOR", "description": ""},
     ]
-
-    assert (
-        STATE_MOD._is_rule_respected(
-            rule,
-            neighbor,
-            all_neighbors,
-            [],
-        )
-        is False
+    wanted = [{"neighbor-address": "192.0.2.4"}]
+    snapshot = STATE_MOD.BgpDeviceSnapshot(65000, installed)
+
+    plan = STATE_MOD._plan_removals(wanted, RULES, snapshot)
+    assert plan.to_remove == [installed[1]]
+    assert plan.held_back == [(installed[0], RULES[0]), (installed[2], RULES[0])]
+    assert STATE_MOD._plan_removals(wanted, None, snapshot).to_remove == installed[:3]
+
+    assert STATE_MOD._format_held_back(plan) == (
+        "- removals held back by safeguards:\n"
+        "192.0.2.1 (peer_group contains PG-TOR: minimum_up 2, remove_down_only)\n"
+        "192.0.2.3 (peer_group contains PG-TOR: minimum_up 2, remove_down_only)"
     )
-
-
-def test__is_rule_respected__description__above_minimum():
-    """Test is_rule_respected with description filter, above minimum."""
-    rule = {
-        "field": "description",
-        "contains": "server",
-        "minimum_up": 0,
-        "remove_down_only": True,
-    }
-
-    neighbor = {
-        "state": "down",
-        "remote_address": "192.0.2.1",
-        "description": "to:server1",
-    }
-
-    all_neighbors = [
-        neighbor,
-        {
-            "state": "up",
-            "remote_address": "192.0.2.5",
-            "description": "to:server1",
-        },
-        {
-            "state": "up",
-            "remote_address": "192.0.2.7",
-            "description": "to:server2",
-        },
-    ]
-
-    assert STATE_MOD._is_rule_respected(rule, neighbor, all_neighbors, []) is True
-
-
-##
-# Test _is_safe_to_remove()
-##
-
-
-def test__is_safe_to_remove__ok(mocker):
-    """Test _is_safe_to_remove() when safe."""
-    mocker.patch("_states.openconfig_bgp._is_rule_respected", return_value=True)
-    assert STATE_MOD._is_safe_to_remove(RULES, None, None, None) is True
-
-
-def test__is_safe_to_remove__nok(mocker):
-    """Test _is_safe_to_remove() when unsafe."""
-    mocker.patch("_states.openconfig_bgp._is_rule_respected", side_effect=[True, False])
-    assert STATE_MOD._is_safe_to_remove(RULES, None, None, None) is False
@@ -3,8 +3,8 @@ import functools
 import json
 
 import _states.openconfig_routing_policy as STATE_MOD
-from _utils import frr_detect_diff, jinja_filters
-from jinja2 import BaseLoader, Environment
+from _utils import afk_platform, frr_detect_diff, jinja_filters, jinja_render
+from tests.common import mock_cache_dir
 
 ##
 # Tests setup
@@ -28,13 +28,6 @@ def _get_data_and_expected_result(os_name):
     return fake_data, expected_result
 
 
-def _mock_apply_template_on_contents(contents, template, context, *_, **__):
-    assert template == "jinja"
-    loader = Environment(loader=BaseLoader)
-    template = loader.from_string(contents)
-    return template.render(**context)
-
-
 def _mock_get_file_str(template_name, *_, **__):
     # removing salt:// prefix in path file
     template_name = template_name[7:]
@@ -46,14 +39,26 @@ def _mock_get_file_str(template_name, *_, **__):
 def _apply_common_mock(mocker):
     mocker.patch("_states.openconfig_routing_policy._get_os", return_value="eos")
     STATE_MOD.__salt__ = {
-        "file.apply_template_on_contents": _mock_apply_template_on_contents,
         "cp.get_file_str": _mock_get_file_str,
+        "cp.cache_dir": mock_cache_dir,
         "eos.get_bgp_config": lambda *_: (""),
     }
     STATE_MOD.__utils__ = {
+        "afk_platform.build_profile": afk_platform.build_profile,
+        "afk_platform.parse_version": afk_platform.parse_version,
         "frr_detect_diff.get_objects": frr_detect_diff.get_objects,
         "jinja_filters.format_route_policy_name": jinja_filters.format_route_policy_name,
         "jinja_filters.deep_get": jinja_filters.deep_get,
+        "jinja_render.render": jinja_render.render,
+        "jinja_render.render_lines": jinja_render.render_lines,
+        "jinja_render.render_parallel": jinja_render.render_parallel,
+        "jinja_render.is_profiling": jinja_render.is_profiling,
+        "jinja_render.profile_phase": jinja_render.profile_phase,
+        "jinja_render.run_profiled": jinja_render.run_profiled,
+        "jinja_render.get_source": jinja_render.get_source,
+        "jinja_render.load_directory": jinja_render.load_directory,
+        "jinja_render.prefetch_directory": jinja_render.prefetch_directory,
+        "jinja_render.register_helpers": jinja_render.register_helpers,
     }
 
 
@@ -102,3 +107,30 @@ def test_apply__generate_routing_policy_config__full_config_eos_before_4_22(
         )
         == expected_result
     )
+
+
+@_mock_then_clean
+def test_apply__generate_routing_policy_config__profile_eos(mocker):  # pylint: disable=W0613
+    """Test sets and policies are rendered in their own phase when profiling."""
+    mocker.patch("_states.openconfig_routing_policy._get_eos_version", return_value=(4, 22))
+    fake_data, expected_result = _get_data_and_expected_result("eos")
+
+    config, recorded = jinja_render.run_profiled(
+        STATE_MOD._generate_routing_policy_config,
+        fake_data["routing-policy"],
+        fake_data["bgp"],
+        None,
+        saltenv="base",
+    )
+
+    assert config == expected_result
+    assert list(recorded["phases"]) == [
+        "templates_fetch",
+        "prefix_sets",
+        "community_sets",
+        "policies",
+        "assembly",
+    ]
+    templates = {name.rsplit("/", 1)[-1]: stats for name, stats in recorded["templates"].items()}
+    assert templates["statement.j2"]["total_time"] <= recorded["phases"]["policies"]
+    assert templates["routing_policy.j2"]["renders"] == 1
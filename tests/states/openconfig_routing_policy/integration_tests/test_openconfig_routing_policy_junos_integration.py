@@ -3,9 +3,11 @@ import functools
 import json
 
 import _states.openconfig_routing_policy as STATE_MOD
+import _utils.afk_platform as PLATFORM_UTIL
 import _utils.jinja_filters as STATE_UTIL
+import _utils.jinja_render as RENDER_UTIL
 import pytest
-from jinja2 import BaseLoader, Environment
+from tests.common import mock_cache_dir
 
 ##
 # Tests setup
@@ -29,13 +31,6 @@ def _get_data_and_expected_result(os_name):
     return fake_data, expected_result
 
 
-def _mock_apply_template_on_contents(contents, template, context, *_, **__):
-    assert template == "jinja"
-    loader = Environment(loader=BaseLoader)
-    template = loader.from_string(contents)
-    return template.render(**context)
-
-
 def _mock_get_file_str(template_name, *_, **__):
     # removing salt:// prefix in path file
     template_name = template_name[7:]
@@ -47,12 +42,23 @@ def _mock_get_file_str(template_name, *_, **__):
 def _apply_common_mock(mocker):
     mocker.patch("_states.openconfig_routing_policy._get_os", return_value="junos")
     STATE_MOD.__salt__ = {
-        "file.apply_template_on_contents": _mock_apply_template_on_contents,
         "cp.get_file_str": _mock_get_file_str,
+        "cp.cache_dir": mock_cache_dir,
     }
     STATE_MOD.__utils__ = {
+        "afk_platform.build_profile": PLATFORM_UTIL.build_profile,
         "jinja_filters.format_route_policy_name": STATE_UTIL.format_route_policy_name,
         "jinja_filters.deep_get": STATE_UTIL.deep_get,
+        "jinja_render.render": RENDER_UTIL.render,
+        "jinja_render.render_lines": RENDER_UTIL.render_lines,
+        "jinja_render.render_parallel": RENDER_UTIL.render_parallel,
+        "jinja_render.is_profiling": RENDER_UTIL.is_profiling,
+        "jinja_render.profile_phase": RENDER_UTIL.profile_phase,
+        "jinja_render.run_profiled": RENDER_UTIL.run_profiled,
+        "jinja_render.get_source": RENDER_UTIL.get_source,
+        "jinja_render.load_directory": RENDER_UTIL.load_directory,
+        "jinja_render.prefetch_directory": RENDER_UTIL.prefetch_directory,
+        "jinja_render.register_helpers": RENDER_UTIL.register_helpers,
     }
 
 
@@ -1,10 +1,20 @@
 """integration test of openconfig_routing_policy for SONiC."""
+
 import functools
 import json
+import os
+import tempfile
 
 import _states.openconfig_routing_policy as STATE_MOD
-from _utils import frr_detect_diff, jinja_filters
-from jinja2 import BaseLoader, Environment
+from _utils import (
+    afk_platform,
+    device_cache,
+    device_snapshot,
+    frr_detect_diff,
+    jinja_filters,
+    jinja_render,
+)
+from tests.common import mock_cache_dir
 
 ##
 # Tests setup
@@ -28,13 +38,6 @@ def _get_data_and_expected_result(os_name):
     return fake_data, expected_result
 
 
-def _mock_apply_template_on_contents(contents, template, context, *_, **__):
-    assert template == "jinja"
-    loader = Environment(loader=BaseLoader)
-    template = loader.from_string(contents)
-    return template.render(**context)
-
-
 def _mock_get_file_str(template_name, *_, **__):
     # removing salt:// prefix in path file
     template_name = template_name[7:]
@@ -46,17 +49,39 @@ def _mock_get_file_str(template_name, *_, **__):
 def _apply_common_mock(mocker):
     mocker.patch("_states.openconfig_routing_policy._get_os", return_value="sonic")
     STATE_MOD.__salt__ = {
-        "file.apply_template_on_contents": _mock_apply_template_on_contents,
         "cp.get_file_str": _mock_get_file_str,
+        "cp.cache_dir": mock_cache_dir,
         "sonic.get_bgp_config": lambda *_: (""),
         "grains.get": lambda name, *_: "201911" if name == "sonic_build_version" else None,
         "pillar.get": lambda name, *_: "False" if name == "frr822_workaround_flag" else None,
     }
     STATE_MOD.__utils__ = {
+        "afk_platform.build_profile": afk_platform.build_profile,
+        "afk_platform.parse_version": afk_platform.parse_version,
+        "device_cache.call": device_cache.call,
+        "device_cache.get_device_data": device_cache.get_device_data,
+        "device_cache.invalidate": device_cache.invalidate,
+        "device_snapshot.get_grain": device_snapshot.get_grain,
+        "device_snapshot.get_os": device_snapshot.get_os,
+        "device_snapshot.get_replayed": device_snapshot.get_replayed,
+        "device_snapshot.get_result": device_snapshot.get_result,
+        "device_snapshot.replay": device_snapshot.replay,
         "frr_detect_diff.get_objects": frr_detect_diff.get_objects,
         "jinja_filters.format_route_policy_name": jinja_filters.format_route_policy_name,
         "jinja_filters.deep_get": jinja_filters.deep_get,
+        "jinja_render.render": jinja_render.render,
+        "jinja_render.render_lines": jinja_render.render_lines,
+        "jinja_render.render_parallel": jinja_render.render_parallel,
+        "jinja_render.is_profiling": jinja_render.is_profiling,
+        "jinja_render.profile_phase": jinja_render.profile_phase,
+        "jinja_render.run_profiled": jinja_render.run_profiled,
+        "jinja_render.get_source": jinja_render.get_source,
+        "jinja_render.load_directory": jinja_render.load_directory,
+        "jinja_render.prefetch_directory": jinja_render.prefetch_directory,
+        "jinja_render.register_helpers": jinja_render.register_helpers,
     }
+    STATE_MOD.__context__ = {}
+    STATE_MOD.__opts__ = {"test": False, "id": "tor1.dc1"}
 
 
 def _mock_then_clean(func):
@@ -65,10 +90,14 @@ def _mock_then_clean(func):
         # some mocking
         _apply_common_mock(mocker)
         try:
-            return func(mocker)
+            with tempfile.TemporaryDirectory() as cache_dir:
+                STATE_MOD.__opts__["cachedir"] = cache_dir
+                return func(mocker)
         finally:
             # some cleaning
             del STATE_MOD.__salt__
+            del STATE_MOD.__context__
+            del STATE_MOD.__opts__
 
     return wrapper
 
@@ -90,6 +119,18 @@ def test_apply__generate_routing_policy_config__full_config_sonic(mocker):  # py
     )
 
 
+@_mock_then_clean
+def test_apply__generate_routing_policy_config__workers_sonic(mocker):  # pylint: disable=W0613
+    """Test the config rendered by worker processes is the same than rendered sequentially."""
+    fake_data, expected_result = _get_data_and_expected_result("sonic")
+    assert (
+        STATE_MOD._generate_routing_policy_config(
+            fake_data["routing-policy"], fake_data["bgp"], None, saltenv="base", workers=2
+        )
+        == expected_result
+    )
+
+
 @_mock_then_clean
 def test_apply__generate_routing_policy_config__full_config_sonic__with_existing_config(
     mocker,
@@ -111,3 +152,69 @@ def test_apply__generate_routing_policy_config__full_config_sonic__with_existing
         )
         == expected_result
     )
+
+
+@_mock_then_clean
+def test_apply__unchanged_policies_skipped(mocker):  # pylint: disable=W0613
+    """Test policies pushed by a previous run are skipped, until changed on the device."""
+    fake_data, _ = _get_data_and_expected_result("sonic")
+    inventory = {"RM-TEST": "digest-1", "RM-TEST-OUT": "digest-2"}
+    push = mocker.Mock(return_value={"result": True, "comment": "", "changes": ""})
+    STATE_MOD.__salt__["criteo_bgp.get_route_policy_inventory"] = lambda: dict(inventory)
+    STATE_MOD.__salt__["sonic.bgp_config"] = push
+    # changes on the device are seen by the next run
+    STATE_MOD.__opts__["afk_device_cache_ttl"] = 0
+
+    def _get_pushed_policies():
+        STATE_MOD.apply("routing_policy", fake_data["routing-policy"], fake_data["bgp"])
+        pushed = push.call_args[1]["context"]["raw"]
+        return [name for name in inventory if "route-map {} ".format(name) in pushed]
+
+    assert _get_pushed_policies() == ["RM-TEST", "RM-TEST-OUT"]
+    assert not _get_pushed_policies()
+    # recorded for the next jobs, run in new processes by multiprocessing minions
+    STATE_MOD.__context__.clear()
+    assert not _get_pushed_policies()
+
+    # changed on the device, and push failed: pushed again by the next run
+    inventory["RM-TEST"] = "digest-3"
+    push.return_value = {"result": False, "comment": "", "changes": ""}
+    assert _get_pushed_policies() == ["RM-TEST"]
+    push.return_value = {"result": True, "comment": "", "changes": ""}
+    assert _get_pushed_policies() == ["RM-TEST"]
+    assert not _get_pushed_policies()
+
+    # changed in openconfig
+    fake_data["routing-policy"]["policy-definitions"]["policy-definition"][1]["statements"][
+        "statement"
+    ][0]["name"] = "99"
+    assert _get_pushed_policies() == ["RM-TEST-OUT"]
+
+
+@_mock_then_clean
+def test_apply__replay_snapshot_sonic(mocker):
+    """Test the config is rendered from a device snapshot, without requesting the device."""
+    fake_data, expected_result = _get_data_and_expected_result("sonic_existing")
+    bgp_config = (
+        "ip prefix-list PF-LOOPBACK_IPV4 seq 10 permit 10.252.200.0/22\n"
+        "route-map RM-TEST deny 10\n"
+        "  match ip address prefix-list PF-LOOPBACK_IPV4\n"
+        "bgp community-list expanded CL-SERVER permit 64998:10200\n"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "tor1.json")
+        device_snapshot.write(
+            path,
+            {"nos": "sonic", "sonic_build_version": "201911"},
+            [("sonic.get_bgp_config", {}, bgp_config)],
+        )
+        for function in ["sonic.get_bgp_config", "grains.get"]:
+            STATE_MOD.__salt__[function] = mocker.Mock(side_effect=AssertionError)
+
+        ret = STATE_MOD.apply(
+            "routing_policy", fake_data["routing-policy"], fake_data["bgp"], snapshot=path
+        )
+
+    assert ret["result"] is None
+    assert ret["comment"] == ["- rendered from {}:\n{}".format(path, expected_result)]
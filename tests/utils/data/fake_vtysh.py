@@ -0,0 +1,38 @@
+"""Stand-in of vtysh reading commands on its standard input, emulating bgpd."""
+
+import json
+import os
+import sys
+import time
+
+RESPONSES = {
+    "show bgp json": {"routerId": "192.0.2.254", "localAS": 65000},
+    "show bgp summary json": {"ipv4Unicast": {"as": 65000, "peerCount": 2}},
+}
+
+
+def main():
+    """Answer like vtysh on a pipe: prompt and command echoed, then the output."""
+    for line in sys.stdin:
+        command = line.strip()
+        sys.stdout.write("sonic# {}\n".format(command))
+
+        if command.startswith("echo "):
+            sys.stdout.write(command[len("echo ") :] + "\n")
+        elif command == "show pid":
+            sys.stdout.write("{}\n".format(os.getpid()))
+        elif command.startswith("sleep "):
+            time.sleep(float(command[len("sleep ") :]))
+        elif command == "exit":
+            sys.stdout.flush()
+            return
+        elif command in RESPONSES:
+            sys.stdout.write(json.dumps(RESPONSES[command], indent=2) + "\n")
+        elif command != "clear bgp * soft":
+            sys.stdout.write("% Unknown command: {}\n".format(command))
+
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Unit tests of afk_platform utils."""
+
+import pytest
+
+import _utils.afk_platform as PLATFORM_UTIL
+
+
+def test_parse_version():
+    """Test major and minor are extracted from OS version."""
+    assert PLATFORM_UTIL.parse_version("4.22.1F") == (4, 22)
+    assert PLATFORM_UTIL.parse_version("4.17.3F-INT") == (4, 17)
+    assert PLATFORM_UTIL.parse_version("20.4R3-S2") == (20, 4)
+
+    with pytest.raises(NotImplementedError):
+        PLATFORM_UTIL.parse_version("unknown")
+
+
+def test_get_sonic_build_family():
+    """Test the SONiC release is extracted from the build version."""
+    assert PLATFORM_UTIL.get_sonic_build_family("SONiC.201911.451") == "201911"
+    assert PLATFORM_UTIL.get_sonic_build_family("202205") == "202205"
+    assert PLATFORM_UTIL.get_sonic_build_family("master") == ""
+
+
+def test_get_sonic_build_family__build_versions():
+    """Test the SONiC release of real build versions, dirty builds and master builds included."""
+    assert PLATFORM_UTIL.get_sonic_build_family("SONiC.201911.451-b2d1bf24") == "201911"
+    assert PLATFORM_UTIL.get_sonic_build_family("202205.01") == "202205"
+    assert PLATFORM_UTIL.get_sonic_build_family("SONiC.202211.98-c3b6d3f1b") == "202211"
+    assert (
+        PLATFORM_UTIL.get_sonic_build_family("SONiC.202012.133-dirty-20211004.132213") == "202012"
+    )
+    # the date and time of a master build are not a release
+    assert PLATFORM_UTIL.get_sonic_build_family("master.10585-dirty-20220513.183423") == ""
+    assert PLATFORM_UTIL.get_sonic_build_family("SONiC.master.183423-4e4d5f6") == ""
+    assert PLATFORM_UTIL.get_sonic_build_family(None) == ""
+
+
+def test_build_profile__eos():
+    """Test EOS syntax change is gated by the version."""
+    assert PLATFORM_UTIL.build_profile("eos", version=(4, 21)).eos_before_4_22 is True
+    assert PLATFORM_UTIL.build_profile("eos", version=(4, 22)).eos_before_4_22 is False
+    assert PLATFORM_UTIL.build_profile("sonic").eos_before_4_22 is False
+
+
+def test_build_profile__sonic():
+    """Test FRR features are gated by the SONiC build and pillar flag."""
+    profile = PLATFORM_UTIL.build_profile("sonic", sonic_build_version="SONiC.201911.451")
+    assert profile.timer_delayopen_supported is False
+    assert profile.frr_8_2_2_workaround is False
+
+    profile = PLATFORM_UTIL.build_profile(
+        "sonic", sonic_build_version="SONiC.202205.12", frr822_workaround_flag="True"
+    )
+    assert profile.timer_delayopen_supported is True
+    assert profile.frr_8_2_2_workaround is True
+
+    profile = PLATFORM_UTIL.build_profile(
+        "sonic", sonic_build_version="SONiC.202205.12", frr822_workaround_flag="False"
+    )
+    assert profile.frr_8_2_2_workaround is False
+
+
+def test_build_profile__immutable():
+    """Test the profile cannot be modified once built."""
+    profile = PLATFORM_UTIL.build_profile("junos", default_vrf="prod")
+
+    assert profile.default_vrf == "prod"
+    with pytest.raises(AttributeError):
+        profile.nos = "eos"
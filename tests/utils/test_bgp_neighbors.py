@@ -0,0 +1,197 @@
+"""Unit tests of bgp_neighbors utils."""
+
+import json
+import pickle
+from ipaddress import ip_network
+
+import pytest
+import salt.payload
+
+import _utils.bgp_neighbors as NEIGHBORS_UTIL
+
+NEIGHBORS = [
+    {"remote_address": "192.0.2.1+58771", "state": "up"},
+    {"remote_address": "2001:DB8:0::1", "state": "down"},
+    {"remote_address": "Ethernet0", "state": "up"},
+]
+
+
+def test_get_address_key():
+    """Test the different text forms of an address have the same key."""
+    key = NEIGHBORS_UTIL.get_address_key("2001:db8::1")
+
+    assert key == NEIGHBORS_UTIL.get_address_key("2001:DB8:0:0::1")
+    assert key == NEIGHBORS_UTIL.get_address_key("2001:db8::1%eth0")
+    assert NEIGHBORS_UTIL.get_address_afi(key) == 6
+    assert NEIGHBORS_UTIL.get_address_key("192.0.2.1+179") == bytes([192, 0, 2, 1])
+    assert NEIGHBORS_UTIL.get_address_key("Ethernet0") == "Ethernet0"
+    assert NEIGHBORS_UTIL.get_address_afi("Ethernet0") is None
+
+
+def test_neighbor_index__lookups():
+    """Test neighbors are found with any text form of their address."""
+    index = NEIGHBORS_UTIL.build_index(NEIGHBORS)
+
+    assert index["192.0.2.1"] is NEIGHBORS[0]
+    assert index.get("2001:db8::1") is NEIGHBORS[1]
+    assert "Ethernet0" in index
+    assert "192.0.2.2" not in index
+    assert index.get("192.0.2.2", {}) == {}
+    assert index.afis == {4: [NEIGHBORS[0]], 6: [NEIGHBORS[1]], None: [NEIGHBORS[2]]}
+
+    # still a dict keyed by the addresses from the device
+    assert index == {neighbor["remote_address"]: neighbor for neighbor in NEIGHBORS}
+    assert list(index) == [neighbor["remote_address"] for neighbor in NEIGHBORS]
+
+
+def test_neighbor_index__duplicates():
+    """Test the last neighbor is kept when an address is set twice."""
+    neighbors = [{"neighbor-address": "2001:db8::1"}, {"neighbor-address": "2001:DB8::1"}]
+    index = NEIGHBORS_UTIL.build_index(neighbors, "neighbor-address")
+
+    assert index["2001:db8:0::1"] is neighbors[1]
+    assert index.afis[6] == [neighbors[1]]
+    assert len(index) == 1
+    assert list(index) == ["2001:DB8::1"]
+
+
+def test_neighbor_index__mapping_operations():
+    """Test all the mapping operations match any text form of the addresses."""
+    index = NEIGHBORS_UTIL.build_index(NEIGHBORS)
+    neighbor = {"remote_address": "2001:db8::1", "state": "up"}
+
+    index.update({"2001:db8::1": neighbor})
+    assert len(index) == 3
+    assert index["2001:DB8:0::1"] is neighbor
+    assert index.afis[6] == [neighbor]
+
+    assert index.setdefault("192.0.2.1", {}) is NEIGHBORS[0]
+    assert index.pop("192.0.2.1+179") is NEIGHBORS[0]
+    assert "192.0.2.1" not in index
+    assert not index.afis[4]
+
+    del index["Ethernet0"]
+    assert index == {"2001:db8::1": neighbor}
+    with pytest.raises(KeyError):
+        del index["2001:db8::2"]
+
+    # serialized as a dict keyed by the addresses as set
+    assert salt.payload.loads(salt.payload.dumps({"result": index})) == {
+        "result": {"2001:db8::1": neighbor}
+    }
+
+
+def test_neighbor_index__pickle():
+    """Test the index is rebuilt when pickled, for the rendering workers."""
+    index = pickle.loads(pickle.dumps(NEIGHBORS_UTIL.build_index(NEIGHBORS)))
+
+    assert isinstance(index, NEIGHBORS_UTIL.NeighborIndex)
+    assert index["192.0.2.1"] == NEIGHBORS[0]
+    assert index.afis[6] == [NEIGHBORS[1]]
+
+
+def test_filter_in_network():
+    """Test neighbors are filtered by network, whatever the text form of their address."""
+    neighbors = NEIGHBORS + [
+        {"remote_address": "192.0.2.2", "state": "up"},
+        {"remote_address": "2001:db8::1:1", "state": "up"},
+    ]
+
+    assert NEIGHBORS_UTIL.filter_in_network(neighbors, ip_network("192.0.2.0/31")) == [NEIGHBORS[0]]
+    assert NEIGHBORS_UTIL.filter_in_network(neighbors, ip_network("2001:db8::/112")) == [
+        NEIGHBORS[1]
+    ]
+    assert NEIGHBORS_UTIL.filter_in_network(neighbors, ip_network("0.0.0.0/0")) == [
+        NEIGHBORS[0],
+        neighbors[3],
+    ]
+    assert NEIGHBORS_UTIL.filter_in_network(neighbors, None) == neighbors
+
+
+def test_neighbor_record():
+    """Test compact records are used like the dict neighbors they are built from."""
+    neighbor = {
+        "remote_as": 65001,
+        "local_as": 65000,
+        "remote_address": "192.0.2.1",
+        "vrf": "default",
+        "export_policy": "RM-LAN-OUT",
+        "import_policy": "RM-LAN-IN",
+        "peer_group": "PG-TOR",
+        "description": "to:tor",
+        "state": "up",
+    }
+    record = NEIGHBORS_UTIL.make_record(**neighbor, unknown="ignored")
+
+    assert record == neighbor
+    assert record["state"] == "up"
+    assert record.get("unknown") is None
+    assert NEIGHBORS_UTIL.make_record(remote_address="192.0.2.2")["peer_group"] is None
+    assert not hasattr(record, "__dict__")
+
+    # strings are shared by the records
+    other = NEIGHBORS_UTIL.make_record(**{**neighbor, "vrf": "".join(["def", "ault"])})
+    assert other["vrf"] is record["vrf"]
+
+    record["state"] = "down"
+    assert record.state == "down"
+    with pytest.raises(KeyError):
+        record["unknown"] = 1
+
+    assert salt.payload.loads(salt.payload.dumps({"result": [record]})) == {
+        "result": [{**neighbor, "state": "down"}]
+    }
+
+
+def test_make_neighbor():
+    """Test neighbor dicts have the fields of the records, with shared strings."""
+    neighbor = NEIGHBORS_UTIL.make_neighbor(
+        remote_address="192.0.2.1", vrf="".join(["def", "ault"]), unknown="ignored"
+    )
+
+    assert type(neighbor) is dict  # pylint: disable=C0123
+    assert list(neighbor) == list(NEIGHBORS_UTIL.NEIGHBOR_FIELDS)
+    assert neighbor["state"] is None
+    assert neighbor["vrf"] is NEIGHBORS_UTIL.make_record(vrf="default")["vrf"]
+    assert json.loads(json.dumps(neighbor)) == neighbor
+    assert NEIGHBORS_UTIL.make_record(**neighbor) == neighbor
+
+
+def test_prefix_trie__match():
+    """Test all the networks containing an address are matched, shortest prefix first."""
+    networks = [
+        ip_network("192.0.2.0/31"),
+        ip_network("192.0.2.0/24"),
+        ip_network("0.0.0.0/0"),
+        ip_network("2001:db8::/127"),
+        ip_network("192.0.2.1/32"),
+    ]
+    trie = NEIGHBORS_UTIL.PrefixTrie(networks)
+
+    assert trie.match("192.0.2.1+58771") == [
+        ip_network("0.0.0.0/0"),
+        ip_network("192.0.2.0/24"),
+        ip_network("192.0.2.0/31"),
+        ip_network("192.0.2.1/32"),
+    ]
+    assert trie.match("198.51.100.1") == [ip_network("0.0.0.0/0")]
+    assert trie.match("2001:DB8:0::1") == [ip_network("2001:db8::/127")]
+    assert trie.match("2001:db8::2") == []
+    assert trie.match("Ethernet0") == []
+
+
+def test_group_by_network():
+    """Test neighbors are grouped like a membership test on each network."""
+    networks = [ip_network("192.0.2.{}/31".format(index)) for index in range(0, 256, 2)]
+    networks += [ip_network("192.0.2.0/30"), ip_network("2001:db8::/127")]
+    neighbors = NEIGHBORS + [
+        {"remote_address": "192.0.2.{}".format(index), "state": "up"} for index in range(200)
+    ]
+
+    groups = NEIGHBORS_UTIL.group_by_network(neighbors, networks)
+
+    assert list(groups) == networks
+    for network in networks:
+        assert groups[network] == NEIGHBORS_UTIL.filter_in_network(neighbors, network)
+    assert len(groups[ip_network("192.0.2.0/30")]) == 5
+    assert groups[ip_network("192.0.2.254/31")] == []
@@ -0,0 +1,252 @@
+"""Unit tests of bgp_safeguards utils."""
+
+import random
+
+import _utils.bgp_neighbors as NEIGHBORS_UTIL
+import _utils.bgp_safeguards as SAFEGUARDS_UTIL
+
+RULES = [
+    {
+        "field": "peer_group",
+        "contains": "PG-TOR",
+        "minimum_up": 2,
+        "remove_down_only": True,
+    },
+    {
+        "field": "description",
+        "contains": "server",
+        "minimum_up": 1,
+        "remove_down_only": False,
+    },
+]
+
+
+def _random_installed_neighbors(seed, nb_neighbors):
+    rand = random.Random(seed)
+    neighbors = []
+    for index in range(nb_neighbors):
+        if rand.random() < 0.5:
+            address = "192.0.2.{}".format(index)
+        else:
+            address = "2001:db8::{:x}".format(index)
+        neighbors.append(
+            {
+                "remote_address": address,
+                "state": rand.choice(["up", "up", "down"]),
+                "peer_group": rand.choice(["PG-TOR", "PG-SPINE", ""]),
+                "description": rand.choice(["to:server{}".format(index), "to:tor", "to:spine"]),
+            }
+        )
+
+    return neighbors
+
+
+def _is_safe_to_remove(rule, installed, index, removed=()):
+    safeguards = SAFEGUARDS_UTIL.RemovalSafeguards([rule], installed, NEIGHBORS_UTIL.get_afi)
+    for removed_index in removed:
+        safeguards.remove(removed_index)
+
+    return safeguards.is_safe_to_remove(index)
+
+
+def test_removal_safeguards__not_concerned():
+    """Test neighbors not matching the rule can be removed."""
+    rule = {"field": "peer_group", "contains": "PG-TOR", "minimum_up": 2, "remove_down_only": False}
+    installed = [{"state": "up", "peer_group": "PG-SPINE", "remote_address": "192.0.2.1"}]
+
+    assert _is_safe_to_remove(rule, installed, 0) is True
+
+
+def test_removal_safeguards__remove_down_only():
+    """Test only down neighbors can be removed when removing down neighbors only."""
+    rule = {"field": "peer_group", "contains": "PG-TOR", "minimum_up": 0, "remove_down_only": True}
+    installed = [
+        {"state": "down", "peer_group": "PG-TOR", "remote_address": "192.0.2.1"},
+        {"state": "up", "peer_group": "PG-TOR", "remote_address": "192.0.2.2"},
+    ]
+
+    assert _is_safe_to_remove(rule, installed, 0) is True
+    assert _is_safe_to_remove(rule, installed, 1) is False
+
+
+def test_removal_safeguards__peer_group__minimum_up():
+    """Test the up neighbors matching the peer-group must remain, at least minimum_up."""
+    installed = [
+        {"state": "down", "peer_group": "PG-TOR", "remote_address": "192.0.2.1"},
+        {"state": "up", "peer_group": "PG-TOR", "remote_address": "192.0.2.5"},
+        {"state": "up", "peer_group": "PG-SPINE", "remote_address": "192.0.2.7"},
+    ]
+
+    for minimum_up, expected in [(2, False), (1, True), (0, True)]:
+        rule = {
+            "field": "peer_group",
+            "contains": "PG-TOR",
+            "minimum_up": minimum_up,
+            "remove_down_only": True,
+        }
+        assert _is_safe_to_remove(rule, installed, 0) is expected
+
+
+def test_removal_safeguards__peer_group__one_already_removed():
+    """Test the removals already accepted are not counted as remaining up neighbors."""
+    rule = {"field": "peer_group", "contains": "PG-TOR", "minimum_up": 1, "remove_down_only": False}
+    installed = [
+        {"state": "up", "peer_group": "PG-TOR", "remote_address": "192.0.2.1"},
+        {"state": "up", "peer_group": "PG-TOR", "remote_address": "192.0.2.5"},
+        {"state": "up", "peer_group": "PG-SPINE", "remote_address": "192.0.2.7"},
+    ]
+
+    assert _is_safe_to_remove(rule, installed, 0) is True
+    assert _is_safe_to_remove(rule, installed, 0, removed=[1]) is False
+
+
+def test_removal_safeguards__description__minimum_up():
+    """Test the up neighbors matching the description must remain, at least minimum_up."""
+    installed = [
+        {"state": "down", "remote_address": "192.0.2.1", "description": "to:server1"},
+        {"state": "up", "remote_address": "192.0.2.5", "description": "to:server1"},
+        {"state": "up", "remote_address": "192.0.2.7", "description": "to:management"},
+    ]
+
+    for minimum_up, expected in [(2, False), (0, True)]:
+        rule = {
+            "field": "description",
+            "contains": "server",
+            "minimum_up": minimum_up,
+            "remove_down_only": True,
+        }
+        assert _is_safe_to_remove(rule, installed, 0) is expected
+
+
+def test_removal_safeguards__per_afi():
+    """Test only the up neighbors of the same AFI are counted."""
+    rule = {"field": "peer_group", "contains": "PG-TOR", "minimum_up": 1}
+    installed = [
+        {"state": "up", "peer_group": "PG-TOR", "remote_address": "192.0.2.1"},
+        {"state": "up", "peer_group": "PG-TOR", "remote_address": "2001:db8::1"},
+        {"state": "up", "peer_group": "PG-TOR", "remote_address": "2001:db8::2"},
+    ]
+
+    assert _is_safe_to_remove(rule, installed, 0) is False
+    assert _is_safe_to_remove(rule, installed, 1) is True
+    assert _is_safe_to_remove(rule, installed, 1, removed=[2]) is False
+
+
+def test_removal_safeguards__blocking_rule():
+    """Test a neighbor is held back by the first rule it does not respect."""
+    installed = [
+        {
+            "state": "down",
+            "peer_group": "PG-TOR",
+            "description": "to:server1",
+            "remote_address": "192.0.2.1",
+        },
+        {"state": "up", "peer_group": "PG-TOR", "description": "", "remote_address": "192.0.2.2"},
+        {"state": "up", "peer_group": "PG-TOR", "description": "", "remote_address": "192.0.2.3"},
+    ]
+    safeguards = SAFEGUARDS_UTIL.RemovalSafeguards(RULES, installed, NEIGHBORS_UTIL.get_afi)
+
+    # enough PG-TOR neighbors up, but no other server neighbor up
+    assert safeguards.get_blocking_rule(0) == RULES[1]
+    assert safeguards.get_blocking_rule(1) == RULES[0]
+    assert safeguards.get_nb_matching_rules(0) == 2
+    assert SAFEGUARDS_UTIL.RemovalSafeguards(None, installed, None).is_safe_to_remove(1)
+
+
+def test_plan_removals__safe_and_maximal():
+    """Test planned removals respect the rules, and no neighbor held back could be added."""
+    for seed in range(20):
+        installed = _random_installed_neighbors(seed, 60)
+        wanted = {
+            neighbor["remote_address"] for neighbor in random.Random(seed).sample(installed, 20)
+        }
+
+        plan = SAFEGUARDS_UTIL.plan_removals(installed, wanted, RULES, NEIGHBORS_UTIL.get_afi)
+        assert len(plan.to_remove) + len(plan.held_back) == 40
+
+        # removals are safe when done one after another, down neighbors first
+        safeguards = SAFEGUARDS_UTIL.RemovalSafeguards(RULES, installed, NEIGHBORS_UTIL.get_afi)
+        removed = [
+            index
+            for state in ["down", "up"]
+            for index, neighbor in enumerate(installed)
+            if neighbor["state"] == state
+            and any(neighbor is removed_neighbor for removed_neighbor in plan.to_remove)
+        ]
+        for index in removed:
+            assert safeguards.is_safe_to_remove(index)
+            safeguards.remove(index)
+
+        for neighbor, rule in plan.held_back:
+            index = next(index for index, other in enumerate(installed) if other is neighbor)
+            assert safeguards.get_blocking_rule(index) == rule
+
+
+def test_plan_removals__order_independent():
+    """Test the plan does not depend on the order of the neighbors on the device."""
+    installed = _random_installed_neighbors(0, 60)
+    wanted = {neighbor["remote_address"] for neighbor in installed[:20]}
+    plan = SAFEGUARDS_UTIL.plan_removals(installed, wanted, RULES, NEIGHBORS_UTIL.get_afi)
+
+    shuffled = list(installed)
+    random.Random(1).shuffle(shuffled)
+    shuffled_plan = SAFEGUARDS_UTIL.plan_removals(shuffled, wanted, RULES, NEIGHBORS_UTIL.get_afi)
+
+    assert sorted(map(id, shuffled_plan.to_remove)) == sorted(map(id, plan.to_remove))
+    # removals are still generated in the order of the device
+    assert shuffled_plan.to_remove == [
+        neighbor for neighbor in shuffled if any(neighbor is n for n in plan.to_remove)
+    ]
+
+
+def test_plan_removals__overlapping_rules():
+    """Test neighbors concerned by several rules do not prevent more removals."""
+    rules = [
+        {"field": "peer_group", "contains": "PG-TOR", "minimum_up": 2},
+        {"field": "description", "contains": "server", "minimum_up": 2},
+    ]
+    installed = [
+        {
+            "remote_address": "192.0.2.1",
+            "state": "up",
+            "peer_group": "PG-TOR",
+            "description": "server",
+        },
+        {"remote_address": "192.0.2.2", "state": "up", "peer_group": "PG-TOR", "description": ""},
+        {"remote_address": "192.0.2.3", "state": "up", "peer_group": "", "description": "server"},
+        {"remote_address": "192.0.2.4", "state": "up", "peer_group": "PG-TOR", "description": ""},
+        {"remote_address": "192.0.2.5", "state": "up", "peer_group": "", "description": "server"},
+    ]
+
+    plan = SAFEGUARDS_UTIL.plan_removals(
+        installed, {"192.0.2.4", "192.0.2.5"}, rules, NEIGHBORS_UTIL.get_afi
+    )
+
+    assert plan.to_remove == installed[1:3]
+    assert plan.held_back == [(installed[0], rules[0])]
+
+
+def test_plan_removals__no_rules():
+    """Test all unwanted neighbors are removed without rules."""
+    installed = _random_installed_neighbors(0, 10)
+
+    plan = SAFEGUARDS_UTIL.plan_removals(installed, set(), None, NEIGHBORS_UTIL.get_afi)
+    assert plan.to_remove == installed
+    assert plan.held_back == []
+
+
+def test_plan_removals__unnumbered_neighbors():
+    """Test unnumbered neighbors are counted apart from the IPv4 and IPv6 ones."""
+    rules = [{"field": "peer_group", "contains": "PG-SERVER", "minimum_up": 1}]
+    installed = [
+        {"remote_address": "Ethernet0", "state": "up", "peer_group": "PG-SERVER"},
+        {"remote_address": "Ethernet4", "state": "up", "peer_group": "PG-SERVER"},
+        {"remote_address": "192.0.2.1", "state": "up", "peer_group": "PG-SERVER"},
+        {"remote_address": "Ethernet8", "state": "down", "peer_group": "PG-SERVER"},
+    ]
+
+    plan = SAFEGUARDS_UTIL.plan_removals(installed, {"192.0.2.1"}, rules, NEIGHBORS_UTIL.get_afi)
+
+    # one unnumbered neighbor up must remain, the IPv4 one does not count
+    assert plan.to_remove == [installed[0], installed[3]]
+    assert plan.held_back == [(installed[1], rules[0])]
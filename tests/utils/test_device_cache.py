@@ -0,0 +1,93 @@
+"""Unit tests of device_cache utils."""
+
+import _utils.device_cache as CACHE_UTIL
+
+
+def test_call__cached_per_arguments(mocker):
+    """Test results are cached per function and arguments."""
+    context = {}
+    get_global_as = mocker.Mock(side_effect=lambda vrf: {"default": 65000}.get(vrf))
+
+    for _ in range(3):
+        assert (
+            CACHE_UTIL.call(context, "get_global_as", get_global_as, ttl=300, vrf="default")
+            == 65000
+        )
+    assert CACHE_UTIL.call(context, "get_global_as", get_global_as, ttl=300, vrf="prod") is None
+    assert CACHE_UTIL.call(context, "other", get_global_as, ttl=300, vrf="default") == 65000
+
+    assert get_global_as.call_args_list == [
+        mocker.call(vrf="default"),
+        mocker.call(vrf="prod"),
+        mocker.call(vrf="default"),
+    ]
+
+
+def test_call__expired(mocker):
+    """Test results are requested again once expired, or always without TTL (default)."""
+    context = {}
+    func = mocker.Mock(return_value=[])
+    monotonic = mocker.patch("_utils.device_cache.time.monotonic", return_value=100.0)
+
+    CACHE_UTIL.call(context, "func", func, ttl=10)
+    monotonic.return_value = 109.0
+    CACHE_UTIL.call(context, "func", func, ttl=10)
+    assert func.call_count == 1
+
+    monotonic.return_value = 111.0
+    CACHE_UTIL.call(context, "func", func, ttl=10)
+    assert func.call_count == 2
+
+    CACHE_UTIL.call(context, "func", func, ttl=0)
+    assert func.call_count == 3
+    CACHE_UTIL.call(context, "func", func)
+    assert func.call_count == 4
+
+
+def test_invalidate(mocker):
+    """Test results are dropped per function, or all of them."""
+    context = {}
+    func = mocker.Mock(return_value=[])
+
+    CACHE_UTIL.call(context, "first", func, ttl=300)
+    CACHE_UTIL.call(context, "second", func, ttl=300)
+    CACHE_UTIL.invalidate(context, "first")
+    CACHE_UTIL.call(context, "first", func, ttl=300)
+    CACHE_UTIL.call(context, "second", func, ttl=300)
+    assert func.call_count == 3
+
+    CACHE_UTIL.invalidate(context)
+    CACHE_UTIL.call(context, "first", func, ttl=300)
+    CACHE_UTIL.call(context, "second", func, ttl=300)
+    assert func.call_count == 5
+
+
+def test_get_device_data(mocker):
+    """Test data is requested with the TTL of the minion config, or read from the snapshot."""
+    context = {}
+    functions = {"criteo_bgp.get_global_as": mocker.Mock(return_value=65000)}
+    utils = {
+        "device_snapshot.get_replayed": lambda context: context.get("replayed"),
+        "device_snapshot.get_result": lambda snapshot, function, **kwargs: snapshot[function],
+    }
+
+    for _ in range(2):
+        assert (
+            CACHE_UTIL.get_device_data(
+                context, {}, functions, utils, "criteo_bgp.get_global_as", vrf="default"
+            )
+            == 65000
+        )
+    assert functions["criteo_bgp.get_global_as"].call_count == 2
+
+    opts = {"afk_device_cache_ttl": 60}
+    for _ in range(2):
+        CACHE_UTIL.get_device_data(context, opts, functions, utils, "criteo_bgp.get_global_as")
+    assert functions["criteo_bgp.get_global_as"].call_count == 3
+
+    context["replayed"] = {"criteo_bgp.get_global_as": 65001}
+    assert (
+        CACHE_UTIL.get_device_data(context, opts, functions, utils, "criteo_bgp.get_global_as")
+        == 65001
+    )
+    assert functions["criteo_bgp.get_global_as"].call_count == 3
@@ -0,0 +1,102 @@
+"""Unit tests of device_snapshot utils."""
+
+import pytest
+from salt.exceptions import CommandExecutionError
+
+import _utils.bgp_neighbors as NEIGHBORS_UTIL
+import _utils.device_snapshot as SNAPSHOT_UTIL
+
+READS = [
+    ("criteo_bgp.get_global_as", {"vrf": "default"}, 65000),
+    (
+        "criteo_bgp.get_neighbors",
+        {"compact": True},
+        {"result": [NEIGHBORS_UTIL.make_neighbor(remote_address="192.0.2.0", state="up")]},
+    ),
+]
+
+
+@pytest.mark.parametrize("file_name", ["tor1.json", "tor1.msgpack"])
+def test_write_load(tmp_path, file_name):
+    """Test the results are read again from the snapshot, in both formats."""
+    path = str(tmp_path / file_name)
+    summary = SNAPSHOT_UTIL.write(path, {"nos": "eos"}, READS)
+    assert summary["format"] == file_name.rsplit(".", 1)[1]
+
+    snapshot = SNAPSHOT_UTIL.load(path)
+
+    assert snapshot["grains"] == {"nos": "eos"}
+    assert SNAPSHOT_UTIL.get_result(snapshot, "criteo_bgp.get_global_as", vrf="default") == 65000
+    neighbors = SNAPSHOT_UTIL.get_result(snapshot, "criteo_bgp.get_neighbors", compact=True)
+    assert neighbors["result"] == READS[1][2]["result"]
+
+    with pytest.raises(CommandExecutionError, match="not in snapshot"):
+        SNAPSHOT_UTIL.get_result(snapshot, "criteo_bgp.get_global_as", vrf="prod")
+
+
+def test_load__unsupported(tmp_path):
+    """Test snapshots of another version or format are refused."""
+    path = tmp_path / "tor1.json"
+    path.write_text('{"version": 0, "reads": []}', encoding="utf-8")
+    with pytest.raises(CommandExecutionError, match="Unsupported snapshot"):
+        SNAPSHOT_UTIL.load(str(path))
+
+    path.write_text("not json", encoding="utf-8")
+    with pytest.raises(CommandExecutionError, match="Unable to load"):
+        SNAPSHOT_UTIL.load(str(path))
+
+    with pytest.raises(CommandExecutionError, match="Unknown snapshot format"):
+        SNAPSHOT_UTIL.load(str(path), fmt="yaml")
+
+
+def test_replay(tmp_path):
+    """Test the snapshot is replayed in the block only."""
+    path = str(tmp_path / "tor1.json")
+    SNAPSHOT_UTIL.write(path, {"nos": "eos"}, READS)
+    context = {}
+
+    with SNAPSHOT_UTIL.replay(context, None) as snapshot:
+        assert snapshot is None
+        assert SNAPSHOT_UTIL.get_replayed(context) is None
+
+    with pytest.raises(ValueError):
+        with SNAPSHOT_UTIL.replay(context, path) as snapshot:
+            assert SNAPSHOT_UTIL.get_replayed(context) is snapshot
+            assert snapshot["path"] == path
+            raise ValueError()
+
+    assert SNAPSHOT_UTIL.get_replayed(context) is None
+
+
+def test_get_grain(tmp_path):
+    """Test the grains are read from the replayed snapshot, from the device otherwise."""
+    path = str(tmp_path / "tor1.json")
+    SNAPSHOT_UTIL.write(path, {"nos": "eos", "version": "4.22.1F"}, READS)
+    functions = {"grains.get": lambda name, default=None: {"os": "Ubuntu"}.get(name, default)}
+    context = {}
+
+    assert SNAPSHOT_UTIL.get_os(context, functions) == "Ubuntu"
+    with SNAPSHOT_UTIL.replay(context, path):
+        assert SNAPSHOT_UTIL.get_os(context, functions) == "eos"
+        assert SNAPSHOT_UTIL.get_grain(context, functions, "version") == "4.22.1F"
+        assert SNAPSHOT_UTIL.get_grain(context, functions, "os", "none") == "none"
+
+
+def test_get_loaded_os(tmp_path):
+    """Test the OS of the states loader is the one of the snapshot set in pillar, if any."""
+    path = str(tmp_path / "tor1.msgpack")
+    SNAPSHOT_UTIL.write(path, {"nos": "sonic"}, READS)
+    pillar = {}
+    functions = {
+        "grains.get": lambda name, default=None: {"os": "Ubuntu"}.get(name, default),
+        "pillar.get": lambda name, default=None: pillar.get(name, default),
+    }
+
+    assert SNAPSHOT_UTIL.get_loaded_os(functions) == "Ubuntu"
+
+    pillar["afk_snapshot"] = path
+    assert SNAPSHOT_UTIL.get_loaded_os(functions) == "sonic"
+
+    # the states are not loaded if the snapshot cannot be read
+    pillar["afk_snapshot"] = str(tmp_path / "missing.msgpack")
+    assert SNAPSHOT_UTIL.get_loaded_os(functions) is None
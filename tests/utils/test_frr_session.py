@@ -0,0 +1,103 @@
+"""Unit tests of frr_session utils, with a stand-in vtysh."""
+
+import sys
+import threading
+import time
+
+import pytest
+from salt.exceptions import CommandExecutionError
+
+import _utils.frr_session as FRR_UTIL
+
+FAKE_VTYSH = (sys.executable, "tests/utils/data/fake_vtysh.py")
+
+
+@pytest.fixture(name="session")
+def fixture_session():
+    """FRR session of the stand-in vtysh, closed after the test."""
+    session = FRR_UTIL.get_session(FAKE_VTYSH)
+    yield session
+    FRR_UTIL.close_sessions()
+    FRR_UTIL._get_process_store().sessions.clear()
+
+
+def test_run_json_commands__pipelined(session):
+    """Test commands are pipelined on one vtysh, kept open between calls."""
+    results = FRR_UTIL.run_json_commands(
+        "show bgp json", "show bgp summary json", command=FAKE_VTYSH
+    )
+    assert results == [
+        {"routerId": "192.0.2.254", "localAS": 65000},
+        {"ipv4Unicast": {"as": 65000, "peerCount": 2}},
+    ]
+
+    assert FRR_UTIL.run_json_commands("show bgp json", command=FAKE_VTYSH)[0]["localAS"] == 65000
+    assert FRR_UTIL.get_session(FAKE_VTYSH) is session
+    assert session.nb_starts == 1
+
+
+def test_run_commands__text_output(session):  # pylint: disable=W0613
+    """Test text outputs are split per command, errors included."""
+    outputs = FRR_UTIL.run_commands("clear bgp * soft", "show nothing", command=FAKE_VTYSH)
+
+    assert outputs == [
+        "sonic# clear bgp * soft\n",
+        "sonic# show nothing\n% Unknown command: show nothing\n",
+    ]
+    with pytest.raises(CommandExecutionError):
+        FRR_UTIL.parse_json_output(outputs[1])
+
+
+def test_run_commands__restarted(session):
+    """Test vtysh is started again when it exited (FRR restart)."""
+    pid = session.run_commands("show pid")[0]
+    session._process.kill()
+    session._process.wait()
+
+    assert session.run_commands("show pid")[0] != pid
+    assert session.nb_starts == 2
+
+
+def test_run_commands__failed(session):
+    """Test commands are tried once more on a new vtysh, then an error is raised."""
+    with pytest.raises(CommandExecutionError):
+        session.run_commands("exit")
+    assert session.nb_starts == 2
+
+
+def test_run_commands__timeout(session):
+    """Test vtysh not answering in time is killed, and started again by the next commands."""
+    pid = session.run_commands("show pid")[0]
+    process = session._process
+
+    start = time.monotonic()
+    with pytest.raises(CommandExecutionError, match="timed out"):
+        session.run_commands("sleep 30", timeout=0.5)
+    assert time.monotonic() - start < 10
+    assert process.poll() is not None
+
+    assert session.run_commands("show pid")[0] != pid
+    assert session.nb_starts == 2
+
+
+def test_run_commands__threads(session):
+    """Test the batches of concurrent threads are not interleaved on the session."""
+    results = []
+
+    def run():
+        for _ in range(20):
+            results.append(
+                FRR_UTIL.run_json_commands(
+                    "show bgp json", "show bgp summary json", command=FAKE_VTYSH
+                )
+            )
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 80
+    assert all(result[0]["localAS"] == 65000 and "ipv4Unicast" in result[1] for result in results)
+    assert session.nb_starts == 1
@@ -0,0 +1,315 @@
+"""Unit tests of jinja_render utils."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from jinja2 import Environment
+from jinja2.exceptions import UndefinedError
+
+import _utils.jinja_render as RENDER_UTIL
+
+TEMPLATE_NAME = "salt://states/afk/templates/bgp/eos/test.j2"
+
+
+@pytest.fixture(autouse=True)
+def _clean_cache():
+    RENDER_UTIL.clear_cache()
+    yield
+    RENDER_UTIL.clear_cache()
+
+
+def test_render__compiled_once():
+    """Test the template is compiled only once for the same source."""
+    for asn in range(3):
+        assert RENDER_UTIL.render(TEMPLATE_NAME, "router bgp {{ asn }}", {"asn": asn}) == (
+            "router bgp {}".format(asn)
+        )
+
+    assert RENDER_UTIL.cache_stats() == {"hits": 2, "misses": 1, "size": 1}
+
+
+def test_render__source_changed():
+    """Test the template is compiled again when the source on the fileserver changed."""
+    assert RENDER_UTIL.render(TEMPLATE_NAME, "router bgp {{ asn }}", {"asn": 1}) == "router bgp 1"
+    assert RENDER_UTIL.render(TEMPLATE_NAME, "no router bgp {{ asn }}", {"asn": 1}) == (
+        "no router bgp 1"
+    )
+
+    assert RENDER_UTIL.cache_stats() == {"hits": 0, "misses": 2, "size": 1}
+
+
+def test_render__per_saltenv():
+    """Test templates are cached per salt environment."""
+    RENDER_UTIL.render(TEMPLATE_NAME, "router bgp {{ asn }}", {"asn": 1}, saltenv="base")
+    RENDER_UTIL.render(TEMPLATE_NAME, "router bgp {{ asn }}", {"asn": 1}, saltenv="dev")
+
+    assert RENDER_UTIL.cache_stats() == {"hits": 0, "misses": 2, "size": 2}
+
+
+def test_render__strict_undefined():
+    """Test undefined variables raise, like with the salt renderer."""
+    with pytest.raises(UndefinedError):
+        RENDER_UTIL.render(TEMPLATE_NAME, "router bgp {{ asn }}", {})
+
+
+def test_load_directory(tmp_path):
+    """Test sources are loaded from the minion file cache and replaced on next load."""
+    cached_dir = tmp_path / "files" / "base" / "states" / "afk" / "templates" / "bgp" / "eos"
+    cached_dir.mkdir(parents=True)
+    (cached_dir / "bgp.j2").write_text("router bgp {{ asn }}", encoding="utf-8")
+    (cached_dir / "safi.j2").write_text("address-family ipv4", encoding="utf-8")
+    template_dir = "salt://states/afk/templates/bgp/eos"
+
+    cached_files = [str(cached_dir / "bgp.j2"), str(cached_dir / "safi.j2")]
+    assert RENDER_UTIL.load_directory(template_dir, cached_files) == 2
+    assert RENDER_UTIL.get_source(TEMPLATE_NAME.replace("test", "bgp")) == "router bgp {{ asn }}"
+    assert RENDER_UTIL.get_source(TEMPLATE_NAME.replace("test", "bgp"), saltenv="dev") is None
+
+    # safi.j2 removed from the fileserver
+    assert RENDER_UTIL.load_directory(template_dir, cached_files[:1]) == 1
+    assert RENDER_UTIL.get_source(TEMPLATE_NAME.replace("test", "safi")) is None
+
+
+def test_prefetch_directory(tmp_path, mocker):
+    """Test the directory is cached on the minion, then loaded with the helpers registered."""
+    cached_dir = tmp_path / "files" / "base" / "states" / "afk" / "templates" / "bgp" / "eos"
+    cached_dir.mkdir(parents=True)
+    (cached_dir / "test.j2").write_text("router bgp {{ asn }}", encoding="utf-8")
+    cache_dir = mocker.Mock(return_value=[str(cached_dir / "test.j2")])
+    utils = {
+        "jinja_filters.deep_get": lambda *_: None,
+        "jinja_filters.format_route_policy_name": lambda *_: None,
+    }
+
+    template_dir = "salt://states/afk/templates/bgp/eos"
+    nb_loaded = RENDER_UTIL.prefetch_directory(
+        template_dir, "base", {"cp.cache_dir": cache_dir}, utils
+    )
+
+    assert nb_loaded == 1
+    cache_dir.assert_called_once_with(
+        template_dir, saltenv="base", include_pat=r"E@(\.j2|/compiled/tmpl_\w+\.py)$"
+    )
+    assert RENDER_UTIL.get_source(TEMPLATE_NAME) == "router bgp {{ asn }}"
+    assert RENDER_UTIL.render(TEMPLATE_NAME, "{{ deep_get() }}", {}) == "None"
+
+
+def test_render__blank_lines_and_globals():
+    """Test blank lines are removed and AFK helpers are available without context."""
+    source = (
+        "{% set peer_group = deep_get(neighbor, 'config', 'peer-group') %}\n"
+        "\n"
+        "  \n"
+        "neighbor {{ peer_group }} route-map {{ convert_route_map_name('RM-IN', 'ipv4') }}\n"
+    )
+    neighbor = {"config": {"peer-group": "PG-TOR"}}
+
+    assert RENDER_UTIL.render(TEMPLATE_NAME, source, {"neighbor": neighbor}) == (
+        "neighbor PG-TOR route-map AUTOGENERATED::RM-IN::IPV4"
+    )
+
+
+def test_register_helpers():
+    """Test helpers registered by the states are available in the existing environments too."""
+    assert RENDER_UTIL.render(TEMPLATE_NAME, "{{ 1 }}", {}) == "1"
+
+    RENDER_UTIL.register_helpers({"double": lambda value: 2 * value})
+    assert RENDER_UTIL.render(TEMPLATE_NAME, "{{ double(21) }}", {}) == "42"
+    assert RENDER_UTIL.render(TEMPLATE_NAME, "{{ double(2) }}", {}, saltenv="dev") == "4"
+
+
+def test_render__indent():
+    """Test each line is indented, blank lines being still removed."""
+    source = "neighbor {{ address }}\n\n  description {{ description }}\n"
+
+    assert RENDER_UTIL.render(
+        TEMPLATE_NAME, source, {"address": "192.0.2.1", "description": "spine"}, indent=4
+    ) == ("    neighbor 192.0.2.1\n      description spine")
+
+
+def test_iter_lines():
+    """Test chunks are split in lines, whatever the chunk boundaries."""
+    chunks = ["router ", "bgp 65000\n  ", "  \n    neighbor", " 192.0.2.1", "\n", "\n!"]
+
+    assert list(RENDER_UTIL.iter_lines(chunks)) == [
+        "router bgp 65000",
+        "    neighbor 192.0.2.1",
+        "!",
+    ]
+    assert list(RENDER_UTIL.iter_lines(chunks, indent=2))[0] == "  router bgp 65000"
+
+
+def test_iter_lines__whole_lines_not_copied():
+    """Test a chunk being a whole line is yielded as is."""
+    line = "".join(["neighbor 192.0.2.1 ", "remote-as 65001"])
+
+    assert list(RENDER_UTIL.iter_lines(["\n", line, "\n"]))[0] is line
+
+
+def test_render_lines__streamed():
+    """Test lines of the parts given as iterators are streamed up to the output."""
+    source = (
+        "router bgp 1\n"
+        "{% for part in parts %}\n{% for line in part %}\n{{ line }}\n{% endfor %}\n{% endfor %}"
+    )
+    parts = [
+        RENDER_UTIL.render_lines(
+            "part.j2", "neighbor {{ address }}\n", {"address": address}, indent=3
+        )
+        for address in ["192.0.2.1", "192.0.2.3"]
+    ]
+
+    assert list(RENDER_UTIL.render_lines(TEMPLATE_NAME, source, {"parts": parts})) == [
+        "router bgp 1",
+        "   neighbor 192.0.2.1",
+        "   neighbor 192.0.2.3",
+    ]
+
+
+def test_profile():
+    """Test renders are recorded per template, parts being accounted to their own template."""
+    source = "router bgp 1\n{% for part in parts %}\n{% for line in part %}\n{{ line }}\n{% endfor %}\n{% endfor %}"
+
+    token = RENDER_UTIL.start_profile()
+    with RENDER_UTIL.profile_phase("assembly"):
+        parts = [
+            RENDER_UTIL.render_lines("part.j2", "neighbor {{ address }}", {"address": address})
+            for address in ["192.0.2.1", "192.0.2.3"]
+        ]
+        assert RENDER_UTIL.render(TEMPLATE_NAME, source, {"parts": parts}) == (
+            "router bgp 1\nneighbor 192.0.2.1\nneighbor 192.0.2.3"
+        )
+    recorded = RENDER_UTIL.stop_profile(token)
+
+    assert list(recorded["phases"]) == ["assembly"]
+    layout, part = recorded["templates"][TEMPLATE_NAME], recorded["templates"]["part.j2"]
+    assert (layout["renders"], layout["bytes"]) == (1, 13 + 2 * 19)
+    assert (part["renders"], part["bytes"]) == (2, 2 * 19)
+    assert 0 <= part["max_time"] <= part["total_time"] <= recorded["phases"]["assembly"]
+    assert layout["total_time"] + part["total_time"] <= recorded["phases"]["assembly"]
+
+    # nothing recorded once stopped
+    assert not RENDER_UTIL.is_profiling()
+    RENDER_UTIL.render(TEMPLATE_NAME, "router bgp 1", {})
+    assert recorded["templates"][TEMPLATE_NAME]["renders"] == 1
+
+
+def test_profile__overlapping_runs():
+    """Test runs profiled at the same time, in threads like the jobs, record their own renders."""
+    started, rendered = threading.Barrier(2), threading.Barrier(2)
+
+    def _run(name):
+        started.wait()
+        with RENDER_UTIL.profile_phase(name):
+            RENDER_UTIL.render(name, "neighbor {{ name }}", {"name": name})
+        # both runs are profiled at the same time
+        rendered.wait()
+        return RENDER_UTIL.is_profiling()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = {
+            name: executor.submit(RENDER_UTIL.run_profiled, _run, name)
+            for name in ["tor1.j2", "tor2.j2"]
+        }
+        results = {name: future.result(timeout=10) for name, future in futures.items()}
+
+    for name, (profiling, recorded) in results.items():
+        assert profiling
+        assert list(recorded["templates"]) == [name]
+        assert list(recorded["phases"]) == [name]
+    assert not RENDER_UTIL.is_profiling()
+
+
+def test_render_parallel():
+    """Test parts rendered by worker processes are returned in the parts order."""
+    parts = [
+        RENDER_UTIL.render_lines(TEMPLATE_NAME, "neighbor {{ index }}\n  !", {"index": index})
+        for index in range(20)
+    ]
+
+    assert RENDER_UTIL.render_parallel(parts, workers=3) == [
+        ["neighbor {}".format(index), "  !"] for index in range(20)
+    ]
+
+
+def test_render__include_loaded_template(tmp_path):
+    """Test templates can include other templates loaded in memory."""
+    cached_dir = tmp_path / "states" / "afk" / "templates" / "bgp" / "eos"
+    cached_dir.mkdir(parents=True)
+    (cached_dir / "header.j2").write_text("router bgp {{ asn }}", encoding="utf-8")
+    RENDER_UTIL.load_directory(
+        "salt://states/afk/templates/bgp/eos", [str(cached_dir / "header.j2")]
+    )
+
+    source = '{% include "salt://states/afk/templates/bgp/eos/header.j2" %}\n  !'
+    assert RENDER_UTIL.render(TEMPLATE_NAME, source, {"asn": 65000}) == "router bgp 65000\n  !"
+
+
+def _build_template_dir(file_root, sources):
+    template_dir = file_root / "states" / "afk" / "templates" / "bgp" / "eos"
+    template_dir.mkdir(parents=True)
+    for file_name, source in sources.items():
+        (template_dir / file_name).write_text(source, encoding="utf-8")
+
+    return template_dir
+
+
+def _list_files(template_dir):
+    return sorted(str(path) for path in template_dir.rglob("*") if path.is_file())
+
+
+def test_build_bundles(tmp_path):
+    """Test templates are compiled next to their source, obsolete ones being removed."""
+    template_dir = _build_template_dir(tmp_path, {"bgp.j2": "router bgp {{ asn }}"})
+    (template_dir / "compiled").mkdir()
+    (template_dir / "compiled" / "tmpl_obsolete.py").write_text("", encoding="utf-8")
+
+    assert RENDER_UTIL.build_bundles(str(tmp_path)) == 1
+    assert [path.name for path in (template_dir / "compiled").iterdir()] == [
+        RENDER_UTIL.get_bundle_filename("salt://states/afk/templates/bgp/eos/bgp.j2")
+    ]
+
+
+def test_load_directory__bundle_used(tmp_path, mocker):
+    """Test templates compiled ahead of time are not parsed again by the minion."""
+    template_dir = _build_template_dir(
+        tmp_path, {"bgp.j2": '{% include "salt://states/afk/templates/bgp/eos/as.j2" %}'}
+    )
+    (template_dir / "as.j2").write_text("router bgp {{ asn }}", encoding="utf-8")
+    RENDER_UTIL.build_bundles(str(tmp_path))
+    RENDER_UTIL.load_directory("salt://states/afk/templates/bgp/eos", _list_files(template_dir))
+    compile_source = mocker.spy(Environment, "compile")
+
+    template_name = "salt://states/afk/templates/bgp/eos/bgp.j2"
+    source = RENDER_UTIL.get_source(template_name)
+    assert RENDER_UTIL.render(template_name, source, {"asn": 65000}) == "router bgp 65000"
+    compile_source.assert_not_called()
+
+
+def test_load_directory__bundle_stale(tmp_path, mocker):
+    """Test the source template is used when changed since the bundle was built."""
+    template_dir = _build_template_dir(tmp_path, {"bgp.j2": "router bgp {{ asn }}"})
+    RENDER_UTIL.build_bundles(str(tmp_path))
+    (template_dir / "bgp.j2").write_text("no router bgp {{ asn }}", encoding="utf-8")
+    RENDER_UTIL.load_directory("salt://states/afk/templates/bgp/eos", _list_files(template_dir))
+    compile_source = mocker.spy(Environment, "compile")
+
+    template_name = "salt://states/afk/templates/bgp/eos/bgp.j2"
+    source = RENDER_UTIL.get_source(template_name)
+    assert RENDER_UTIL.render(template_name, source, {"asn": 65000}) == "no router bgp 65000"
+    compile_source.assert_called_once()
+
+
+def test_render__benchmark(benchmark):
+    """Benchmark the render of a fragment with a compiled template."""
+    with open("states/afk/templates/bgp/eos/safi.j2", encoding="utf-8") as fd:
+        source = fd.read()
+    context = {
+        "asset_type": "neighbor",
+        "neighbor": {"address": "192.0.2.1", "peer_group": "PG-TOR"},
+        "safi": {"config": {"enabled": True}},
+    }
+
+    result = benchmark(RENDER_UTIL.render, TEMPLATE_NAME, source, context)
+    assert result.startswith("neighbor 192.0.2.1 activate")